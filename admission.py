@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Admission control for the CPU- and memory-heavy routes.
+
+The development server starts a thread per request. Each one can hold a
+decoded upload, the blur metrics' derivative arrays and several tesseract
+processes, so a burst of traffic used to oversubscribe the CPU and grow
+memory until the process was killed. AdmissionController puts two limits in
+front of the analyses:
+
+  concurrency  a slot per analysis type (blur, face, ocr). A request needs
+               one slot for each analysis it runs.
+  memory       a shared budget in bytes. A request reserves its estimated
+               peak: the decoded image (width x height x 3) times
+               1 + the working-set factor of each analysis it runs.
+  size         optionally, the largest image accepted (max_pixels).
+
+A request waits at most queue_timeout seconds for its slots and memory, and
+at most max_waiting requests wait per analysis type. Past that it is
+rejected at once with Rejected, which the web app turns into 503 with
+Retry-After. That is better than degrading every request already running.
+An image above max_pixels, or whose estimate exceeds the whole budget, can
+never run and is rejected as too large. memory_budget_for() sizes a budget
+so that the largest accepted image always fits on its own:
+
+    budget = memory_budget_for(DEFAULT_MAX_PIXELS, ['blur', 'face', 'ocr'])
+    controller = AdmissionController({'blur': 4, 'face': 2, 'ocr': 2}, memory_budget=budget,
+                                     max_pixels=DEFAULT_MAX_PIXELS)
+    dimensions = image_dimensions(stream)
+    with controller.admit(['blur', 'face'], memory_cost(dimensions, ['blur', 'face']), pixel_count(dimensions)):
+        ...
+
+Image dimensions are read from the PNG, GIF, BMP or JPEG header
+(image_dimensions), so requests are admitted or rejected before anything
+is decoded.
+"""
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+# Uploads are decoded to 8-bit BGR
+DECODED_CHANNELS = 3
+
+# Working set of each analysis in multiples of the decoded image, measured as peak RSS growth
+# from 12 MP up (benchmarks/bench_admission_memory.py): blur ~2.8x with banded derivatives, face
+# ~2.6x with downscaled detection, OCR ~3.7x in process plus up to four tesseract passes at once
+DEFAULT_MEMORY_FACTORS = {'blur': 3, 'face': 3, 'ocr': 10}
+
+# Largest image accepted by default: a 48 MP (8000x6000) camera frame fits
+DEFAULT_MAX_PIXELS = 50_000_000
+
+CONCURRENCY = 'concurrency'
+MEMORY = 'memory'
+TOO_LARGE = 'too_large'
+
+
+class Rejected(Exception):
+    """The request cannot be admitted now (or, for TOO_LARGE, ever)"""
+
+    def __init__(self, message, reason, retry_after=None):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def _jpeg_dimensions(stream):
+    stream.read(2)
+    while True:
+        marker = stream.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        if marker[1] == 0xFF:
+            # Fill byte before the marker
+            stream.seek(-1, 1)
+            continue
+        if marker[1] in (0xD8, 0x01) or 0xD0 <= marker[1] <= 0xD7:
+            # Markers without a length field
+            continue
+        length = stream.read(2)
+        if len(length) < 2:
+            return None
+        length = struct.unpack('>H', length)[0]
+        # Start-of-frame markers (not DHT, JPG or DAC) carry the frame size
+        if 0xC0 <= marker[1] <= 0xCF and marker[1] not in (0xC4, 0xC8, 0xCC):
+            header = stream.read(5)
+            if len(header) < 5:
+                return None
+            height, width = struct.unpack('>HH', header[1:5])
+            return width, height
+        stream.seek(length - 2, 1)
+
+
+def image_dimensions(stream):
+    """(width, height) from a PNG, GIF, BMP or JPEG header, or None; the stream position is restored"""
+    position = stream.tell()
+    try:
+        head = stream.read(26)
+        if head.startswith(b'\x89PNG\r\n\x1a\n') and len(head) >= 24:
+            return struct.unpack('>II', head[16:24])
+        if head[:6] in (b'GIF87a', b'GIF89a'):
+            return struct.unpack('<HH', head[6:10])
+        if head.startswith(b'BM') and len(head) >= 26:
+            width, height = struct.unpack('<ii', head[18:26])
+            return width, abs(height)
+        if head.startswith(b'\xff\xd8'):
+            stream.seek(position)
+            return _jpeg_dimensions(stream)
+        return None
+    except (OSError, struct.error):
+        return None
+    finally:
+        stream.seek(position)
+
+
+def pixel_count(dimensions):
+    """width x height, or None when the size is unknown"""
+    return None if dimensions is None else dimensions[0] * dimensions[1]
+
+
+def memory_cost(dimensions, analyses, factors=DEFAULT_MEMORY_FACTORS, extra_images=0):
+    """Estimated peak bytes of running analyses on one image, or None when the size is unknown"""
+    if dimensions is None:
+        return None
+    decoded = pixel_count(dimensions) * DECODED_CHANNELS
+    return decoded * (1 + extra_images + sum(factors.get(name, 0) for name in analyses))
+
+
+def memory_budget_for(max_pixels, analyses, factors=DEFAULT_MEMORY_FACTORS):
+    """The smallest budget in which one request running analyses on a max_pixels image fits"""
+    return memory_cost((max_pixels, 1), analyses, factors)
+
+
+class AdmissionController:
+    """Per-analysis concurrency slots and a shared memory budget with bounded waiting"""
+
+    def __init__(self, limits, memory_budget=None, queue_timeout=1.0, max_waiting=None, retry_after=2,
+                 max_pixels=None):
+        """
+        limits: concurrent requests per analysis type; other types are not limited
+        memory_budget: bytes shared by all admitted requests (None: unlimited)
+        max_pixels: largest image admitted (None: only bounded by the budget)
+        queue_timeout: seconds a request may wait for slots and memory
+        max_waiting: requests allowed to wait per analysis type (default: its limit)
+        """
+        self.limits = dict(limits)
+        self.memory_budget = memory_budget
+        self.queue_timeout = queue_timeout
+        self.max_waiting = max_waiting
+        self.retry_after = retry_after
+        self.max_pixels = max_pixels
+
+        self._slots = {name: threading.BoundedSemaphore(limit) for name, limit in self.limits.items()}
+        self._lock = threading.Lock()
+        self._memory_released = threading.Condition(self._lock)
+        self._reserved = 0
+        self._running = dict.fromkeys(self.limits, 0)
+        self._waiting = dict.fromkeys(self.limits, 0)
+        self._counters = {'admitted': 0, CONCURRENCY: 0, MEMORY: 0, TOO_LARGE: 0}
+
+    def _reject(self, message, reason):
+        with self._lock:
+            self._counters[reason] += 1
+        raise Rejected(message, reason, None if reason == TOO_LARGE else self.retry_after)
+
+    def _acquire_slot(self, name, deadline):
+        limit = self.limits[name]
+        # A free slot is taken without counting as waiting
+        if self._slots[name].acquire(blocking=False):
+            with self._lock:
+                self._running[name] += 1
+            return
+        max_waiting = limit if self.max_waiting is None else self.max_waiting
+        with self._lock:
+            waiting_full = self._waiting[name] >= max_waiting
+            if not waiting_full:
+                self._waiting[name] += 1
+        if waiting_full:
+            self._reject(f"Too many {name} requests waiting, retry later", CONCURRENCY)
+        try:
+            acquired = self._slots[name].acquire(timeout=max(0.0, deadline - time.monotonic()))
+        finally:
+            with self._lock:
+                self._waiting[name] -= 1
+        if not acquired:
+            self._reject(f"All {limit} {name} slots are busy, retry later", CONCURRENCY)
+        with self._lock:
+            self._running[name] += 1
+
+    def _release_slot(self, name):
+        with self._lock:
+            self._running[name] -= 1
+        self._slots[name].release()
+
+    def _reserve(self, amount, deadline):
+        with self._memory_released:
+            while self._reserved + amount > self.memory_budget:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._memory_released.wait(remaining)
+            else:
+                self._reserved += amount
+                return
+        self._reject("Memory budget exhausted, retry later", MEMORY)
+
+    def _release(self, amount):
+        with self._memory_released:
+            self._reserved -= amount
+            self._memory_released.notify_all()
+
+    @contextmanager
+    def admit(self, analyses, memory_bytes=None, pixels=None):
+        """
+        Hold a slot for each analysis and memory_bytes of the budget while
+        the block runs; raises Rejected when they cannot be had in time, or
+        at once when the image (pixels, if known) is too large.
+        """
+        # A fixed acquisition order, so two requests never wait on each other's slots
+        names = sorted(set(name for name in analyses if name in self._slots))
+        if self.max_pixels is not None and pixels and pixels > self.max_pixels:
+            self._reject(f"Image has {pixels / 1e6:.1f} MP, more than the {self.max_pixels / 1e6:.0f} MP limit",
+                         TOO_LARGE)
+        reserve = 0
+        if self.memory_budget is not None and memory_bytes:
+            if memory_bytes > self.memory_budget:
+                self._reject(f"Image needs ~{memory_bytes // 2**20} MB, more than the whole memory budget",
+                             TOO_LARGE)
+            reserve = memory_bytes
+
+        deadline = time.monotonic() + self.queue_timeout
+        acquired, reserved = [], 0
+        try:
+            for name in names:
+                self._acquire_slot(name, deadline)
+                acquired.append(name)
+            if reserve:
+                self._reserve(reserve, deadline)
+                reserved = reserve
+            with self._lock:
+                self._counters['admitted'] += 1
+            yield
+        finally:
+            if reserved:
+                self._release(reserved)
+            for name in acquired:
+                self._release_slot(name)
+
+    def stats(self):
+        """Slots in use, waiting requests, reserved memory and counters"""
+        with self._lock:
+            return {
+                'analyses': {name: {'limit': limit, 'running': self._running[name], 'waiting': self._waiting[name]}
+                             for name, limit in self.limits.items()},
+                'memory_budget_bytes': self.memory_budget,
+                'max_pixels': self.max_pixels,
+                'memory_reserved_bytes': self._reserved,
+                'admitted': self._counters['admitted'],
+                'rejected': {reason: self._counters[reason] for reason in (CONCURRENCY, MEMORY, TOO_LARGE)},
+            }
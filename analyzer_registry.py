@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Process-wide EnhancedAnalyzer registry with an explicit warm-up phase.
+
+The web app used to build a new EnhancedAnalyzer (and reload the Haar
+cascade from disk) on every request. The registry keeps one analyzer per
+process instead. warm_up() imports the heavy modules (OpenCV, NumPy,
+pytesseract), loads the cascade, runs each analysis once on a tiny
+synthetic image so lazy initialisation happens before the first real
+request, and checks that tesseract and its language data are available
+(loading a resident engine when the OCR backend is tesserocr).
+
+Only this module knows about the heavy imports, so importing the web app
+and answering /health stay cheap while the warm-up runs in the background.
+"""
+import threading
+import time
+
+WARMING_UP = 'warming_up'
+READY = 'ready'
+FAILED = 'failed'
+COLD = 'cold'
+
+# Same names as enhanced_analysis.ANALYSES, available without the heavy imports
+ANALYSES = ('blur', 'face', 'ocr')
+# Same as blur_pyramid.RESOLUTIONS
+BLUR_RESOLUTIONS = ('full', 'auto')
+# Same as face_engine.PRESETS
+FACE_PRESETS = ('fast', 'balanced', 'accurate')
+
+_lock = threading.Lock()
+_analyzer = None
+_analyzer_options = {}
+_state = {'status': COLD, 'warmup_seconds': None, 'error': None, 'components': {}}
+
+
+def configure(**options):
+    """Set the EnhancedAnalyzer constructor options used by warm_up()"""
+    _analyzer_options.update(options)
+
+
+def _warm_up_tesseract(analyzer, components):
+    """Check that the OCR backend and the eng+urd language data are usable"""
+    try:
+        components['tesseract'] = analyzer.ocr_backend.warm_up()
+    except Exception as e:
+        components['tesseract'] = {'available': False, 'backend': analyzer.ocr_backend.name, 'error': str(e)}
+
+
+def warm_up():
+    """Create the process-wide analyzer and exercise every analysis once (idempotent)"""
+    global _analyzer
+    with _lock:
+        if _state['status'] == READY:
+            return _analyzer
+        _state['status'] = WARMING_UP
+        started = time.perf_counter()
+        try:
+            import cv2
+            import numpy as np
+            from blur_metrics import BlurFeatures, run_blur_metrics
+            from enhanced_analysis import EnhancedAnalyzer
+
+            analyzer = EnhancedAnalyzer(**_analyzer_options)
+            components = {'face_cascade': {'loaded': analyzer.face_engine.loaded}}
+
+            # Run the OpenCV code paths once so their lazy initialisation is paid here
+            sample = np.full((64, 64, 3), (90, 160, 60), np.uint8)
+            cv2.putText(sample, "A1", (8, 40), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 2)
+            gray = cv2.cvtColor(sample, cv2.COLOR_BGR2GRAY)
+            analyzer.face_engine.detect(gray)
+            features = BlurFeatures(gray)
+            run_blur_metrics(features)
+            analyzer._create_blur_map(features)
+            analyzer._extract_black_text(sample)
+
+            _warm_up_tesseract(analyzer, components)
+
+            _analyzer = analyzer
+            _state.update(status=READY, error=None, components=components)
+        except Exception as e:
+            _state.update(status=FAILED, error=str(e))
+            raise
+        finally:
+            _state['warmup_seconds'] = round(time.perf_counter() - started, 3)
+    return _analyzer
+
+
+def start_warm_up():
+    """Run warm_up() on a background thread; readiness is reported by status()"""
+    def run():
+        try:
+            warm_up()
+        except Exception:
+            # Recorded in the state and reported through status()
+            pass
+
+    thread = threading.Thread(target=run, name='analyzer-warm-up', daemon=True)
+    thread.start()
+    return thread
+
+
+def get_analyzer():
+    """The process-wide analyzer, warming it up first if that has not happened yet"""
+    if _analyzer is not None:
+        return _analyzer
+    return warm_up()
+
+
+def is_ready():
+    return _state['status'] == READY
+
+
+def status():
+    """Snapshot of the warm-up state for health checks"""
+    return {
+        'status': _state['status'],
+        'ready': _state['status'] == READY,
+        'warmup_seconds': _state['warmup_seconds'],
+        'error': _state['error'],
+        'components': dict(_state['components']),
+    }
@@ -1,35 +1,384 @@
 import os
-from flask import Flask, render_template, request, jsonify
+import shutil
+from functools import wraps
+from tempfile import NamedTemporaryFile, SpooledTemporaryFile
+from flask import Flask, Request, Response, g, render_template, request, jsonify, send_from_directory
 from werkzeug.utils import secure_filename
-import cv2
-import base64
-from enhanced_analysis import EnhancedAnalyzer
+import time
+import analyzer_registry
+import instrumentation
+from admission import (DEFAULT_MAX_PIXELS, DEFAULT_MEMORY_FACTORS, TOO_LARGE, AdmissionController, Rejected,
+                       image_dimensions, memory_budget_for, memory_cost, pixel_count)
+from job_queue import DEFAULT_WORKERS, JobQueue, MemoryBackend, QueueFull, RedisBackend
+from result_cache import ResultCache, image_digest, make_key
+
+class SpoolingRequest(Request):
+    """Keep uploads in memory, spilling to UPLOAD_FOLDER only above UPLOAD_SPOOL_THRESHOLD"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return SpooledTemporaryFile(max_size=app.config['UPLOAD_SPOOL_THRESHOLD'], mode='rb+',
+                                    dir=app.config['UPLOAD_FOLDER'])
 
 app = Flask(__name__)
+app.request_class = SpoolingRequest
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
-app.config['UPLOAD_FOLDER'] = 'uploads'
+app.config['UPLOAD_FOLDER'] = 'uploads'  # only used for uploads above the spool threshold
+app.config['UPLOAD_SPOOL_THRESHOLD'] = 8 * 1024 * 1024  # bytes kept in memory per upload
 app.config['RESULTS_FOLDER'] = 'results'
+app.config['VISUALIZATION_FOLDER'] = os.path.join(app.config['RESULTS_FOLDER'], 'visualizations')
+app.config['VISUALIZATION_TTL_SECONDS'] = 3600  # stored visualizations (visualize=url) expire after this
+app.config['RESULT_CACHE_ENABLED'] = True  # reuse results for re-submitted images (keyed by pixel content)
+app.config['RESULT_CACHE_MAX_ENTRIES'] = 256
+app.config['RESULT_CACHE_MAX_BYTES'] = 256 * 1024 * 1024
+app.config['RESULT_CACHE_TTL_SECONDS'] = 3600
+app.config['RESULT_CACHE_DISK'] = False  # optional on-disk tier shared by worker processes
+app.config['RESULT_CACHE_DIR'] = os.path.join(app.config['RESULTS_FOLDER'], 'cache')
+app.config['RESULT_CACHE_DISK_MAX_BYTES'] = 1024 * 1024 * 1024
+app.config['OCR_WORKERS'] = 4  # concurrent OCR preprocessing variants
+app.config['OCR_EARLY_EXIT_CONFIDENCE'] = None  # e.g. 85 to stop at the first confident variant
+app.config['OCR_BACKEND'] = 'auto'  # resident tesserocr engines when installed, else 'pytesseract' (a process per pass)
+app.config['BLUR_RESOLUTION'] = 'full'  # exact scores; 'auto' estimates large images on a pyramid level
+app.config['BLUR_BAND_PIXELS'] = 2 * 1024 * 1024  # blur derivatives / map are computed in bands (None: at once)
+app.config['BLUR_WORKERS'] = 1  # threads sharing the bands of one blur request (for very large scans)
+app.config['FACE_PRESET'] = 'balanced'  # face detection speed / recall trade-off: fast, balanced or accurate
+app.config['QUALITY_GATE_ENABLED'] = False  # opt-in: skip OCR / face detection on hopelessly blurry, tiny or dark images
+app.config['QUALITY_GATE_ANALYSES'] = ['ocr', 'face']  # analyses a rejected image skips
+app.config['QUALITY_GATE_MIN_SHARPNESS'] = 1.0  # raw Laplacian metric (variance / 10) on a 640 px grayscale copy
+app.config['QUALITY_GATE_MIN_SIDE'] = 32  # pixels
+app.config['QUALITY_GATE_BRIGHTNESS'] = (15, 245)  # accepted range of the mean grey level
+app.config['WARM_UP_ON_START'] = True  # load the analyzer in the background at import time
+app.config['JOBS_BACKEND'] = 'memory'  # or a redis:// URL to share the job queues between processes / nodes
+app.config['JOB_WORKERS'] = dict(DEFAULT_WORKERS)  # worker threads per analysis type
+app.config['JOB_MAX_QUEUE_DEPTH'] = 100  # waiting jobs per analysis type before /jobs returns 429
+app.config['JOB_RESULT_TTL_SECONDS'] = 3600
+app.config['JOB_PENDING_TTL_SECONDS'] = 86400  # redis: unfinished jobs (e.g. of a crashed worker) expire after this
+app.config['JOB_CALLBACK_TIMEOUT_SECONDS'] = 10
+app.config['JOB_CALLBACK_HOSTS'] = None  # hosts callback_url may name, e.g. ['hooks.example.com', '.example.org']; None: off
+app.config['JOB_CALLBACK_ALLOW_PRIVATE'] = False  # also call back to loopback, private and link-local addresses
+app.config['JOB_RETRY_AFTER_SECONDS'] = 5
+app.config['JOB_WORKERS_ON_START'] = True
+app.config['STREAM_TOP_K'] = 3  # frames of a clip / burst that get the full analysis (/analyze_frames)
+app.config['STREAM_MAX_TOP_K'] = 10
+app.config['STREAM_MAX_FRAMES'] = 1800  # frames scored per clip (a minute at 30 fps)
+app.config['ADMISSION_ENABLED'] = True  # bound concurrent analyses and their memory, rejecting the excess with 503
+app.config['ADMISSION_LIMITS'] = {  # concurrent requests per analysis type
+    'blur': os.cpu_count() or 1,
+    'face': os.cpu_count() or 1,
+    'ocr': max(1, (os.cpu_count() or 1) // app.config['OCR_WORKERS']),  # each runs OCR_WORKERS tesseract passes at once
+}
+app.config['ADMISSION_QUEUE_TIMEOUT_SECONDS'] = 1.0  # wait for a slot / memory before rejecting
+app.config['ADMISSION_MAX_WAITING'] = None  # requests waiting per analysis type (default: its limit)
+app.config['ADMISSION_MAX_PIXELS'] = DEFAULT_MAX_PIXELS  # larger images get 413 (a 48 MP camera frame fits)
+app.config['ADMISSION_MEMORY_BUDGET_BYTES'] = None  # estimated working sets of admitted requests (None: room for
+                                                    # one /analyze of an ADMISSION_MAX_PIXELS image, ~2.5 GB)
+app.config['ADMISSION_MEMORY_FACTORS'] = dict(DEFAULT_MEMORY_FACTORS)  # working set per analysis / decoded image
+app.config['ADMISSION_RETRY_AFTER_SECONDS'] = 2
+app.config['METRICS_ENABLED'] = True  # per-stage timings and request metrics, served at /metrics
+app.config['SERVER_TIMING_HEADER'] = False  # add a Server-Timing header with the stages of each request
 
 # Ensure upload and results directories exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['RESULTS_FOLDER'], exist_ok=True)
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp'}
+VIDEO_EXTENSIONS = {'mp4', 'mov', 'avi', 'mkv', 'webm', 'm4v'}
+
+instrumentation.configure(enabled=app.config['METRICS_ENABLED'])
+
+# One analyzer per worker process, loaded once by the warm-up phase
+analyzer_registry.configure(ocr_workers=app.config['OCR_WORKERS'],
+                            ocr_early_exit_confidence=app.config['OCR_EARLY_EXIT_CONFIDENCE'],
+                            ocr_backend=app.config['OCR_BACKEND'],
+                            blur_resolution=app.config['BLUR_RESOLUTION'],
+                            blur_band_pixels=app.config['BLUR_BAND_PIXELS'],
+                            blur_workers=app.config['BLUR_WORKERS'],
+                            face_preset=app.config['FACE_PRESET'],
+                            quality_gate={
+                                'analyses': app.config['QUALITY_GATE_ANALYSES'],
+                                'min_sharpness': app.config['QUALITY_GATE_MIN_SHARPNESS'],
+                                'min_side': app.config['QUALITY_GATE_MIN_SIDE'],
+                                'min_brightness': app.config['QUALITY_GATE_BRIGHTNESS'][0],
+                                'max_brightness': app.config['QUALITY_GATE_BRIGHTNESS'][1],
+                            } if app.config['QUALITY_GATE_ENABLED'] else None)
+if app.config['WARM_UP_ON_START']:
+    analyzer_registry.start_warm_up()
+
+# Content-hash result cache (None when disabled)
+result_cache = ResultCache(
+    max_entries=app.config['RESULT_CACHE_MAX_ENTRIES'],
+    max_bytes=app.config['RESULT_CACHE_MAX_BYTES'],
+    ttl_seconds=app.config['RESULT_CACHE_TTL_SECONDS'],
+    disk_dir=app.config['RESULT_CACHE_DIR'] if app.config['RESULT_CACHE_DISK'] else None,
+    disk_max_bytes=app.config['RESULT_CACHE_DISK_MAX_BYTES'],
+) if app.config['RESULT_CACHE_ENABLED'] else None
+
+# Per-analysis concurrency limits and a memory budget for the synchronous routes (None when disabled)
+admission_controller = AdmissionController(
+    app.config['ADMISSION_LIMITS'],
+    memory_budget=app.config['ADMISSION_MEMORY_BUDGET_BYTES'] or memory_budget_for(
+        app.config['ADMISSION_MAX_PIXELS'], analyzer_registry.ANALYSES, app.config['ADMISSION_MEMORY_FACTORS']),
+    queue_timeout=app.config['ADMISSION_QUEUE_TIMEOUT_SECONDS'],
+    max_waiting=app.config['ADMISSION_MAX_WAITING'],
+    retry_after=app.config['ADMISSION_RETRY_AFTER_SECONDS'],
+    max_pixels=app.config['ADMISSION_MAX_PIXELS'],
+) if app.config['ADMISSION_ENABLED'] else None
+
+def allowed_file(filename, extensions=ALLOWED_EXTENSIONS):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in extensions
+
+def decode_upload(file):
+    """Decode an uploaded image once, straight from the request stream"""
+    # Imported lazily, see analyzer_registry
+    from enhanced_analysis import load_image
+    payload = file.stream.read()
+    image = load_image(payload)
+    instrumentation.observe_image(image)
+    return image
+
+def encode_image_to_base64(image, output=None):
+    """Convert OpenCV image to base64 string (or stored URL) for display"""
+    if output is None:
+        from visualization import DEFAULT_OPTIONS as output
+    return output.encode(image)
+
+def parse_visualization_options():
+    """
+    Visualization output from the form: visualize (inline/off/url), max_edge,
+    image_format (jpeg/webp/png) and quality. Raises ValueError on bad input.
+    """
+    max_edge = parse_float_field('max_edge')
+    return make_visualization_options(mode=request.form.get('visualize', 'inline').strip().lower() or 'inline',
+                                      max_edge=int(max_edge) if max_edge is not None else None,
+                                      format=request.form.get('image_format', 'jpeg').strip().lower() or 'jpeg',
+                                      quality=parse_float_field('quality'))
+
+def make_visualization_options(mode, max_edge, format, quality):
+    """VisualizationOptions stored under this app's visualization folder (arguments as in cache_params())"""
+    from visualization import VisualizationOptions
+    return VisualizationOptions(mode=mode, max_edge=max_edge, image_format=format, quality=quality,
+                                store_dir=app.config['VISUALIZATION_FOLDER'],
+                                ttl_seconds=app.config['VISUALIZATION_TTL_SECONDS'])
+
+def run_cached(analysis, image, params, output, compute):
+    """Run compute() through the result cache; returns (results, 'HIT' / 'MISS' / None)"""
+    if result_cache is None or not output.cacheable:
+        return compute(), None
+    gate = analyzer_registry.get_analyzer().quality_gate
+    if gate is not None and gate.gates(analysis):
+        # A rejection depends on the gate's thresholds
+        params = dict(params, quality_gate=gate.params())
+    key = make_key(image_digest(image), analysis, dict(params, output=output.cache_params()))
+    results, hit = result_cache.get_or_compute(key, compute)
+    return results, 'HIT' if hit else 'MISS'
+
+def cache_response(response, cache_status):
+    """Report result cache hits and misses in an X-Cache header"""
+    if cache_status:
+        response.headers['X-Cache'] = cache_status
+    return response
+
+def parse_list_field(name):
+    """Comma-separated form field as a list, or None when absent"""
+    value = request.form.get(name, '').strip()
+    if not value:
+        return None
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+def parse_float_field(name):
+    """Optional numeric form field; raises ValueError on malformed input"""
+    value = request.form.get(name, '').strip()
+    return float(value) if value else None
+
+def parse_int_field(name, default=None, minimum=None, maximum=None):
+    """Optional integer form field within [minimum, maximum]; raises ValueError"""
+    value = request.form.get(name, '').strip()
+    if not value:
+        return default
+    value = int(value)
+    if minimum is not None and value < minimum:
+        raise ValueError(f"{name} must be at least {minimum}")
+    if maximum is not None and value > maximum:
+        raise ValueError(f"{name} must be at most {maximum}")
+    return value
+
+def parse_blur_regions():
+    """'regions' (faces,text) and 'rects' (x,y,w,h;x,y,w,h) form fields as one list, or None"""
+    regions = parse_list_field('regions') or []
+    for rect in request.form.get('rects', '').split(';'):
+        if rect.strip():
+            values = [int(value) for value in rect.split(',')]
+            if len(values) != 4:
+                raise ValueError(f"Rectangle needs x,y,width,height: {rect.strip()}")
+            regions.append(values)
+    return regions or None
+
+def parse_blur_resolution():
+    """Optional 'resolution' form field (full / auto), defaulting to BLUR_RESOLUTION"""
+    value = request.form.get('resolution', '').strip().lower() or app.config['BLUR_RESOLUTION']
+    if value not in analyzer_registry.BLUR_RESOLUTIONS:
+        raise ValueError(f"Unknown blur resolution: {value}")
+    return value
+
+def parse_face_options():
+    """
+    Face detection form fields: face_preset (fast / balanced / accurate,
+    defaulting to FACE_PRESET) plus optional scale_factor, min_neighbors,
+    min_face and max_face overrides. Raises ValueError on bad input.
+    """
+    preset = request.form.get('face_preset', '').strip().lower() or app.config['FACE_PRESET']
+    if preset not in analyzer_registry.FACE_PRESETS:
+        raise ValueError(f"Unknown face preset: {preset}")
+    options = {'preset': preset}
+    for name in ('scale_factor', 'min_neighbors', 'min_face', 'max_face'):
+        value = parse_float_field(name)
+        if value is not None:
+            options[name] = value
+    return options
+
+def parse_blur_params():
+    """Blur form parameters as analyze_blur_detection arguments; raises ValueError"""
+    params = {'methods': parse_list_field('methods'), 'resolution': parse_blur_resolution(),
+              'regions': parse_blur_regions()}
+    if params['regions'] and 'faces' in params['regions']:
+        # Face regions are detected with the request's face options
+        params['face_options'] = parse_face_options()
+    return params
+
+def parse_job_params(analysis):
+    """Form parameters of one analysis type, as passed to the analyzer; raises ValueError"""
+    if analysis == 'ocr':
+        return {'early_exit_confidence': parse_float_field('early_exit_confidence')}
+    if analysis == 'blur':
+        return parse_blur_params()
+    if analysis == 'face':
+        return parse_face_options()
+    return {}
+
+def requested_analyses():
+    """Analyses named in the 'analyses' form field (all by default)"""
+    return parse_list_field('analyses') or analyzer_registry.ANALYSES
+
+def upload_admission_estimate(analyses):
+    """
+    (estimated peak bytes, pixel count) of a request, from the header of its
+    'file' (or first 'frames') upload; (None, None) when the size cannot be
+    read, e.g. for a video.
+    """
+    upload = request.files.get('file') or next(iter(request.files.getlist('frames')), None)
+    if upload is None:
+        return None, None
+    # A burst also holds its top_k frames while they wait for the full analysis
+    extra_images = 0
+    if 'frames' in request.files:
+        try:
+            extra_images = parse_int_field('top_k', app.config['STREAM_TOP_K'])
+        except ValueError:
+            extra_images = app.config['STREAM_TOP_K']
+    dimensions = image_dimensions(upload.stream)
+    return memory_cost(dimensions, analyses, app.config['ADMISSION_MEMORY_FACTORS'],
+                       extra_images=extra_images), pixel_count(dimensions)
+
+def admission_controlled(analyses):
+    """
+    Run the view only once admission_controller has a slot for each of its
+    analyses (a list, or a callable reading them from the request) and room
+    in the memory budget; otherwise Rejected is raised (see admission_rejected).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if admission_controller is None:
+                return view(*args, **kwargs)
+            names = analyses() if callable(analyses) else analyses
+            with admission_controller.admit(names, *upload_admission_estimate(names)):
+                return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def run_job(job_type, image_bytes, params):
+    """Run one queued job: the same analysis (and result cache) as the synchronous routes"""
+    from enhanced_analysis import load_image
+    image = load_image(image_bytes)
+    if image is None:
+        return {'error': 'Failed to read image'}
+    
+    params = dict(params)
+    output = make_visualization_options(**params.pop('output'))
+    analyzer = analyzer_registry.get_analyzer()
+    analyses = {
+        'ocr': lambda: analyzer.analyze_ocr(image, output=output, **params),
+        'face': lambda: analyzer.analyze_human_detection(image, output=output, **params),
+        'blur': lambda: analyzer.analyze_blur_detection(image, output=output, **params),
+    }
+    results, _ = run_cached(job_type, image, params, output, analyses[job_type])
+    if "error" in results:
+        return {'error': results["error"]}
+    return {'results': results, 'original_image': encode_image_to_base64(image, output)}
+
+def create_job_queue():
+    """Job queue on the configured backend (in-process, or a redis:// URL)"""
+    backend_setting = app.config['JOBS_BACKEND']
+    backend = MemoryBackend() if backend_setting == 'memory' else RedisBackend(backend_setting)
+    return JobQueue(backend, run_job,
+                    workers=app.config['JOB_WORKERS'],
+                    max_depth=app.config['JOB_MAX_QUEUE_DEPTH'],
+                    result_ttl_seconds=app.config['JOB_RESULT_TTL_SECONDS'],
+                    pending_ttl_seconds=app.config['JOB_PENDING_TTL_SECONDS'],
+                    callback_timeout=app.config['JOB_CALLBACK_TIMEOUT_SECONDS'],
+                    callback_hosts=app.config['JOB_CALLBACK_HOSTS'],
+                    callback_allow_private=app.config['JOB_CALLBACK_ALLOW_PRIVATE'])
+
+# Asynchronous jobs, with a worker pool per analysis type
+job_queue = create_job_queue()
+if app.config['JOB_WORKERS_ON_START']:
+    job_queue.start()
 
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+@app.before_request
+def start_request_metrics():
+    if not instrumentation.enabled:
+        return
+    g.metrics_token = instrumentation.begin_request()
+    g.metrics_started = time.perf_counter()
+    g.metrics_route = request.endpoint or 'unknown'
+    instrumentation.REGISTRY.gauge_add('http_requests_in_flight', 1, help_text='Requests being processed',
+                                       route=g.metrics_route)
+    if request.content_length:
+        instrumentation.REGISTRY.observe('http_request_bytes', request.content_length, instrumentation.BYTE_BUCKETS,
+                                         help_text='Request body size', route=g.metrics_route)
 
-def encode_image_to_base64(image):
-    """Convert OpenCV image to base64 string for display"""
-    _, buffer = cv2.imencode('.jpg', image)
-    img_str = base64.b64encode(buffer).decode('utf-8')
-    return f"data:image/jpeg;base64,{img_str}"
+@app.after_request
+def record_request_metrics(response):
+    if 'metrics_token' not in g:
+        return response
+    registry = instrumentation.REGISTRY
+    registry.observe('http_request_duration_seconds', time.perf_counter() - g.metrics_started,
+                     help_text='Request latency', route=g.metrics_route)
+    registry.inc('http_requests_total', help_text='Requests by route and status code',
+                 route=g.metrics_route, status=response.status_code)
+    if response.content_length is not None:
+        registry.observe('http_response_bytes', response.content_length, instrumentation.BYTE_BUCKETS,
+                         help_text='Response body size', route=g.metrics_route)
+    if app.config['SERVER_TIMING_HEADER']:
+        timings = instrumentation.request_timings()
+        if timings:
+            response.headers['Server-Timing'] = instrumentation.server_timing_header(timings)
+    return response
+
+@app.teardown_request
+def finish_request_metrics(exc):
+    # Runs even when the view raised, so the in-flight gauge always comes back down
+    token = g.pop('metrics_token', None)
+    if token is None:
+        return
+    instrumentation.end_request(token)
+    instrumentation.REGISTRY.gauge_add('http_requests_in_flight', -1, route=g.metrics_route)
 
 @app.route('/')
 def index():
     return render_template('index.html', title="Advanced Image Detection & Analysis Tool")
 
 @app.route('/ocr_analysis', methods=['POST'])
+@admission_controlled(['ocr'])
 def ocr_analysis():
     if 'file' not in request.files:
         return jsonify({'error': 'No file part'}), 400
@@ -39,48 +388,48 @@ def ocr_analysis():
         return jsonify({'error': 'No selected file'}), 400
     
     if file and allowed_file(file.filename):
-        # Save uploaded file temporarily
         filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
         
         try:
-            # Initialize enhanced analyzer
-            analyzer = EnhancedAnalyzer()
+            early_exit_confidence = parse_float_field('early_exit_confidence')
+            output = parse_visualization_options()
+        except ValueError as e:
+            return jsonify({'error': f'Invalid request parameters: {str(e)}'}), 400
+        
+        try:
+            # Decode the upload once; the same array is analysed and displayed
+            image = decode_upload(file)
+            if image is None:
+                return jsonify({'error': 'Failed to read image'}), 400
+            
+            # Shared, already warmed-up analyzer
+            analyzer = analyzer_registry.get_analyzer()
             
             # Run OCR analysis
-            results = analyzer.analyze_ocr(filepath)
+            results, cache_status = run_cached(
+                'ocr', image, {'early_exit_confidence': early_exit_confidence}, output,
+                lambda: analyzer.analyze_ocr(image, early_exit_confidence=early_exit_confidence, output=output))
             
             if "error" in results:
                 return jsonify({'error': results["error"]}), 400
             
-            # Load original image for display
-            image = cv2.imread(filepath)
-            if image is None:
-                return jsonify({'error': 'Failed to read image'}), 400
-            
             # Convert image to base64 for display
-            original_b64 = encode_image_to_base64(image)
-            
-            # Clean up uploaded file
-            os.remove(filepath)
+            original_b64 = encode_image_to_base64(image, output)
             
-            return jsonify({
+            return cache_response(jsonify({
                 'success': True,
                 'filename': filename,
                 'original_image': original_b64,
                 'results': results
-            })
+            }), cache_status)
             
         except Exception as e:
-            # Clean up on error
-            if os.path.exists(filepath):
-                os.remove(filepath)
             return jsonify({'error': f'Processing error: {str(e)}'}), 500
     
     return jsonify({'error': 'Invalid file type'}), 400
 
 @app.route('/human_detection', methods=['POST'])
+@admission_controlled(['face'])
 def human_detection():
     if 'file' not in request.files:
         return jsonify({'error': 'No file part'}), 400
@@ -90,48 +439,48 @@ def human_detection():
         return jsonify({'error': 'No selected file'}), 400
     
     if file and allowed_file(file.filename):
-        # Save uploaded file temporarily
         filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
         
         try:
-            # Initialize enhanced analyzer
-            analyzer = EnhancedAnalyzer()
+            face_options = parse_face_options()
+            output = parse_visualization_options()
+        except ValueError as e:
+            return jsonify({'error': f'Invalid request parameters: {str(e)}'}), 400
+        
+        try:
+            # Decode the upload once; the same array is analysed and displayed
+            image = decode_upload(file)
+            if image is None:
+                return jsonify({'error': 'Failed to read image'}), 400
+            
+            # Shared, already warmed-up analyzer
+            analyzer = analyzer_registry.get_analyzer()
             
             # Run human detection analysis
-            results = analyzer.analyze_human_detection(filepath)
+            results, cache_status = run_cached(
+                'face', image, face_options, output,
+                lambda: analyzer.analyze_human_detection(image, output=output, **face_options))
             
             if "error" in results:
                 return jsonify({'error': results["error"]}), 400
             
-            # Load original image for display
-            image = cv2.imread(filepath)
-            if image is None:
-                return jsonify({'error': 'Failed to read image'}), 400
-            
             # Convert original image to base64 for display
-            original_b64 = encode_image_to_base64(image)
-            
-            # Clean up uploaded file
-            os.remove(filepath)
+            original_b64 = encode_image_to_base64(image, output)
             
-            return jsonify({
+            return cache_response(jsonify({
                 'success': True,
                 'filename': filename,
                 'original_image': original_b64,
                 'results': results
-            })
+            }), cache_status)
             
         except Exception as e:
-            # Clean up on error
-            if os.path.exists(filepath):
-                os.remove(filepath)
             return jsonify({'error': f'Processing error: {str(e)}'}), 500
     
     return jsonify({'error': 'Invalid file type'}), 400
 
 @app.route('/blur_detection', methods=['POST'])
+@admission_controlled(['blur'])
 def blur_detection():
     if 'file' not in request.files:
         return jsonify({'error': 'No file part'}), 400
@@ -141,50 +490,287 @@ def blur_detection():
         return jsonify({'error': 'No selected file'}), 400
     
     if file and allowed_file(file.filename):
-        # Save uploaded file temporarily
         filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
         
         try:
-            # Initialize enhanced analyzer
-            analyzer = EnhancedAnalyzer()
+            params = parse_blur_params()
+            output = parse_visualization_options()
+        except ValueError as e:
+            return jsonify({'error': f'Invalid request parameters: {str(e)}'}), 400
+        
+        try:
+            # Decode the upload once; the same array is analysed and displayed
+            image = decode_upload(file)
+            if image is None:
+                return jsonify({'error': 'Failed to read image'}), 400
+            
+            # Shared, already warmed-up analyzer
+            analyzer = analyzer_registry.get_analyzer()
             
-            # Run blur detection analysis
-            results = analyzer.analyze_blur_detection(filepath)
+            # Run blur detection analysis (optionally only the requested methods and regions)
+            results, cache_status = run_cached(
+                'blur', image, params, output,
+                lambda: analyzer.analyze_blur_detection(image, output=output, **params))
             
             if "error" in results:
                 return jsonify({'error': results["error"]}), 400
             
-            # Load original image for display
-            image = cv2.imread(filepath)
+            # Convert image to base64 for display
+            original_b64 = encode_image_to_base64(image, output)
+            
+            return cache_response(jsonify({
+                'success': True,
+                'filename': filename,
+                'original_image': original_b64,
+                'results': results
+            }), cache_status)
+            
+        except Exception as e:
+            return jsonify({'error': f'Processing error: {str(e)}'}), 500
+    
+    return jsonify({'error': 'Invalid file type'}), 400
+
+@app.route('/analyze', methods=['POST'])
+@admission_controlled(requested_analyses)
+def analyze():
+    """Blur, face and OCR analysis of one upload in a single request"""
+    if 'file' not in request.files:
+        return jsonify({'error': 'No file part'}), 400
+    
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({'error': 'No selected file'}), 400
+    
+    if file and allowed_file(file.filename):
+        filename = secure_filename(file.filename)
+        
+        try:
+            early_exit_confidence = parse_float_field('early_exit_confidence')
+            resolution = parse_blur_resolution()
+            regions = parse_blur_regions()
+            face_options = parse_face_options()
+            output = parse_visualization_options()
+        except ValueError as e:
+            return jsonify({'error': f'Invalid request parameters: {str(e)}'}), 400
+        
+        try:
+            started = time.perf_counter()
+            
+            # Decode the upload once; every analysis shares the array
+            image = decode_upload(file)
             if image is None:
                 return jsonify({'error': 'Failed to read image'}), 400
+            decode_ms = (time.perf_counter() - started) * 1000
             
-            # Convert image to base64 for display
-            original_b64 = encode_image_to_base64(image)
+            # Shared, already warmed-up analyzer
+            analyzer = analyzer_registry.get_analyzer()
             
-            # Clean up uploaded file
-            os.remove(filepath)
+            # Run the requested analyses (all by default) in one pipeline
+            analysis = analyzer.analyze(image, analyses=requested_analyses(),
+                                        blur_methods=parse_list_field('methods'),
+                                        early_exit_confidence=early_exit_confidence, output=output,
+                                        cache=result_cache, blur_resolution=resolution, blur_regions=regions,
+                                        face_options=face_options)
             
-            return jsonify({
-                'success': True,
+            if "error" in analysis:
+                return jsonify({'error': analysis["error"]}), 400
+            
+            # Convert image to base64 for display (once for all analyses)
+            encode_start = time.perf_counter()
+            original_b64 = encode_image_to_base64(image, output)
+            
+            timings = analysis['timings_ms']
+            timings['decode'] = round(decode_ms, 2)
+            timings['encode_original'] = round((time.perf_counter() - encode_start) * 1000, 2)
+            timings['total'] = round((time.perf_counter() - started) * 1000, 2)
+            
+            results = analysis['results']
+            response = {
+                'success': not any("error" in result for result in results.values()),
                 'filename': filename,
                 'original_image': original_b64,
-                'results': results
-            })
+                'results': results,
+                'timings_ms': timings
+            }
+            if 'cache' in analysis:
+                response['cache'] = analysis['cache']
+            return jsonify(response)
             
         except Exception as e:
-            # Clean up on error
-            if os.path.exists(filepath):
-                os.remove(filepath)
             return jsonify({'error': f'Processing error: {str(e)}'}), 500
     
     return jsonify({'error': 'Invalid file type'}), 400
 
+@app.route('/analyze_frames', methods=['POST'])
+@admission_controlled(requested_analyses)
+def analyze_frames():
+    """
+    Sharpest frames of a clip ('video' file) or a burst ('frames' files): every
+    frame is blur-scored cheaply, only the top_k get the full analysis
+    """
+    video = request.files.get('video')
+    burst = [file for file in request.files.getlist('frames') if file.filename]
+    if (video is None or video.filename == '') and not burst:
+        return jsonify({'error': 'Send a video file or one or more frames'}), 400
+    if video is not None and video.filename and not allowed_file(video.filename, VIDEO_EXTENSIONS):
+        return jsonify({'error': 'Invalid video type'}), 400
+    if not all(allowed_file(file.filename) for file in burst):
+        return jsonify({'error': 'Invalid file type'}), 400
+    
+    try:
+        top_k = parse_int_field('top_k', app.config['STREAM_TOP_K'], 1, app.config['STREAM_MAX_TOP_K'])
+        stride = parse_int_field('stride', 1, 1)
+        max_frames = parse_int_field('max_frames', app.config['STREAM_MAX_FRAMES'], 1,
+                                     app.config['STREAM_MAX_FRAMES'])
+        metric = request.form.get('metric', '').strip().lower() or 'laplacian'
+        early_exit_confidence = parse_float_field('early_exit_confidence')
+        resolution = parse_blur_resolution()
+        regions = parse_blur_regions()
+        face_options = parse_face_options()
+        output = parse_visualization_options()
+    except ValueError as e:
+        return jsonify({'error': f'Invalid request parameters: {str(e)}'}), 400
+    
+    # Imported lazily, see analyzer_registry
+    from frame_stream import iter_image_frames, iter_video_frames
+    
+    video_path = None
+    try:
+        if burst:
+            # Each part is read and decoded only when the scorer gets to it
+            frames = iter_image_frames((file.stream.read for file in burst), max_frames, stride)
+        else:
+            # The decoder needs a file; the clip is streamed there from the spooled upload
+            suffix = '.' + video.filename.rsplit('.', 1)[1].lower()
+            with NamedTemporaryFile(dir=app.config['UPLOAD_FOLDER'], suffix=suffix, delete=False) as stored:
+                shutil.copyfileobj(video.stream, stored)
+                video_path = stored.name
+            frames = iter_video_frames(video_path, stride=stride, max_frames=max_frames)
+        
+        # Shared, already warmed-up analyzer
+        analyzer = analyzer_registry.get_analyzer()
+        
+        analysis = analyzer.analyze_frames(frames, top_k=top_k, metric=metric,
+                                           analyses=requested_analyses(),
+                                           output=output, blur_methods=parse_list_field('methods'),
+                                           early_exit_confidence=early_exit_confidence, cache=result_cache,
+                                           blur_resolution=resolution, blur_regions=regions,
+                                           face_options=face_options)
+        
+        if "error" in analysis:
+            return jsonify({'error': analysis["error"]}), 400
+        
+        analysis['success'] = not any("error" in result for frame in analysis['top_frames']
+                                      for result in frame['results'].values())
+        return jsonify(analysis)
+        
+    except Exception as e:
+        return jsonify({'error': f'Processing error: {str(e)}'}), 500
+    finally:
+        if video_path is not None:
+            os.remove(video_path)
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """Queue an analysis and return its job id at once (202); poll /jobs/<id> or pass callback_url"""
+    if 'file' not in request.files:
+        return jsonify({'error': 'No file part'}), 400
+    
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({'error': 'No selected file'}), 400
+    
+    if file and allowed_file(file.filename):
+        analysis = request.form.get('analysis', '').strip().lower()
+        if analysis not in job_queue.workers:
+            return jsonify({'error': f"Invalid request parameters: analysis must be one of "
+                                     f"{', '.join(job_queue.workers)}"}), 400
+        
+        try:
+            params = parse_job_params(analysis)
+            params['output'] = parse_visualization_options().cache_params()
+            job_id = job_queue.submit(analysis, file.stream.read(), params,
+                                      priority=request.form.get('priority', 'normal').strip().lower() or 'normal',
+                                      callback_url=request.form.get('callback_url', '').strip() or None)
+        except ValueError as e:
+            return jsonify({'error': f'Invalid request parameters: {str(e)}'}), 400
+        except QueueFull:
+            response = jsonify({'error': f'The {analysis} queue is full, retry later'})
+            response.headers['Retry-After'] = str(app.config['JOB_RETRY_AFTER_SECONDS'])
+            return response, 429
+        
+        status_url = f'/jobs/{job_id}'
+        response = jsonify({'job_id': job_id, 'status': 'queued', 'status_url': status_url,
+                            'filename': secure_filename(file.filename)})
+        response.headers['Location'] = status_url
+        return response, 202
+    
+    return jsonify({'error': 'Invalid file type'}), 400
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Status of a job; includes the result (or error) once it has finished"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired job'}), 404
+    return jsonify(job)
+
+@app.route('/jobs/stats')
+def job_stats():
+    """Queue depths, worker pool sizes and job counters"""
+    return jsonify(job_queue.stats())
+
+@app.errorhandler(Rejected)
+def admission_rejected(error):
+    """503 with Retry-After when the analyses are saturated, 413 when the image is too large to ever run"""
+    if instrumentation.enabled:
+        instrumentation.REGISTRY.inc('admission_rejected_total', help_text='Requests rejected by admission control',
+                                     route=request.endpoint or 'unknown', reason=error.reason)
+    response = jsonify({'error': str(error), 'reason': error.reason})
+    if error.retry_after is not None:
+        response.headers['Retry-After'] = str(error.retry_after)
+    return response, 413 if error.reason == TOO_LARGE else 503
+
+@app.route('/admission/stats')
+def admission_stats():
+    """Slots in use and waiting per analysis type, reserved memory and rejection counters"""
+    if admission_controller is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(admission_controller.stats(), enabled=True))
+
+@app.route('/quality_gate/stats')
+def quality_gate_stats():
+    """Images checked and rejected by the quality gate, analyses it skipped and the time that saved"""
+    gate = analyzer_registry.get_analyzer().quality_gate
+    if gate is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(gate.stats(), enabled=True))
+
+@app.route('/visualizations/<path:name>')
+def visualization_file(name):
+    """Serve visualizations stored by requests made with visualize=url"""
+    return send_from_directory(os.path.abspath(app.config['VISUALIZATION_FOLDER']), name)
+
+@app.route('/cache/stats')
+def cache_stats():
+    """Result cache counters (hits, misses, evictions) for sizing the cache"""
+    if result_cache is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(result_cache.stats(), enabled=True))
+
+@app.route('/metrics')
+def metrics():
+    """Stage latency histograms and request metrics in the Prometheus text format"""
+    return Response(instrumentation.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/health')
 def health_check():
-    return jsonify({'status': 'healthy', 'message': 'Enhanced Image Analysis Tool is running'})
+    # Ready only once the analyzer has been warmed up in this worker
+    warm_up = analyzer_registry.status()
+    if not warm_up['ready']:
+        status = 'unhealthy' if warm_up['status'] == analyzer_registry.FAILED else 'starting'
+        return jsonify({'status': status, 'message': 'Analyzer is not ready', 'warm_up': warm_up}), 503
+    return jsonify({'status': 'healthy', 'message': 'Enhanced Image Analysis Tool is running', 'warm_up': warm_up})
 
 if __name__ == '__main__':
     print("Starting Enhanced Image Analysis Tool...")
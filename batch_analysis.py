@@ -0,0 +1,383 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Batch blur / face / OCR scoring for directories and file lists.
+
+Images are analysed by EnhancedAnalyzer on a process pool and every result
+is written to the output file (JSONL or CSV) as soon as it is ready, so a
+crashed or interrupted run can be resumed: paths already present in the
+output with status "ok" are skipped, and the ones that failed are analysed
+again (their new record is appended after the old one). At most `max_in_flight` images are queued at a time,
+which keeps memory bounded however large the input is. An analysis that
+fails does not stop the others: its message goes to the record's "errors"
+(per analysis) and "error" fields and the record's status is "error".
+
+Usage:
+    python batch_analysis.py scans/ more_scans/ -o results.jsonl
+    python batch_analysis.py --file-list paths.txt -o results.csv --analyses blur,face --workers 8
+
+Python API:
+    from batch_analysis import run_batch
+    stats = run_batch(["scans/"], "results.jsonl", analyses=("blur", "ocr"))
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from result_cache import json_default
+
+IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp'}
+ANALYSES = ('blur', 'face', 'ocr')
+
+# Visualization fields (always None in batch mode) are dropped from the output
+VISUALIZATION_FIELDS = ('visualization', 'blur_map')
+
+CSV_FIELDS = [
+    'path', 'status', 'error',
+    'blur_score', 'blur_laplacian', 'blur_sobel', 'blur_fft', 'blur_gradient', 'blur_edge_density',
+    'human_detected', 'face_count', 'face_confidence',
+    'ocr_score', 'ocr_text_found', 'ocr_text_count', 'ocr_text',
+    'time_decode', 'time_blur', 'time_face', 'time_ocr', 'time_total',
+]
+
+_worker_analyzer = None
+
+
+def is_image_file(path):
+    return '.' in path and path.rsplit('.', 1)[1].lower() in IMAGE_EXTENSIONS
+
+
+def iter_image_paths(inputs=(), file_list=None):
+    """Yield image paths from directories (recursively), single files and an optional list file"""
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, dirs, files in os.walk(item):
+                dirs.sort()
+                for name in sorted(files):
+                    if is_image_file(name):
+                        yield os.path.join(root, name)
+        elif is_image_file(item):
+            yield item
+
+    if file_list:
+        stream = sys.stdin if file_list == '-' else open(file_list, encoding='utf-8')
+        try:
+            for line in stream:
+                path = line.strip()
+                if path:
+                    yield path
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+
+def init_worker(blur_resolution='full', face_preset='balanced', blur_workers=1, ocr_workers=1):
+    """Create one analyzer per worker process"""
+    global _worker_analyzer
+    import cv2
+    from enhanced_analysis import EnhancedAnalyzer
+
+    # One OpenCV thread per process; the pool already provides the parallelism
+    cv2.setNumThreads(1)
+    # One OCR thread (and tesserocr engine) per process too, unless asked for more
+    _worker_analyzer = EnhancedAnalyzer(blur_resolution=blur_resolution, face_preset=face_preset,
+                                        blur_workers=blur_workers, ocr_workers=ocr_workers)
+
+
+def analyze_path(path, analyses=ANALYSES):
+    """Run the requested analyses on one image and return a result record"""
+    from enhanced_analysis import load_image
+    from visualization import OFF, VisualizationOptions
+
+    if _worker_analyzer is None:
+        init_worker()
+
+    # Visualizations are not produced at all in batch mode
+    no_visualizations = VisualizationOptions(mode=OFF)
+    runners = {
+        'blur': lambda image: _worker_analyzer.analyze_blur_detection(image, output=no_visualizations),
+        'face': lambda image: _worker_analyzer.analyze_human_detection(image, output=no_visualizations),
+        'ocr': lambda image: _worker_analyzer.analyze_ocr(image, output=no_visualizations),
+    }
+    record = {'path': path, 'status': 'ok', 'results': {}, 'timings': {}}
+    started = time.perf_counter()
+
+    # Decode once and share the array between the analyses
+    image = load_image(path)
+    record['timings']['decode'] = round(time.perf_counter() - started, 4)
+    if image is None:
+        record.update(status='error', error='Could not load image')
+        analyses = ()
+
+    for analysis in analyses:
+        stage_start = time.perf_counter()
+        try:
+            result = runners[analysis](image)
+        except Exception as e:
+            result = {"error": f"{analysis} error: {str(e)}"}
+        record['timings'][analysis] = round(time.perf_counter() - stage_start, 4)
+
+        # A failed analysis is recorded and the others still run
+        if "error" in result:
+            record.setdefault('errors', {})[analysis] = result['error']
+            record.update(status='error', error='; '.join(record['errors'].values()))
+            continue
+        for field in VISUALIZATION_FIELDS:
+            result.pop(field, None)
+        record['results'][analysis] = result
+
+    record['timings']['total'] = round(time.perf_counter() - started, 4)
+    return record
+
+
+def flatten_record(record):
+    """Flatten a result record into one CSV row"""
+    results = record.get('results', {})
+    blur = results.get('blur', {})
+    blur_methods = blur.get('methods', {})
+    face = results.get('face', {})
+    ocr = results.get('ocr', {})
+    timings = record.get('timings', {})
+
+    return {
+        'path': record['path'],
+        'status': record['status'],
+        'error': record.get('error', ''),
+        'blur_score': blur.get('score', ''),
+        'blur_laplacian': blur_methods.get('laplacian', ''),
+        'blur_sobel': blur_methods.get('sobel', ''),
+        'blur_fft': blur_methods.get('fft', ''),
+        'blur_gradient': blur_methods.get('gradient', ''),
+        'blur_edge_density': blur_methods.get('edge_density', ''),
+        'human_detected': face.get('human_detected', ''),
+        'face_count': face.get('face_count', ''),
+        'face_confidence': face.get('confidence', ''),
+        'ocr_score': ocr.get('score', ''),
+        'ocr_text_found': ocr.get('text_found', ''),
+        'ocr_text_count': ocr.get('text_count', ''),
+        'ocr_text': ocr.get('detected_text', ''),
+        'time_decode': timings.get('decode', ''),
+        'time_blur': timings.get('blur', ''),
+        'time_face': timings.get('face', ''),
+        'time_ocr': timings.get('ocr', ''),
+        'time_total': timings.get('total', ''),
+    }
+
+
+class ResultWriter:
+    """Append-only JSONL or CSV writer that flushes after every record"""
+
+    def __init__(self, output_path, fmt):
+        self.fmt = fmt
+        needs_header = fmt == 'csv' and (not os.path.exists(output_path) or os.path.getsize(output_path) == 0)
+        _terminate_partial_line(output_path)
+        self.handle = open(output_path, 'a', encoding='utf-8', newline='')
+        if fmt == 'csv':
+            self.csv_writer = csv.DictWriter(self.handle, fieldnames=CSV_FIELDS)
+            if needs_header:
+                self.csv_writer.writeheader()
+
+    def write(self, record):
+        if self.fmt == 'csv':
+            self.csv_writer.writerow(flatten_record(record))
+        else:
+            self.handle.write(json.dumps(record, ensure_ascii=False, default=json_default) + '\n')
+        self.handle.flush()
+
+    def close(self):
+        self.handle.close()
+
+
+def _terminate_partial_line(output_path):
+    """A crash can leave a half-written last line; start appending on a fresh line"""
+    if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
+        return
+    with open(output_path, 'rb+') as handle:
+        handle.seek(-1, os.SEEK_END)
+        if handle.read(1) != b'\n':
+            handle.write(b'\n')
+
+
+def completed_paths(output_path, fmt):
+    """Paths that already have a complete, successful record in an existing output file"""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+
+    with open(output_path, encoding='utf-8', newline='') as handle:
+        if fmt == 'csv':
+            for row in csv.reader(handle):
+                if len(row) == len(CSV_FIELDS) and row[0] != 'path' and row[1] == 'ok':
+                    done.add(row[0])
+        else:
+            for line in handle:
+                try:
+                    record = json.loads(line)
+                    if record['status'] == 'ok':
+                        done.add(record['path'])
+                except (ValueError, KeyError, TypeError):
+                    # Partial line from an interrupted run
+                    continue
+    return done
+
+
+class BatchStats:
+    """Throughput and per-stage timing accumulated over a batch run"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.processed = 0
+        self.errors = 0
+        self.skipped = 0
+        self.stage_seconds = {}
+
+    def add(self, record):
+        self.processed += 1
+        if record['status'] != 'ok':
+            self.errors += 1
+        for stage, seconds in record.get('timings', {}).items():
+            self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started
+        return {
+            'processed': self.processed,
+            'errors': self.errors,
+            'skipped': self.skipped,
+            'elapsed_seconds': round(elapsed, 3),
+            'images_per_second': round(self.processed / elapsed, 3) if elapsed > 0 else 0.0,
+            'stage_seconds': {stage: round(total, 3) for stage, total in self.stage_seconds.items()},
+            'stage_mean_seconds': {
+                stage: round(total / self.processed, 4) for stage, total in self.stage_seconds.items()
+            } if self.processed else {},
+        }
+
+
+def _output_format(output_path, fmt):
+    if fmt:
+        return fmt
+    return 'csv' if output_path.lower().endswith('.csv') else 'jsonl'
+
+
+def run_batch(inputs, output_path, analyses=ANALYSES, workers=None, fmt=None, resume=True,
+              max_in_flight=None, file_list=None, progress=None, blur_resolution='full', face_preset='balanced',
+              blur_workers=1, ocr_workers=1):
+    """
+    Analyse every image under `inputs` and stream records to `output_path`.
+
+    workers: process count (defaults to os.cpu_count())
+    fmt: 'jsonl' or 'csv' (defaults from the output extension)
+    resume: skip paths already recorded without errors in the output file
+    max_in_flight: bound on queued images (defaults to 2 * workers)
+    progress: optional callable receiving (record, stats) after each image
+    blur_resolution: 'full' (exact) or 'auto' (approximate pyramid fast path for large images)
+    face_preset: face detection preset, 'fast', 'balanced' or 'accurate'
+    blur_workers: threads per process sharing the bands of one blur map
+    ocr_workers: threads per process running the OCR variants of one image
+
+    Returns the summary from BatchStats.
+    """
+    analyses = tuple(analyses)
+    unknown = [name for name in analyses if name not in ANALYSES]
+    if unknown:
+        raise ValueError(f"Unknown analyses: {', '.join(unknown)}")
+
+    fmt = _output_format(output_path, fmt)
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or 2 * workers
+
+    done = completed_paths(output_path, fmt) if resume else set()
+    if not resume and os.path.exists(output_path):
+        os.remove(output_path)
+
+    stats = BatchStats()
+    writer = ResultWriter(output_path, fmt)
+    pending = set()
+
+    def drain(return_when):
+        nonlocal pending
+        finished, pending = wait(pending, return_when=return_when)
+        for future in finished:
+            record = future.result()
+            writer.write(record)
+            stats.add(record)
+            if progress:
+                progress(record, stats)
+
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                   initargs=(blur_resolution, face_preset, blur_workers, ocr_workers))
+    try:
+        for path in iter_image_paths(inputs, file_list):
+            if path in done:
+                stats.skipped += 1
+                continue
+            # Backpressure: wait for a slot before reading further input
+            if len(pending) >= max_in_flight:
+                drain(FIRST_COMPLETED)
+            pending.add(executor.submit(analyze_path, path, analyses))
+        if pending:
+            drain(ALL_COMPLETED)
+    except BaseException:
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    else:
+        executor.shutdown()
+    finally:
+        writer.close()
+
+    return stats.summary()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch blur, face and OCR analysis of image directories")
+    parser.add_argument('inputs', nargs='*', help='image files or directories (searched recursively)')
+    parser.add_argument('--file-list', help="file with one image path per line ('-' for stdin)")
+    parser.add_argument('-o', '--output', required=True, help='output file (.jsonl or .csv)')
+    parser.add_argument('--format', choices=['jsonl', 'csv'], help='output format (default: from extension)')
+    parser.add_argument('--analyses', default=','.join(ANALYSES),
+                        help='comma-separated analyses to run: blur,face,ocr (default: all)')
+    parser.add_argument('--workers', type=int, help='worker processes (default: CPU count)')
+    parser.add_argument('--max-in-flight', type=int, help='maximum queued images (default: 2 x workers)')
+    parser.add_argument('--blur-resolution', choices=['full', 'auto'], default='full',
+                        help='full: always score at full resolution (default); auto: estimate the scores of large '
+                             'images on a pyramid level unless near the sharp/blurry threshold (approximate)')
+    parser.add_argument('--face-preset', choices=['fast', 'balanced', 'accurate'], default='balanced',
+                        help='face detection speed / recall trade-off (default: balanced)')
+    parser.add_argument('--blur-workers', type=int, default=1,
+                        help='threads per process for the blur bands of one image; for a few very large scans, '
+                             'use fewer --workers and more --blur-workers (default: 1)')
+    parser.add_argument('--ocr-workers', type=int, default=1,
+                        help='threads per process for the four OCR variants of one image; the processes '
+                             'already use every core (default: 1)')
+    parser.add_argument('--no-resume', action='store_true', help='start over instead of skipping paths recorded without errors')
+    parser.add_argument('--quiet', action='store_true', help='do not print progress')
+    args = parser.parse_args(argv)
+
+    if not args.inputs and not args.file_list:
+        parser.error('no inputs given')
+
+    analyses = [name.strip() for name in args.analyses.split(',') if name.strip()]
+
+    def report(record, stats):
+        if not args.quiet and stats.processed % 100 == 0:
+            print(f"  {stats.processed} images ({stats.errors} errors)", file=sys.stderr)
+
+    try:
+        summary = run_batch(args.inputs, args.output, analyses=analyses, workers=args.workers,
+                            fmt=args.format, resume=not args.no_resume, max_in_flight=args.max_in_flight,
+                            file_list=args.file_list, progress=report, blur_resolution=args.blur_resolution,
+                            face_preset=args.face_preset, blur_workers=args.blur_workers,
+                            ocr_workers=args.ocr_workers)
+    except ValueError as e:
+        parser.error(str(e))
+
+    print(json.dumps(summary, indent=2), file=sys.stderr)
+    return 0 if summary['errors'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Working set of each analysis as a multiple of the decoded image (admission.DEFAULT_MEMORY_FACTORS).
+
+Usage:
+    python benchmarks/bench_admission_memory.py [--sizes 1600x1200 4000x3000 8000x6000]
+
+Every measurement runs in a fresh process on one synthetic image from
+benchmarks/corpus.py, the way the web app runs it (full-resolution blur with
+the default bands, the default face preset, inline JPEG visualizations). The
+analyzer is warmed up on a small crop first, then the peak RSS (VmHWM) is
+reset and one call is measured (Linux only). The decoded upload is
+allocated before the reset, so each figure is what the analysis adds on top
+of it, and the factor is that growth divided by width x height x 3:
+
+  blur  analyze_blur_detection
+  face  analyze_human_detection
+  ocr   analyze_ocr when a tesseract backend can run here; otherwise only
+        its in-process part (the four preprocessing variants held at once
+        and the visualization), marked with '*'. A pytesseract pass runs in
+        a tesseract process of its own, which this does not measure.
+
+The largest factor per analysis over all sizes is printed last, next to the
+current defaults.
+"""
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from admission import DECODED_CHANNELS, DEFAULT_MEMORY_FACTORS  # noqa: E402
+from bench_blur_memory import reset_peak, rss_bytes  # noqa: E402
+from corpus import make_image, parse_size  # noqa: E402
+
+ANALYSES = ('blur', 'face', 'ocr')
+KINDS = {'blur': 'sharp', 'face': 'faces', 'ocr': 'id_card'}
+
+
+def measure(analysis, size):
+    """Peak RSS growth of one analysis call, in this process"""
+    from enhanced_analysis import EnhancedAnalyzer
+    from visualization import VisualizationOptions
+
+    width, height = parse_size(size)
+    image = make_image(KINDS[analysis], width, height, 0)
+    analyzer = EnhancedAnalyzer(blur_resolution='full')
+    inline = VisualizationOptions(mode='inline')
+    in_process_only = False
+
+    if analysis == 'blur':
+        def call():
+            return analyzer.analyze_blur_detection(image, output=inline)
+    elif analysis == 'face':
+        def call():
+            return analyzer.analyze_human_detection(image, output=inline)
+    else:
+        try:
+            analyzer.ocr_backend.warm_up()
+        except Exception:
+            in_process_only = True
+        if in_process_only:
+            def call():
+                black_text = analyzer._extract_black_text(image)
+                variants = [black_text, analyzer._enhance_black_text_for_ocr(black_text),
+                            analyzer._denoise_black_text(black_text), analyzer._sharpen_black_text(black_text)]
+                no_text = {'text_found': False}
+                return variants, analyzer._create_black_text_ocr_visualization(image, no_text, black_text, inline)
+        else:
+            def call():
+                return analyzer.analyze_ocr(image, output=inline)
+
+    # Warm up on a small crop so one-off allocations are not counted
+    small = image[:64, :64].copy()
+    if analysis == 'face':
+        analyzer.analyze_human_detection(small, output=inline)
+    else:
+        analyzer.analyze_blur_detection(small, output=inline)
+    gc.collect()
+    if not reset_peak():
+        return {'error': 'peak RSS reset is not supported here (needs Linux)'}
+    before = rss_bytes('VmRSS')
+    call()
+    peak = rss_bytes('VmHWM') - before
+    return {'peak_mb': peak / 2**20, 'factor': peak / (width * height * DECODED_CHANNELS),
+            'in_process_only': in_process_only}
+
+
+def run_process(analysis, size):
+    command = [sys.executable, os.path.abspath(__file__), '--run', analysis, size]
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT, os.path.dirname(os.path.abspath(__file__))]))
+    completed = subprocess.run(command, capture_output=True, text=True, env=env)
+    if completed.returncode != 0:
+        lines = completed.stderr.strip().splitlines()
+        return {'error': lines[-1] if lines else f"exit status {completed.returncode}"}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', default=['1600x1200', '4000x3000', '8000x6000'],
+                        help='image sizes as WIDTHxHEIGHT')
+    parser.add_argument('--analyses', nargs='+', default=list(ANALYSES), choices=ANALYSES)
+    parser.add_argument('--run', nargs=2, metavar=('ANALYSIS', 'SIZE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(measure(*args.run)))
+        return 0
+
+    largest = {}
+    print(f"{'size':>10} {'MP':>5} {'analysis':>8} {'peak MB':>8} {'factor':>7}")
+    for size in args.sizes:
+        width, height = parse_size(size)
+        for analysis in args.analyses:
+            result = run_process(analysis, size)
+            if 'error' in result:
+                print(f"{size:>10} {width * height / 1e6:>5.1f} {analysis:>8}  error: {result['error']}")
+                continue
+            marker = '*' if result['in_process_only'] else ''
+            print(f"{size:>10} {width * height / 1e6:>5.1f} {analysis:>8} {result['peak_mb']:>8.0f} "
+                  f"{result['factor']:>6.2f}{marker}")
+            largest[analysis] = max(largest.get(analysis, 0), result['factor'])
+
+    print()
+    for analysis, factor in largest.items():
+        print(f"{analysis:>8}: largest factor {factor:.2f}, default {DEFAULT_MEMORY_FACTORS[analysis]}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
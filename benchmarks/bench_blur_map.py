@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark the vectorized blur map against the original sliding window loop.
+
+Usage:
+    python benchmarks/bench_blur_map.py [--sizes 640x480 1920x1080 4000x3000]
+
+For every size it reports the runtime of both implementations, the speedup,
+and the mean / max absolute difference between the two uint8 heat maps.
+"""
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from blur_map import compute_blur_map  # noqa: E402
+
+
+def legacy_blur_map(gray, window_size=15):
+    """The original per-window implementation from EnhancedAnalyzer._create_blur_map"""
+    height, width = gray.shape
+    blur_map = np.zeros((height, width))
+    for i in range(0, height - window_size, window_size//2):
+        for j in range(0, width - window_size, window_size//2):
+            window = gray[i:i+window_size, j:j+window_size]
+            laplacian_var = cv2.Laplacian(window, cv2.CV_64F).var()
+            blur_value = min(255, max(0, 255 - (laplacian_var / 2)))
+            blur_map[i:i+window_size, j:j+window_size] = blur_value
+    return np.uint8(blur_map)
+
+
+def synthetic_image(width, height, seed=0):
+    """Textured test image with a sharp half and a blurred half"""
+    rng = np.random.default_rng(seed)
+    base = rng.integers(0, 256, size=(height // 8 + 1, width // 8 + 1), dtype=np.uint8)
+    image = cv2.resize(base, (width, height), interpolation=cv2.INTER_CUBIC)
+    for _ in range(40):
+        x, y = int(rng.integers(0, width)), int(rng.integers(0, height))
+        cv2.circle(image, (x, y), int(rng.integers(5, max(6, width // 20))), int(rng.integers(0, 256)), 2)
+    half = width // 2
+    image[:, half:] = cv2.GaussianBlur(image[:, half:], (0, 0), 3)
+    return image
+
+
+def time_call(func, *args, repeat=1):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', default=['640x480', '1920x1080', '4000x3000'],
+                        help='image sizes as WIDTHxHEIGHT')
+    parser.add_argument('--repeat', type=int, default=3, help='repetitions for the vectorized engine')
+    args = parser.parse_args()
+
+    print(f"{'size':>12} {'loop (s)':>10} {'vector (s)':>11} {'speedup':>8} {'mean diff':>10} {'max diff':>9}")
+    for size in args.sizes:
+        width, height = (int(v) for v in size.lower().split('x'))
+        gray = synthetic_image(width, height)
+
+        legacy_time, legacy = time_call(legacy_blur_map, gray)
+        fast_time, fast = time_call(compute_blur_map, gray, repeat=args.repeat)
+
+        diff = np.abs(legacy.astype(np.int16) - fast.astype(np.int16))
+        print(f"{size:>12} {legacy_time:>10.3f} {fast_time:>11.4f} {legacy_time / fast_time:>7.0f}x "
+              f"{diff.mean():>10.3f} {diff.max():>9d}")
+
+
+if __name__ == '__main__':
+    main()
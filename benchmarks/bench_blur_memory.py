@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Peak memory per megapixel of the blur pipeline, and its scores against float64.
+
+Usage:
+    python benchmarks/bench_blur_memory.py [--sizes 1600x1200 4000x3000 6000x4000] [--kind sharp]
+                                           [--max-mb-per-mp 10] [--overhead-mb 32]
+
+Every measurement runs in a fresh process on one synthetic image from
+benchmarks/corpus.py. The analyzer is warmed up first, then the peak RSS
+(VmHWM) is reset and one call is measured (Linux only):
+
+  metrics   every blur metric on one BlurFeatures, no blur map
+  map       the blur map alone
+  analyze   analyze_blur_detection at full resolution with an inline blur map
+
+Each mode runs with the default bands (DEFAULT_BAND_PIXELS) and without
+banding ('whole'). The decoded image itself is allocated before the reset,
+so the figures are what one blur request adds on top of its upload.
+
+The script also scores every image with the metrics' float64 reference
+formulas (cv2.CV_64F derivatives, np.sqrt(sobel_x**2 + sobel_y**2)) and
+reports the largest relative difference of a raw metric value. It exits
+with status 1 when that exceeds --score-tolerance, or when a banded
+'analyze' run needs more than --max-mb-per-mp per megapixel plus
+--overhead-mb.
+"""
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+import time
+
+import cv2
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from blur_map import DEFAULT_BAND_PIXELS, compute_blur_map  # noqa: E402
+from blur_metrics import BLUR_METRICS, BlurFeatures  # noqa: E402
+from corpus import make_image, parse_size  # noqa: E402
+
+MODES = ('metrics', 'map', 'analyze')
+BANDS = {'bands': DEFAULT_BAND_PIXELS, 'whole': None}
+
+
+def reset_peak():
+    """Reset VmHWM to the current RSS; False where that is not supported"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def rss_bytes(field):
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith(field + ':'):
+                return int(line.split()[1]) * 1024
+    return None
+
+
+def reference_scores(gray):
+    """Raw metric values from the float64 formulas the metrics replaced"""
+    laplacian = cv2.Laplacian(gray, cv2.CV_64F)
+    sobel_x = cv2.Sobel(gray, cv2.CV_64F, 1, 0, ksize=3)
+    sobel_y = cv2.Sobel(gray, cv2.CV_64F, 0, 1, ksize=3)
+    gradient = np.mean(np.sqrt(sobel_x ** 2 + sobel_y ** 2))
+    return {'laplacian': laplacian.var() / 10, 'sobel': gradient / 2, 'gradient': gradient / 3}
+
+
+def measure(kind, size, mode, band_pixels):
+    """Peak RSS growth and time of one call, in this process"""
+    from enhanced_analysis import EnhancedAnalyzer
+    from visualization import VisualizationOptions
+
+    width, height = parse_size(size)
+    image = make_image(kind, width, height, 0)
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    analyzer = EnhancedAnalyzer(blur_resolution='full', blur_band_pixels=band_pixels)
+    inline = VisualizationOptions(mode='inline')
+
+    if mode == 'metrics':
+        def call():
+            features = BlurFeatures(gray, band_pixels=band_pixels)
+            return {name: metric.func(features) for name, metric in BLUR_METRICS.items()}
+    elif mode == 'map':
+        def call():
+            return compute_blur_map(gray, band_pixels=band_pixels)
+    else:
+        def call():
+            return analyzer.analyze_blur_detection(image, output=inline)
+
+    # Warm up on a small crop so one-off allocations are not counted
+    small = image[:64, :64].copy()
+    analyzer.analyze_blur_detection(small, output=inline)
+    gc.collect()
+    if not reset_peak():
+        return {'error': 'peak RSS reset is not supported here (needs Linux)'}
+    before = rss_bytes('VmRSS')
+    start = time.perf_counter()
+    result = call()
+    elapsed = time.perf_counter() - start
+    peak = rss_bytes('VmHWM') - before
+
+    report = {'peak_mb': peak / 2**20, 'ms': elapsed * 1000}
+    if mode == 'metrics':
+        reference = reference_scores(gray)
+        report['max_relative_diff'] = max(abs(result[name] - value) / max(abs(value), 1e-12)
+                                          for name, value in reference.items())
+    return report
+
+
+def run_process(kind, size, mode, bands):
+    command = [sys.executable, os.path.abspath(__file__), '--run', kind, size, mode, bands]
+    completed = subprocess.run(command, capture_output=True, text=True, env=dict(os.environ, PYTHONPATH=ROOT))
+    if completed.returncode != 0:
+        lines = completed.stderr.strip().splitlines()
+        return {'error': lines[-1] if lines else f"exit status {completed.returncode}"}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', default=['1600x1200', '4000x3000', '6000x4000'],
+                        help='image sizes as WIDTHxHEIGHT')
+    parser.add_argument('--kind', default='sharp', help='corpus image kind')
+    parser.add_argument('--max-mb-per-mp', type=float, default=10.0,
+                        help='allowed peak growth per megapixel of a banded analyze run')
+    parser.add_argument('--overhead-mb', type=float, default=32.0,
+                        help='fixed allowance on top of --max-mb-per-mp (bands, encoder buffers)')
+    parser.add_argument('--score-tolerance', type=float, default=1e-6,
+                        help='allowed relative difference from the float64 reference')
+    parser.add_argument('--run', nargs=4, metavar=('KIND', 'SIZE', 'MODE', 'BANDS'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        kind, size, mode, bands = args.run
+        print(json.dumps(measure(kind, size, mode, BANDS[bands])))
+        return 0
+
+    failed = False
+    print(f"{'size':>10} {'MP':>5} {'mode':>8} {'bands':>6} {'peak MB':>8} {'MB/MP':>6} {'ms':>8} {'score diff':>10}")
+    for size in args.sizes:
+        width, height = parse_size(size)
+        megapixels = width * height / 1e6
+        for mode in MODES:
+            for bands in BANDS:
+                result = run_process(args.kind, size, mode, bands)
+                if 'error' in result:
+                    print(f"{size:>10} {megapixels:>5.1f} {mode:>8} {bands:>6}  error: {result['error']}")
+                    failed = True
+                    continue
+                diff = result.get('max_relative_diff')
+                print(f"{size:>10} {megapixels:>5.1f} {mode:>8} {bands:>6} {result['peak_mb']:>8.0f} "
+                      f"{result['peak_mb'] / megapixels:>6.1f} {result['ms']:>8.0f} "
+                      f"{'' if diff is None else f'{diff:.1e}':>10}")
+                if diff is not None and diff > args.score_tolerance:
+                    failed = True
+                if (mode == 'analyze' and bands == 'bands'
+                        and result['peak_mb'] > args.max_mb_per_mp * megapixels + args.overhead_mb):
+                    failed = True
+    if failed:
+        print("FAILED: a score or peak memory limit was exceeded")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Calibration and speed of the resolution-aware blur scoring (blur_pyramid).
+
+Usage:
+    python benchmarks/bench_blur_pyramid.py [--sizes 1600x1200 4000x3000 8000x6000]
+                                            [--sigmas 0 1 2 3 5] [--max-pixels 4000000]
+
+For every size a small synthetic corpus (a document-like scene, a fine
+texture, the scene with sensor noise and plain grey noise, each with several
+Gaussian blur strengths) is scored three ways:
+
+  before  the previous implementation: full resolution, full complex FFT
+  full    full resolution with the pruned low-frequency DFT (exact, the default)
+  auto    opt-in pyramid fast path with escalation near the SHARP / BLURRY threshold
+
+It reports the median time of each, how far the auto scores move from the
+full-resolution scores (mean / max absolute difference of the weighted
+score), how often the SHARP / BLURRY decision agrees, how often the full
+score lies outside the range estimated on the pyramid level, and which
+pyramid levels the auto scores came from. Noise and fine texture are lost on
+the pyramid levels, so expect disagreements on them.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from collections import Counter
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from blur_metrics import BLUR_METRICS, BlurFeatures, run_blur_metrics, weighted_blur_score  # noqa: E402
+from blur_pyramid import AUTO, DEFAULT_MAX_PIXELS, FULL, SHARP_THRESHOLD, score_blur  # noqa: E402
+from corpus import synthetic_scene, synthetic_texture  # noqa: E402
+
+
+def legacy_scores(gray):
+    """Full-resolution scores with the full fft2 / fftshift / log(abs) spectrum"""
+    features = BlurFeatures(gray)
+    scores = run_blur_metrics(features, [name for name in BLUR_METRICS if name != 'fft'])
+    magnitude_spectrum = np.log(np.abs(np.fft.fftshift(np.fft.fft2(gray))) + 1)
+    rows, cols = gray.shape
+    crow, ccol = rows//2, cols//2
+    scores['fft'] = float(min(100, np.mean(magnitude_spectrum[crow-30:crow+30, ccol-30:ccol+30]) * 2))
+    return scores
+
+
+def noisy(image, sigma=12, seed=0):
+    noise = np.random.default_rng(seed).normal(0, sigma, image.shape)
+    return np.clip(image + noise, 0, 255).astype(np.uint8)
+
+
+def grey_noise(width, height):
+    return noisy(np.full((height, width), 128, np.uint8))
+
+
+def corpus(width, height, sigmas):
+    kinds = (('scene', synthetic_scene), ('texture', synthetic_texture),
+             ('noisy scene', lambda w, h: noisy(synthetic_scene(w, h))), ('noise', grey_noise))
+    for kind, make in kinds:
+        sharp = make(width, height)
+        for sigma in sigmas:
+            yield f"{kind} sigma={sigma:g}", cv2.GaussianBlur(sharp, (0, 0), sigma) if sigma else sharp
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', default=['1600x1200', '4000x3000', '8000x6000'],
+                        help='image sizes as WIDTHxHEIGHT (2, 12 and 48 MP by default)')
+    parser.add_argument('--sigmas', nargs='+', type=float, default=[0, 1, 2, 3, 5],
+                        help='Gaussian blur strengths applied to each corpus image')
+    parser.add_argument('--max-pixels', type=int, default=DEFAULT_MAX_PIXELS, help='pyramid working size')
+    parser.add_argument('--verbose', action='store_true', help='print every image')
+    args = parser.parse_args()
+
+    print(f"{'size':>10} {'MP':>5} {'before (s)':>11} {'full (s)':>9} {'auto (s)':>9} "
+          f"{'full x':>7} {'auto x':>7} {'mean |d|':>9} {'max |d|':>8} {'agree':>7} {'outside':>7}  levels")
+    for size in args.sizes:
+        width, height = (int(v) for v in size.lower().split('x'))
+        times = {'before': [], FULL: [], AUTO: []}
+        deltas, agree, outside, levels = [], 0, 0, Counter()
+        for name, gray in corpus(width, height, args.sigmas):
+            elapsed, before = timed(legacy_scores, gray)
+            times['before'].append(elapsed)
+            elapsed, (full, _) = timed(score_blur, BlurFeatures(gray), resolution=FULL)
+            times[FULL].append(elapsed)
+            elapsed, (auto, info) = timed(score_blur, BlurFeatures(gray), resolution=AUTO,
+                                          max_pixels=args.max_pixels)
+            times[AUTO].append(elapsed)
+
+            before_score, full_score = weighted_blur_score(before), weighted_blur_score(full)
+            auto_score = weighted_blur_score(auto)
+            assert abs(before_score - full_score) < 1e-6, (name, before_score, full_score)
+            deltas.append(abs(auto_score - full_score))
+            agree += (auto_score >= SHARP_THRESHOLD) == (full_score >= SHARP_THRESHOLD)
+            low, high = info['score_range']
+            outside += not low - 0.01 <= full_score <= high + 0.01
+            levels[info['level']] += 1
+            if args.verbose:
+                print(f"    {name:<20} full={full_score:6.2f} auto={auto_score:6.2f} "
+                      f"level={info['level']} range={info['score_range']}")
+
+        median = {key: statistics.median(values) for key, values in times.items()}
+        level_summary = ' '.join(f"L{level}:{count}" for level, count in sorted(levels.items()))
+        print(f"{size:>10} {width * height / 1e6:>5.1f} {median['before']:>11.3f} {median[FULL]:>9.3f} "
+              f"{median[AUTO]:>9.3f} {median['before'] / median[FULL]:>6.1f}x {median['before'] / median[AUTO]:>6.1f}x "
+              f"{statistics.mean(deltas):>9.2f} {max(deltas):>8.2f} {agree:>3}/{len(deltas):<3} {outside:>7}  {level_summary}")
+
+
+if __name__ == '__main__':
+    main()
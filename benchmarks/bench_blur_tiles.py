@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Scaling of the banded blur metrics and blur map from 1 to N worker threads.
+
+Usage:
+    python benchmarks/bench_blur_tiles.py [--sizes 2480x3508 3508x4961] [--workers 1 2 4 8]
+                                          [--kind id_card] [--repeat 5]
+
+The default sizes are A4 and A3 pages scanned at 300 DPI. For every size and
+worker count it times, as the median of --repeat calls:
+
+  metrics   every blur metric on one BlurFeatures (bands on the thread pool)
+  map       the blur map alone (compute_blur_map)
+  analyze   analyze_blur_detection at full resolution with an inline blur map
+
+Bands are sized with band_pixels_for(), so every worker gets at least one.
+OpenCV's own threading is switched off (cv2.setNumThreads(1)), as in the
+batch workers, so the speedup is that of the thread pool alone. Every run
+is checked against the single-worker one: the blur map must be identical
+and the raw scores equal up to rounding (the band boundaries, and so the
+order of the partial sums, change with the worker count). Speedups above
+the machine's core count are not possible, so --workers defaults to
+1, 2, 4, ... up to os.cpu_count().
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from blur_map import DEFAULT_BAND_PIXELS, band_pixels_for, compute_blur_map  # noqa: E402
+from blur_metrics import BLUR_METRICS, BlurFeatures  # noqa: E402
+from corpus import make_image, parse_size  # noqa: E402
+from enhanced_analysis import EnhancedAnalyzer  # noqa: E402
+from visualization import VisualizationOptions  # noqa: E402
+
+# Allowed relative difference of a raw score from the single-worker run
+SCORE_TOLERANCE = 1e-9
+
+
+def default_workers():
+    cpus = os.cpu_count() or 1
+    counts, workers = [], 1
+    while workers < cpus:
+        counts.append(workers)
+        workers *= 2
+    return counts + [cpus]
+
+
+def all_metrics(gray, band_pixels, executor):
+    features = BlurFeatures(gray, band_pixels=band_pixels, executor=executor)
+    return {name: metric.func(features) for name, metric in BLUR_METRICS.items()}
+
+
+def median_ms(func, repeat):
+    times, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', default=['2480x3508', '3508x4961'], help='image sizes as WIDTHxHEIGHT')
+    parser.add_argument('--workers', nargs='+', type=int, default=default_workers(), help='worker counts to time')
+    parser.add_argument('--kind', default='id_card', help='corpus image kind')
+    parser.add_argument('--repeat', type=int, default=5, help='timed calls per measurement')
+    args = parser.parse_args()
+
+    cv2.setNumThreads(1)
+    inline = VisualizationOptions(mode='inline')
+    print(f"cpu_count={os.cpu_count()}")
+    print(f"{'size':>10} {'MP':>5} {'workers':>7} {'metrics ms':>10} {'map ms':>8} {'analyze ms':>10} "
+          f"{'speedup':>8} {'same':>5}")
+    for size in args.sizes:
+        width, height = parse_size(size)
+        image = make_image(args.kind, width, height, 0)
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        reference = None
+        for workers in args.workers:
+            band_pixels = band_pixels_for(gray.size, DEFAULT_BAND_PIXELS, workers)
+            analyzer = EnhancedAnalyzer(blur_resolution='full', blur_workers=workers)
+            executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+            try:
+                metrics_ms, scores = median_ms(lambda: all_metrics(gray, band_pixels, executor), args.repeat)
+                map_ms, blur_map = median_ms(
+                    lambda: compute_blur_map(gray, band_pixels=band_pixels, executor=executor), args.repeat)
+                analyze_ms, _ = median_ms(lambda: analyzer.analyze_blur_detection(image, output=inline), args.repeat)
+            finally:
+                if executor is not None:
+                    executor.shutdown()
+                if analyzer.blur_executor is not None:
+                    analyzer.blur_executor.shutdown()
+
+            if reference is None:
+                reference = (analyze_ms, scores, blur_map)
+            same = (np.array_equal(blur_map, reference[2])
+                    and all(abs(scores[name] - value) <= SCORE_TOLERANCE * max(abs(value), 1e-12)
+                            for name, value in reference[1].items()))
+            print(f"{size:>10} {width * height / 1e6:>5.1f} {workers:>7} {metrics_ms:>10.0f} {map_ms:>8.0f} "
+                  f"{analyze_ms:>10.0f} {reference[0] / analyze_ms:>7.2f}x {str(same):>5}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Recall versus latency of the face detection presets (face_engine).
+
+Usage:
+    python benchmarks/bench_face_presets.py [--sizes 640x480 1600x1200 4000x3000] [--seeds 5]
+
+Every image is a synthetic scene from benchmarks/corpus.py with six drawn
+frontal faces of 3, 5, 8, 12, 20 and 30% of the shorter side at random
+positions. The ground truth is known. For each size the script runs the
+previous detector ('before': full resolution, scaleFactor 1.1,
+minNeighbors 5, minSize 20) and every preset. It reports:
+
+  ms        median detection time per image
+  recall    detected faces / all faces (a detection matches at IoU >= 0.5)
+  >=5%      recall over faces of at least 5% of the shorter side
+  fp/img    detections matching no face, per image
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus import face_scene, parse_size  # noqa: E402
+from face_engine import DEFAULT_CASCADE, PRESETS, FaceEngine  # noqa: E402
+
+BEFORE = 'before'
+LARGE_FACE_FRACTION = 0.05
+
+
+def iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    overlap_w = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    overlap_h = max(0, min(ay + ah, by + bh) - max(ay, by))
+    overlap = overlap_w * overlap_h
+    return overlap / float(aw * ah + bw * bh - overlap)
+
+
+def match(detections, truth, threshold=0.5):
+    """Indices of the ground-truth boxes found, and the number of unmatched detections"""
+    found, false_positives = set(), 0
+    for detection in detections:
+        candidates = [(iou(detection, box), index) for index, box in enumerate(truth) if index not in found]
+        best = max(candidates, default=(0, None))
+        if best[0] >= threshold:
+            found.add(best[1])
+        else:
+            false_positives += 1
+    return found, false_positives
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', default=['640x480', '1600x1200', '4000x3000'],
+                        help='image sizes as WIDTHxHEIGHT')
+    parser.add_argument('--seeds', type=int, default=5, help='images per size')
+    args = parser.parse_args()
+
+    engine = FaceEngine()
+    before = cv2.CascadeClassifier(DEFAULT_CASCADE)
+    detectors = {BEFORE: lambda gray: before.detectMultiScale(gray, 1.1, 5, minSize=(20, 20))}
+    for preset in PRESETS:
+        detectors[preset] = lambda gray, preset=preset: engine.detect(gray, preset)[0]
+
+    print(f"{'size':>10} {'detector':>9} {'ms':>8} {'speedup':>8} {'recall':>7} {'>=5%':>6} {'fp/img':>7}")
+    for size in args.sizes:
+        width, height = parse_size(size)
+        scenes = []
+        for seed in range(args.seeds):
+            image, truth = face_scene(width, height, seed)
+            scenes.append((cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), truth))
+
+        baseline_ms = None
+        for name, detect in detectors.items():
+            times, found, large_found, large_total, total, false_positives = [], 0, 0, 0, 0, 0
+            for gray, truth in scenes:
+                start = time.perf_counter()
+                detections = detect(gray)
+                times.append((time.perf_counter() - start) * 1000)
+                matched, unmatched = match(np.asarray(detections).reshape(-1, 4).tolist(), truth)
+                large = [index for index, box in enumerate(truth) if box[2] >= LARGE_FACE_FRACTION * min(width, height)]
+                found += len(matched)
+                total += len(truth)
+                large_found += len(matched.intersection(large))
+                large_total += len(large)
+                false_positives += unmatched
+
+            median_ms = statistics.median(times)
+            baseline_ms = baseline_ms or median_ms
+            print(f"{size:>10} {name:>9} {median_ms:>8.1f} {baseline_ms / median_ms:>7.1f}x "
+                  f"{found / total:>7.0%} {large_found / max(1, large_total):>6.0%} "
+                  f"{false_positives / len(scenes):>7.1f}")
+
+
+if __name__ == '__main__':
+    main()
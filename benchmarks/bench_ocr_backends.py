@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Latency of the OCR backends (tesseract subprocess vs resident engines) on the same inputs.
+
+Usage:
+    python benchmarks/bench_ocr_backends.py [--sizes 640x400 1012x638 1600x1000]
+                                            [--backends pytesseract tesserocr] [--kind id_card]
+                                            [--workers 4] [--repeat 5]
+
+The default sizes are ID card crops (1012x638 is an ID-1 card at 300 DPI).
+For every size it builds the four OCR variants of analyze_ocr once and then,
+for every backend, reports:
+
+  first ms    the first pass, including a tesserocr engine load
+  pass ms     median of one image_to_data call on the black text variant
+  request ms  median of analyze_ocr (four variants on --workers threads,
+              no early exit, visualization off)
+  same        whether every variant's text and mean confidence match the
+              first backend's
+
+Backends that cannot run here (binary or package missing) are reported as
+skipped with the reason, so the script also works where only the
+pytesseract fallback is installed.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus import make_image, parse_size  # noqa: E402
+from enhanced_analysis import EnhancedAnalyzer  # noqa: E402
+from ocr_backends import DEFAULT_CONFIG, DEFAULT_LANG, PYTESSERACT, TESSEROCR  # noqa: E402
+from visualization import VisualizationOptions  # noqa: E402
+
+
+def median_ms(func, repeat):
+    times, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times), result
+
+
+def make_analyzer(backend, workers, warm_up=True):
+    """EnhancedAnalyzer on one backend, or the reason it cannot run"""
+    try:
+        analyzer = EnhancedAnalyzer(ocr_workers=workers, ocr_backend=backend)
+        if warm_up:
+            analyzer.ocr_backend.warm_up()
+    except Exception as e:
+        return None, str(e).splitlines()[0]
+    return analyzer, None
+
+
+def ocr_variants(analyzer, image):
+    black_text = analyzer._extract_black_text(image)
+    return {
+        'black_text': black_text,
+        'enhanced': analyzer._enhance_black_text_for_ocr(black_text),
+        'denoised': analyzer._denoise_black_text(black_text),
+        'sharpened': analyzer._sharpen_black_text(black_text),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', default=['640x400', '1012x638', '1600x1000'],
+                        help='image sizes as WIDTHxHEIGHT')
+    parser.add_argument('--backends', nargs='+', default=[PYTESSERACT, TESSEROCR], choices=[PYTESSERACT, TESSEROCR],
+                        help='backends to compare; the first is the reference for "same"')
+    parser.add_argument('--kind', default='id_card', help='corpus image kind')
+    parser.add_argument('--workers', type=int, default=4, help='OCR variant threads (and tesserocr pool size)')
+    parser.add_argument('--repeat', type=int, default=5, help='timed calls per measurement')
+    args = parser.parse_args()
+
+    analyzers = {}
+    for backend in args.backends:
+        analyzer, reason = make_analyzer(backend, args.workers)
+        if analyzer is None:
+            print(f"{backend}: skipped ({reason})")
+        else:
+            analyzers[backend] = analyzer
+    if not analyzers:
+        print("No OCR backend can run here")
+        return 1
+
+    # No visualization, so the request time is preprocessing and OCR
+    output = VisualizationOptions(mode='off')
+    print(f"{'size':>10} {'backend':>12} {'first ms':>9} {'pass ms':>8} {'request ms':>10} {'same':>5}")
+    for size in args.sizes:
+        width, height = parse_size(size)
+        image = make_image(args.kind, width, height, 0)
+        reference = None
+        for backend, analyzer in analyzers.items():
+            variants = ocr_variants(analyzer, image)
+            # A fresh analyzer, so the first pass pays for loading an engine where the backend has one
+            cold, _ = make_analyzer(backend, args.workers, warm_up=False)
+            start = time.perf_counter()
+            cold._run_ocr_with_config(variants['black_text'], DEFAULT_LANG, DEFAULT_CONFIG)
+            first_ms = (time.perf_counter() - start) * 1000
+            cold.ocr_backend.close()
+
+            pass_ms, _ = median_ms(lambda: analyzer._run_ocr_with_config(
+                variants['black_text'], DEFAULT_LANG, DEFAULT_CONFIG), args.repeat)
+            request_ms, _ = median_ms(lambda: analyzer.analyze_ocr(image, output=output), args.repeat)
+
+            results = {}
+            for name, variant in variants.items():
+                result = analyzer._run_ocr_with_config(variant, DEFAULT_LANG, DEFAULT_CONFIG)
+                results[name] = (result['text'], round(float(result['confidence']), 2))
+            if reference is None:
+                reference = results
+            print(f"{size:>10} {backend:>12} {first_ms:>9.0f} {pass_ms:>8.0f} {request_ms:>10.0f} "
+                  f"{str(results == reference):>5}")
+
+    for analyzer in analyzers.values():
+        analyzer.ocr_backend.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark the OCR preprocessing pipeline against the original PIL-based path.
+
+Usage:
+    python benchmarks/bench_ocr_preprocess.py [--sizes 1024x640 2048x1280 4000x2500]
+
+Both paths build the four OCR variants (black text, enhanced, denoised,
+sharpened) from one BGR image; tesseract itself is not run. Reported per
+size: best-of-N time, peak traced Python/NumPy allocation (tracemalloc),
+and the fraction of pixels where each new variant differs from the legacy
+one by more than 8 grey levels.
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+from PIL import Image, ImageFilter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from enhanced_analysis import EnhancedAnalyzer  # noqa: E402
+
+
+def legacy_extract_black_text(pil_image):
+    img_array = np.array(pil_image)
+    hsv = cv2.cvtColor(img_array, cv2.COLOR_RGB2HSV)
+    black_mask = cv2.inRange(hsv, np.array([0, 0, 0]), np.array([180, 255, 50]))
+    kernel = np.ones((2, 2), np.uint8)
+    black_mask = cv2.morphologyEx(black_mask, cv2.MORPH_CLOSE, kernel)
+    black_mask = cv2.morphologyEx(black_mask, cv2.MORPH_OPEN, kernel)
+    result = np.ones_like(img_array) * 255
+    result[black_mask == 255] = [0, 0, 0]
+    return Image.fromarray(result)
+
+
+def legacy_variants(image):
+    """The original path: every variant re-extracts the black text through PIL"""
+    pil_image = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+    black = legacy_extract_black_text(pil_image)
+
+    gray = np.array(legacy_extract_black_text(pil_image).convert('L'))
+    enhanced = Image.fromarray(cv2.bitwise_not(
+        cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)))
+
+    denoised = cv2.bilateralFilter(np.array(legacy_extract_black_text(pil_image)), 9, 75, 75)
+    denoised = Image.fromarray(cv2.morphologyEx(denoised, cv2.MORPH_CLOSE, np.ones((1, 1), np.uint8)))
+
+    sharpened = legacy_extract_black_text(pil_image).filter(
+        ImageFilter.UnsharpMask(radius=1, percent=200, threshold=2))
+
+    return [black, enhanced, denoised, sharpened]
+
+
+def current_variants(analyzer, image):
+    black = analyzer._extract_black_text(image)
+    return [
+        black,
+        analyzer._enhance_black_text_for_ocr(black),
+        analyzer._denoise_black_text(black),
+        analyzer._sharpen_black_text(black),
+    ]
+
+
+def synthetic_card(width, height, seed=0):
+    """Green ID-card-like background with black text lines"""
+    rng = np.random.default_rng(seed)
+    card = np.zeros((height, width, 3), np.uint8)
+    card[:] = (90, 160, 60)
+    noise = rng.normal(0, 6, card.shape)
+    card = np.clip(card + noise, 0, 255).astype(np.uint8)
+    scale = width / 1000
+    for line in range(8):
+        y = int((line + 1) * height / 10)
+        text = ''.join(rng.choice(list('ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789 '), 24))
+        cv2.putText(card, text, (int(40 * scale), y), cv2.FONT_HERSHEY_SIMPLEX, 1.1 * scale, (10, 10, 10),
+                    max(1, int(2 * scale)))
+    return card
+
+
+def measure(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, result
+
+
+def as_gray(variant):
+    array = np.asarray(variant)
+    return cv2.cvtColor(array, cv2.COLOR_RGB2GRAY) if array.ndim == 3 else array
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', default=['1024x640', '2048x1280', '4000x2500'],
+                        help='image sizes as WIDTHxHEIGHT')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    analyzer = EnhancedAnalyzer()
+    names = ['black_text', 'enhanced', 'denoised', 'sharpened']
+
+    print(f"{'size':>10} {'legacy (s)':>11} {'new (s)':>9} {'speedup':>8} {'legacy MB':>10} {'new MB':>8}  "
+          f"{'pixels differing > 8 levels per variant'}")
+    for size in args.sizes:
+        width, height = (int(v) for v in size.lower().split('x'))
+        image = synthetic_card(width, height)
+
+        legacy_time, legacy_peak, legacy = measure(lambda: legacy_variants(image), args.repeat)
+        new_time, new_peak, new = measure(lambda: current_variants(analyzer, image), args.repeat)
+
+        diffs = []
+        for name, old, cur in zip(names, legacy, new):
+            delta = np.abs(as_gray(old).astype(np.int16) - as_gray(cur).astype(np.int16))
+            diffs.append(f"{name}={np.mean(delta > 8):.4%}")
+
+        print(f"{size:>10} {legacy_time:>11.3f} {new_time:>9.3f} {legacy_time / new_time:>7.1f}x "
+              f"{legacy_peak / 2**20:>10.1f} {new_peak / 2**20:>8.1f}  {' '.join(diffs)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Startup time and first-request latency of the Flask service.
+
+Usage:
+    python benchmarks/bench_startup.py [--size 1600x1200] [--runs 3]
+
+Each measurement runs in a fresh interpreter so import and initialisation
+costs are paid again:
+
+  per-request analyzer (before)  import cv2/NumPy/pytesseract with the app,
+                                 then build EnhancedAnalyzer() inside the
+                                 first /blur_detection request
+  warm registry (after)          import the app (heavy modules load on the
+                                 warm-up thread), wait for /health to report
+                                 ready, then send the first request
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_COMMON = r'''
+import io, json, os, sys, time
+sys.path.insert(0, {root!r})
+os.chdir({workdir!r})
+def make_upload():
+    import cv2, numpy as np
+    rng = np.random.default_rng(0)
+    image = cv2.resize(rng.integers(0, 256, ({h} // 8, {w} // 8, 3), dtype=np.uint8), ({w}, {h}))
+    return cv2.imencode('.png', image)[1].tobytes()
+'''
+
+_BEFORE = _COMMON + r'''
+start = time.perf_counter()
+import cv2, numpy, pytesseract
+import analyzer_registry
+from enhanced_analysis import EnhancedAnalyzer
+# Old behaviour: no warm-up, a new analyzer (and cascade load) per request
+analyzer_registry.start_warm_up = lambda: None
+analyzer_registry.get_analyzer = lambda: EnhancedAnalyzer()
+import app as app_module
+startup = time.perf_counter() - start
+client = app_module.app.test_client()
+upload = make_upload()
+start = time.perf_counter()
+response = client.post('/blur_detection', data={{'file': (io.BytesIO(upload), 'bench.png')}})
+assert response.status_code == 200, response.get_json()
+first = time.perf_counter() - start
+print(json.dumps({{'startup': startup, 'ready': startup, 'first_request': first}}))
+'''
+
+_AFTER = _COMMON + r'''
+start = time.perf_counter()
+import app as app_module
+startup = time.perf_counter() - start
+client = app_module.app.test_client()
+while client.get('/health').status_code != 200:
+    time.sleep(0.01)
+ready = time.perf_counter() - start
+upload = make_upload()
+start = time.perf_counter()
+response = client.post('/blur_detection', data={{'file': (io.BytesIO(upload), 'bench.png')}})
+assert response.status_code == 200, response.get_json()
+first = time.perf_counter() - start
+print(json.dumps({{'startup': startup, 'ready': ready, 'first_request': first}}))
+'''
+
+
+def run(template, width, height, workdir):
+    code = template.format(root=ROOT, workdir=workdir, w=width, h=height)
+    output = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', default='1600x1200', help='upload size as WIDTHxHEIGHT')
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+    width, height = (int(v) for v in args.size.lower().split('x'))
+
+    import tempfile
+    workdir = tempfile.mkdtemp(prefix='bench_startup_')
+
+    print(f"{'mode':>28} {'import (s)':>11} {'ready (s)':>10} {'first request (s)':>18}")
+    for label, template in (('per-request analyzer (before)', _BEFORE), ('warm registry (after)', _AFTER)):
+        samples = [run(template, width, height, workdir) for _ in range(args.runs)]
+        median = {key: statistics.median(sample[key] for sample in samples) for key in samples[0]}
+        print(f"{label:>28} {median['startup']:>11.3f} {median['ready']:>10.3f} {median['first_request']:>18.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Deterministic synthetic image corpus for the benchmarks.
+
+Every image is a pure function of (kind, width, height, seed), so runs on
+different machines and commits measure exactly the same inputs. Only the
+'faces' kind contains faces; face_scene() also returns their boxes, so
+detection recall can be measured against ground truth.
+
+    sharp       document-like scene: smooth background, filled shapes, lines
+                of text and mild sensor noise
+    gaussian    the sharp scene with Gaussian defocus blur
+    motion      the sharp scene with linear motion blur
+    id_card     black text fields on a green ID-card background
+    texture     fine random texture (detail at a 3 pixel scale), grayscale
+    faces       the sharp scene with drawn frontal faces from 3% to 30% of
+                the shorter side (which the Haar cascade detects)
+
+Usage:
+    from corpus import make_image
+    image = make_image('id_card', 1600, 1200)
+
+    python benchmarks/corpus.py out_dir/ --sizes 640x480 1600x1200   # write PNGs
+"""
+import argparse
+import os
+
+import cv2
+import numpy as np
+
+KINDS = ('sharp', 'gaussian', 'motion', 'id_card', 'texture', 'faces')
+DEFAULT_SIZES = ('640x480', '1600x1200')
+
+# Card colours in BGR
+CARD_GREEN = (90, 160, 60)
+TEXT_BLACK = (15, 15, 15)
+
+# Face sizes in the 'faces' kind, as fractions of the shorter side
+FACE_FRACTIONS = (0.03, 0.05, 0.08, 0.12, 0.2, 0.3)
+
+
+def parse_size(size):
+    """'WIDTHxHEIGHT' -> (width, height)"""
+    width, height = (int(value) for value in size.lower().split('x'))
+    return width, height
+
+
+def synthetic_scene(width, height, seed=0):
+    """Document-like scene: smooth background, filled shapes, lines of text and sensor noise"""
+    rng = np.random.default_rng(seed)
+    unit = max(width, height) / 1000
+    base = rng.integers(60, 200, size=(4, 4), dtype=np.uint8)
+    image = cv2.resize(base, (width, height), interpolation=cv2.INTER_CUBIC)
+    for _ in range(30):
+        x, y = int(rng.integers(0, width)), int(rng.integers(0, height))
+        size = int(rng.integers(10, 120) * unit)
+        cv2.circle(image, (x, y), size, int(rng.integers(0, 256)), -1, cv2.LINE_AA)
+    for row in range(int(height / (30 * unit))):
+        cv2.putText(image, "NAME 4711 ABC DATE 2024", (int(20 * unit), int((row + 1) * 30 * unit)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.8 * unit, 20, max(1, int(2 * unit)), cv2.LINE_AA)
+    noise = rng.normal(0, 3, image.shape)
+    return np.clip(image + noise, 0, 255).astype(np.uint8)
+
+
+def synthetic_texture(width, height, seed=0):
+    """Fine random texture (detail at a 3 pixel scale)"""
+    rng = np.random.default_rng(seed)
+    base = rng.integers(0, 256, size=(height // 3 + 1, width // 3 + 1), dtype=np.uint8)
+    return cv2.resize(base, (width, height), interpolation=cv2.INTER_CUBIC)
+
+
+def synthetic_id_card(width, height, seed=0):
+    """Black text fields on a green card background with a little lighting variation and noise"""
+    rng = np.random.default_rng(seed)
+    unit = max(width, height) / 1000
+    image = np.empty((height, width, 3), np.uint8)
+    image[:] = CARD_GREEN
+    # Soft lighting gradient across the card
+    shade = np.linspace(-12, 12, width, dtype=np.float32)[np.newaxis, :, np.newaxis]
+    image = np.clip(image + shade, 0, 255).astype(np.uint8)
+
+    fields = ("NAME", "FATHER NAME", "GENDER", "DATE OF BIRTH", "IDENTITY NUMBER", "DATE OF EXPIRY")
+    line_height = int(70 * unit)
+    left = int(width * 0.35)
+    for index, field in enumerate(fields):
+        y = int(height * 0.15) + index * line_height
+        if y + line_height // 2 > height:
+            break
+        value = f"{int(rng.integers(10000, 99999))}-{int(rng.integers(1000000, 9999999))}-{int(rng.integers(1, 9))}"
+        cv2.putText(image, field, (left, y), cv2.FONT_HERSHEY_SIMPLEX, 0.6 * unit, TEXT_BLACK,
+                    max(1, int(1.5 * unit)), cv2.LINE_AA)
+        cv2.putText(image, value, (left, y + int(30 * unit)), cv2.FONT_HERSHEY_SIMPLEX, 0.8 * unit, TEXT_BLACK,
+                    max(1, int(2 * unit)), cv2.LINE_AA)
+    # Photo placeholder (no face) on the left
+    cv2.rectangle(image, (int(width * 0.05), int(height * 0.15)), (int(width * 0.3), int(height * 0.75)),
+                  (120, 130, 120), -1)
+    noise = rng.normal(0, 2, image.shape)
+    return np.clip(image + noise, 0, 255).astype(np.uint8)
+
+
+def synthetic_face(size, tone=180):
+    """size x size grayscale frontal face: skin ellipse, brows, eyes, nose shadow and mouth"""
+    s = size / 100
+    face = np.full((size, size), 90, np.uint8)
+    cv2.ellipse(face, (size // 2, int(52 * s)), (int(38 * s), int(48 * s)), 0, 0, 360, tone, -1, cv2.LINE_AA)
+    for x in (35, 65):
+        cv2.ellipse(face, (int(x * s), int(36 * s)), (int(10 * s), int(3 * s)), 0, 0, 360, 60, -1, cv2.LINE_AA)
+        cv2.ellipse(face, (int(x * s), int(44 * s)), (int(8 * s), int(4 * s)), 0, 0, 360, 40, -1, cv2.LINE_AA)
+    cv2.ellipse(face, (size // 2, int(62 * s)), (int(6 * s), int(4 * s)), 0, 0, 360, tone - 50, -1, cv2.LINE_AA)
+    cv2.ellipse(face, (size // 2, int(76 * s)), (int(12 * s), int(4 * s)), 0, 0, 360, 70, -1, cv2.LINE_AA)
+    return cv2.GaussianBlur(face, (0, 0), max(0.5, 1.5 * s))
+
+
+def face_scene(width, height, seed=0, fractions=FACE_FRACTIONS):
+    """The sharp scene with one face per size in `fractions`; returns (BGR image, [(x, y, w, h)])"""
+    rng = np.random.default_rng(seed + 1)
+    gray = synthetic_scene(width, height, seed)
+    short = min(width, height)
+    boxes = []
+    # Largest first, each placed where it overlaps no earlier face
+    for fraction in sorted(fractions, reverse=True):
+        size = max(24, int(fraction * short))
+        for _ in range(200):
+            x, y = int(rng.integers(0, width - size)), int(rng.integers(0, height - size))
+            if all(x + size <= bx or bx + bw <= x or y + size <= by or by + bh <= y for bx, by, bw, bh in boxes):
+                break
+        else:
+            continue
+        gray[y:y + size, x:x + size] = synthetic_face(size, tone=int(rng.integers(150, 210)))
+        boxes.append((x, y, size, size))
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR), boxes
+
+
+def motion_blur(image, length, angle=30):
+    """Linear motion blur of `length` pixels along `angle` degrees"""
+    length = max(3, int(length) | 1)
+    kernel = np.zeros((length, length), np.float32)
+    kernel[length // 2, :] = 1
+    rotation = cv2.getRotationMatrix2D((length / 2 - 0.5, length / 2 - 0.5), angle, 1)
+    kernel = cv2.warpAffine(kernel, rotation, (length, length))
+    return cv2.filter2D(image, -1, kernel / kernel.sum())
+
+
+def make_image(kind, width, height, seed=0):
+    """One corpus image; BGR uint8 except 'texture', which is grayscale"""
+    unit = max(width, height) / 1000
+    if kind == 'texture':
+        return synthetic_texture(width, height, seed)
+    if kind == 'id_card':
+        return synthetic_id_card(width, height, seed)
+    if kind == 'faces':
+        return face_scene(width, height, seed)[0]
+
+    sharp = cv2.cvtColor(synthetic_scene(width, height, seed), cv2.COLOR_GRAY2BGR)
+    if kind == 'sharp':
+        return sharp
+    if kind == 'gaussian':
+        return cv2.GaussianBlur(sharp, (0, 0), 3 * unit)
+    if kind == 'motion':
+        return motion_blur(sharp, 15 * unit)
+    raise ValueError(f"Unknown corpus kind: {kind}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write the synthetic benchmark corpus as PNG files")
+    parser.add_argument('output_dir')
+    parser.add_argument('--sizes', nargs='+', default=list(DEFAULT_SIZES), help='WIDTHxHEIGHT')
+    parser.add_argument('--kinds', nargs='+', default=list(KINDS), choices=KINDS)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    for size in args.sizes:
+        width, height = parse_size(size)
+        for kind in args.kinds:
+            path = os.path.join(args.output_dir, f"{kind}_{width}x{height}.png")
+            cv2.imwrite(path, make_image(kind, width, height, args.seed))
+            print(path)
+
+
+if __name__ == '__main__':
+    main()
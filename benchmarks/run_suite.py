@@ -0,0 +1,346 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Reproducible benchmark suite for the blur, face and OCR analyzers and the web routes.
+
+Usage:
+    python benchmarks/run_suite.py [--sizes 640x480 1600x1200 4000x3000] [--repeat 10]
+                                   [--cases 'blur/*' 'route/*'] [--visualize inline|off]
+                                   [--output results.json] [--save-baseline baseline.json]
+                                   [--baseline baseline.json] [--latency-tolerance 0.25]
+
+Every case runs one analysis on one image from the deterministic synthetic
+corpus (benchmarks/corpus.py) at one size:
+
+    blur/<kind>/<size>          EnhancedAnalyzer.analyze_blur_detection
+    face/<kind>/<size>          EnhancedAnalyzer.analyze_human_detection
+    ocr/id_card/<size>          EnhancedAnalyzer.analyze_ocr
+    route/<name>/<kind>/<size>  the Flask route through app.test_client(), with
+                                the result cache off so every request analyses
+
+Each case runs in its own process: warm-up calls first, then --repeat timed
+calls. It reports latency percentiles, throughput, and the peak RSS of that
+process. OCR cases are reported as skipped when the tesseract binary is not
+installed.
+
+--save-baseline writes the results as a baseline. --baseline compares the
+run against one: a case regresses when its median latency grows by more
+than --latency-tolerance (and by at least --min-delta-ms), or its peak RSS
+grows by more than --memory-tolerance. Any regression or failed case makes
+the run exit with status 1. Baselines are machine-specific, so only compare
+runs made on the same machine.
+"""
+import argparse
+import fnmatch
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from corpus import DEFAULT_SIZES, make_image, parse_size  # noqa: E402
+
+# Analyzer method cases: target -> corpus kinds
+ANALYZER_CASES = {
+    'blur': ('sharp', 'gaussian', 'motion', 'id_card'),
+    'face': ('sharp', 'id_card', 'faces'),
+    'ocr': ('id_card',),
+}
+
+# Route cases: name -> (path, corpus kind, extra form fields)
+ROUTE_CASES = {
+    'blur_detection': ('/blur_detection', 'sharp', {}),
+    'human_detection': ('/human_detection', 'id_card', {}),
+    'ocr_analysis': ('/ocr_analysis', 'id_card', {}),
+    'analyze': ('/analyze', 'id_card', {}),
+    'analyze_blur_face': ('/analyze', 'id_card', {'analyses': 'blur,face'}),
+}
+
+# Cases that need the tesseract binary
+OCR_TARGETS = ('ocr', 'route/ocr_analysis', 'route/analyze')
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def all_cases(sizes):
+    """Case ids in run order"""
+    cases = []
+    for size in sizes:
+        for target, kinds in ANALYZER_CASES.items():
+            cases.extend(f"{target}/{kind}/{size}" for kind in kinds)
+        for name, (_, kind, _) in ROUTE_CASES.items():
+            cases.append(f"route/{name}/{kind}/{size}")
+    return cases
+
+
+def needs_ocr(case_id):
+    target = case_id.rsplit('/', 2)[0]
+    return target in OCR_TARGETS
+
+
+def tesseract_available():
+    """Tesseract version of the default OCR backend, or None when OCR cannot run"""
+    try:
+        from ocr_backends import make_backend
+        backend = make_backend()
+        return f"{backend.warm_up()['version']} ({backend.name})"
+    except Exception:
+        return None
+
+
+def current_rss_mb():
+    """Resident set size of this process now (Linux only)"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+
+def build_call(case_id, visualize):
+    """A no-argument function running the case once; raises on a failed analysis"""
+    parts = case_id.split('/')
+    width, height = parse_size(parts[-1])
+    kind = parts[-2]
+    image = make_image(kind, width, height)
+
+    if parts[0] in ANALYZER_CASES:
+        from enhanced_analysis import EnhancedAnalyzer
+        from visualization import VisualizationOptions
+
+        analyzer = EnhancedAnalyzer()
+        output = VisualizationOptions(mode=visualize)
+        method = {
+            'blur': analyzer.analyze_blur_detection,
+            'face': analyzer.analyze_human_detection,
+            'ocr': analyzer.analyze_ocr,
+        }[parts[0]]
+
+        def call():
+            result = method(image, output=output)
+            if "error" in result:
+                raise RuntimeError(result["error"])
+        return call
+
+    import analyzer_registry
+    import app as web
+
+    # Every request runs the analysis instead of answering from the cache
+    web.result_cache = None
+    web.job_queue.stop()
+    analyzer_registry.warm_up()
+    client = web.app.test_client()
+    path, _, fields = ROUTE_CASES[parts[1]]
+    _, payload = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 95])
+    payload = payload.tobytes()
+
+    def call():
+        form = dict(fields, visualize=visualize, file=(io.BytesIO(payload), f"{kind}.jpg"))
+        response = client.post(path, data=form, content_type='multipart/form-data')
+        body = response.get_json(silent=True) or {}
+        if response.status_code != 200 or body.get('success') is False:
+            raise RuntimeError(f"{path} returned {response.status_code}: {body.get('error') or body.get('results')}")
+    return call
+
+
+def run_case(case_id, repeat, warmup, visualize):
+    """Time one case in this process and return its record"""
+    width, height = parse_size(case_id.rsplit('/', 1)[1])
+    call = build_call(case_id, visualize)
+    for _ in range(warmup):
+        call()
+
+    setup_rss = current_rss_mb()
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - start)
+
+    latencies_ms = np.array(latencies) * 1000
+    total = sum(latencies)
+    megapixels = width * height / 1e6
+    latency = dict(mean=latencies_ms.mean(), min=latencies_ms.min(), max=latencies_ms.max())
+    latency.update((f"p{q}", np.percentile(latencies_ms, q)) for q in PERCENTILES)
+    peak_rss = peak_rss_mb()
+    return {
+        'status': 'ok',
+        'megapixels': round(megapixels, 2),
+        'repeat': repeat,
+        'latency_ms': {key: round(float(value), 3) for key, value in latency.items()},
+        'throughput': {
+            'images_per_s': round(repeat / total, 3),
+            'megapixels_per_s': round(repeat * megapixels / total, 3),
+        },
+        'memory_mb': {
+            'setup_rss': round(setup_rss, 1) if setup_rss is not None else None,
+            'peak_rss': round(peak_rss, 1) if peak_rss is not None else None,
+        },
+    }
+
+
+def run_case_process(case_id, args, workdir):
+    """Run one case in a fresh interpreter so its peak RSS is its own"""
+    command = [sys.executable, os.path.abspath(__file__), '--run-case', case_id,
+               '--repeat', str(args.repeat), '--warmup', str(args.warmup), '--visualize', args.visualize]
+    # The web app creates its upload / results folders in the working directory
+    completed = subprocess.run(command, cwd=workdir, capture_output=True, text=True,
+                               env=dict(os.environ, PYTHONPATH=ROOT))
+    if completed.returncode != 0:
+        lines = completed.stderr.strip().splitlines()
+        return {'status': 'error', 'reason': lines[-1] if lines else f"exit status {completed.returncode}"}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(results, baseline, latency_tolerance, memory_tolerance, min_delta_ms, min_delta_mb):
+    """{case id: (median latency change, peak RSS change, [regressions])} for cases in both runs"""
+    comparison = {}
+    for case_id, case in results['cases'].items():
+        base = baseline['cases'].get(case_id)
+        if case['status'] != 'ok' or not base or base['status'] != 'ok':
+            continue
+        regressions = []
+        p50, base_p50 = case['latency_ms']['p50'], base['latency_ms']['p50']
+        latency_change = p50 / base_p50 - 1 if base_p50 else 0.0
+        if latency_change > latency_tolerance and p50 - base_p50 >= min_delta_ms:
+            regressions.append(f"p50 {base_p50:.1f} -> {p50:.1f} ms")
+
+        peak, base_peak = case['memory_mb']['peak_rss'], base['memory_mb']['peak_rss']
+        memory_change = None
+        if peak is not None and base_peak:
+            memory_change = peak / base_peak - 1
+            if memory_change > memory_tolerance and peak - base_peak >= min_delta_mb:
+                regressions.append(f"peak RSS {base_peak:.0f} -> {peak:.0f} MB")
+        comparison[case_id] = (latency_change, memory_change, regressions)
+    return comparison
+
+
+def print_report(results, comparison):
+    header = (f"{'case':<44} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'img/s':>7} {'MP/s':>7} "
+              f"{'peak MB':>8}")
+    if comparison is not None:
+        header += f" {'d p50':>7} {'d RSS':>7}  verdict"
+    print(header)
+    for case_id, case in results['cases'].items():
+        if case['status'] != 'ok':
+            print(f"{case_id:<44} {case['status']}: {case['reason']}")
+            continue
+        latency, throughput = case['latency_ms'], case['throughput']
+        peak = case['memory_mb']['peak_rss']
+        line = (f"{case_id:<44} {latency['p50']:>9.1f} {latency['p90']:>9.1f} {latency['p99']:>9.1f} "
+                f"{throughput['images_per_s']:>7.2f} {throughput['megapixels_per_s']:>7.2f} "
+                f"{peak if peak is not None else float('nan'):>8.0f}")
+        if comparison is not None:
+            if case_id in comparison:
+                latency_change, memory_change, regressions = comparison[case_id]
+                memory_text = f"{memory_change:+.0%}" if memory_change is not None else '-'
+                verdict = 'REGRESSION ' + '; '.join(regressions) if regressions else 'ok'
+                line += f" {latency_change:>+7.0%} {memory_text:>7}  {verdict}"
+            else:
+                line += f" {'-':>7} {'-':>7}  new"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', default=list(DEFAULT_SIZES) + ['4000x3000'],
+                        help='image sizes as WIDTHxHEIGHT')
+    parser.add_argument('--cases', nargs='+', default=['*'], help='case id patterns, e.g. blur/* route/*')
+    parser.add_argument('--repeat', type=int, default=10, help='timed calls per case')
+    parser.add_argument('--warmup', type=int, default=2, help='untimed calls per case before timing')
+    parser.add_argument('--visualize', default='inline', choices=('inline', 'off'),
+                        help='visualization output of every call')
+    parser.add_argument('--output', help='write the results as JSON')
+    parser.add_argument('--save-baseline', metavar='PATH', help='write the results as a baseline')
+    parser.add_argument('--baseline', metavar='PATH', help='compare against a baseline and fail on regressions')
+    parser.add_argument('--latency-tolerance', type=float, default=0.25,
+                        help='allowed relative growth of the median latency')
+    parser.add_argument('--min-delta-ms', type=float, default=2.0,
+                        help='ignore median latency growth below this many milliseconds')
+    parser.add_argument('--memory-tolerance', type=float, default=0.15, help='allowed relative growth of peak RSS')
+    parser.add_argument('--min-delta-mb', type=float, default=10.0, help='ignore peak RSS growth below this')
+    parser.add_argument('--run-case', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        print(json.dumps(run_case(args.run_case, args.repeat, args.warmup, args.visualize)))
+        return 0
+
+    tesseract = tesseract_available()
+    results = {
+        'meta': {
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'tesseract': tesseract,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'repeat': args.repeat,
+            'warmup': args.warmup,
+            'visualize': args.visualize,
+        },
+        'cases': {},
+    }
+
+    cases = [case_id for case_id in all_cases(args.sizes)
+             if any(fnmatch.fnmatch(case_id, pattern) for pattern in args.cases)]
+    with tempfile.TemporaryDirectory() as workdir:
+        for case_id in cases:
+            if needs_ocr(case_id) and not tesseract:
+                results['cases'][case_id] = {'status': 'skipped', 'reason': 'tesseract is not installed'}
+                continue
+            results['cases'][case_id] = run_case_process(case_id, args, workdir)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(results, f, indent=2)
+
+    comparison = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        comparison = compare(results, baseline, args.latency_tolerance, args.memory_tolerance,
+                             args.min_delta_ms, args.min_delta_mb)
+
+    print_report(results, comparison)
+
+    failed = [case_id for case_id, case in results['cases'].items() if case['status'] == 'error']
+    regressed = [case_id for case_id, (_, _, regressions) in (comparison or {}).items() if regressions]
+    if failed or regressed:
+        print(f"\n{len(failed)} failed, {len(regressed)} regressed")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Vectorized blur map engine.
+
+The blur map scores overlapping square windows by the variance of the
+Laplacian inside each window. Instead of calling cv2.Laplacian on every
+window, the Laplacian is computed once for the whole image and the
+per-window sums of L and L^2 are read from integral images, so the cost
+no longer depends on the window size or the amount of overlap.
+
+The original loop computed the Laplacian of each cropped window, so pixels
+on the window edges saw a mirrored neighbour instead of the real one. That
+edge effect is reproduced with 1-D line sums along the window borders, which
+keeps the heat map identical to the loop up to floating point rounding: at
+most 1 grey level on a handful of pixels where a value lands exactly on an
+integer boundary (see benchmarks/bench_blur_map.py).
+
+The integral images are float64, 16 bytes per pixel. To bound memory on
+large images, windows are processed in horizontal bands of about
+band_pixels pixels (DEFAULT_BAND_PIXELS). Each band gets one row of context
+above and below, so the result does not depend on the band size.
+
+Bands are independent, and OpenCV and NumPy release the GIL while they
+filter and sum, so the bands can also run on a thread pool: pass any
+concurrent.futures executor as `executor`. Each band writes its own rows of
+the result, so the map is the same for any number of workers. The blur
+metrics banded through map_bands are only equal up to floating-point
+summation order (see blur_metrics). Use band_pixels_for() to split an image
+into at least one band per worker.
+"""
+import cv2
+import numpy as np
+
+DEFAULT_WINDOW_SIZE = 15
+# Pixels per band of the blur map and of the banded blur metrics (None: the whole image at once)
+DEFAULT_BAND_PIXELS = 1 << 21
+
+
+def band_pixels_for(pixels, band_pixels=DEFAULT_BAND_PIXELS, workers=1):
+    """Band size giving each of `workers` threads at least one band, never above band_pixels"""
+    if workers <= 1:
+        return band_pixels
+    share = -(-pixels // workers)
+    return share if band_pixels is None else min(band_pixels, share)
+
+
+def map_bands(func, bands, executor=None):
+    """[func(band) for band in bands], on the executor when there is one; results keep the band order"""
+    if executor is None:
+        return [func(band) for band in bands]
+    return list(executor.map(func, bands))
+
+
+def window_grid(length, window_size, stride):
+    """Start offsets of the windows along one axis (same as the original loop)"""
+    return np.arange(0, max(0, length - window_size), stride)
+
+
+def _edge_line_sums(gray_padded, laplacian, lines, span, starts, window_size, sign, axis):
+    """
+    Per-window sums of the border correction along one window edge.
+
+    Cropping a window and applying cv2.Laplacian (BORDER_REFLECT_101) replaces
+    the neighbour outside the window by the mirrored neighbour inside it, so
+    on an edge line the cropped Laplacian equals L + D with
+    D = sign * (g[line + 1] - g[line - 1]) taken across the edge. Returns D
+    along the lines and the windowed sums of D and of 2*L*D + D^2.
+    """
+    if axis == 0:
+        after = gray_padded[lines + 2, 1:span + 1]
+        before = gray_padded[lines, 1:span + 1]
+        lap = laplacian[lines, :span]
+    else:
+        after = gray_padded[1:span + 1, lines + 2].T
+        before = gray_padded[1:span + 1, lines].T
+        lap = laplacian[:span, lines].T
+    correction = sign * (after.astype(np.float64) - before)
+    square_term = (2 * lap.astype(np.float64) + correction) * correction
+
+    def windowed(values):
+        cumulative = np.zeros((values.shape[0], values.shape[1] + 1))
+        np.cumsum(values, axis=1, out=cumulative[:, 1:])
+        return cumulative[:, starts + window_size] - cumulative[:, starts]
+
+    return correction, windowed(correction), windowed(square_term)
+
+
+def _band_variances(laplacian, padded, rows, cols, window_size, legacy_borders):
+    """
+    Window variances for one band. laplacian covers the band's image rows
+    (rows are relative to its first row); padded is the grey band with the row
+    above and below it (reflected at the image border) and one reflected
+    column on each side.
+    """
+    bottom = rows[-1] + window_size
+    right = cols[-1] + window_size
+    sums, sq_sums = cv2.integral2(laplacian[:bottom, :right], sdepth=cv2.CV_64F, sqdepth=cv2.CV_64F)
+
+    r0 = rows[:, None]
+    c0 = cols[None, :]
+    r1 = r0 + window_size
+    c1 = c0 + window_size
+    count = float(window_size * window_size)
+
+    s = sums[r1, c1] - sums[r0, c1] - sums[r1, c0] + sums[r0, c0]
+    s2 = sq_sums[r1, c1] - sq_sums[r0, c1] - sq_sums[r1, c0] + sq_sums[r0, c0]
+    del sums, sq_sums
+
+    if legacy_borders:
+        lap = laplacian
+        last = window_size - 1
+
+        top, top_sum, top_sq = _edge_line_sums(padded, lap, rows, right, cols, window_size, 1, 0)
+        bot, bot_sum, bot_sq = _edge_line_sums(padded, lap, rows + last, right, cols, window_size, -1, 0)
+        left, left_sum, left_sq = _edge_line_sums(padded, lap, cols, bottom, rows, window_size, 1, 1)
+        rgt, rgt_sum, rgt_sq = _edge_line_sums(padded, lap, cols + last, bottom, rows, window_size, -1, 1)
+
+        # Corner pixels get both corrections, which adds a cross term to L^2
+        corners = (top[:, cols] * left[:, rows].T + top[:, cols + last] * rgt[:, rows].T
+                   + bot[:, cols] * left[:, rows + last].T + bot[:, cols + last] * rgt[:, rows + last].T)
+
+        s = s + top_sum + bot_sum + left_sum.T + rgt_sum.T
+        s2 = s2 + top_sq + bot_sq + left_sq.T + rgt_sq.T + 2 * corners
+
+    mean = s / count
+    return np.maximum(s2 / count - mean * mean, 0)
+
+
+def window_laplacian_variance(gray, window_size=DEFAULT_WINDOW_SIZE, stride=None, laplacian=None,
+                              legacy_borders=True, band_pixels=DEFAULT_BAND_PIXELS, executor=None):
+    """
+    Variance of the Laplacian for every window on the grid.
+
+    Returns (variances, row_starts, col_starts) where variances has shape
+    (len(row_starts), len(col_starts)). A precomputed cv2.Laplacian of `gray`
+    (default ksize) can be passed in to avoid computing it again; otherwise
+    it is computed band by band.
+
+    With legacy_borders=True the result equals cv2.Laplacian(window).var()
+    on each cropped window, i.e. the reflected-border effect at the window
+    edges is reproduced. With legacy_borders=False the variance of the
+    full-image Laplacian inside each window is returned instead.
+
+    band_pixels bounds the image area of a band (None: no banding); bands
+    run on executor when one is given.
+    """
+    if stride is None:
+        stride = max(1, window_size // 2)
+
+    height, width = gray.shape[:2]
+    rows = window_grid(height, window_size, stride)
+    cols = window_grid(width, window_size, stride)
+    if len(rows) == 0 or len(cols) == 0:
+        return np.zeros((len(rows), len(cols))), rows, cols
+
+    # Integer input gives an exact int16 Laplacian
+    depth = cv2.CV_16S if gray.dtype == np.uint8 else cv2.CV_32F
+    # Only the part of the image covered by windows is needed
+    right = cols[-1] + window_size
+    band_rows = len(rows) if band_pixels is None else max(1, band_pixels // (stride * right))
+
+    variances = np.empty((len(rows), len(cols)))
+
+    def process(first):
+        band = rows[first:first + band_rows]
+        top, bottom = band[0], band[-1] + window_size
+        # One row of context on each side, as the whole-image filters would see
+        context_top, context_bottom = max(0, top - 1), min(height, bottom + 1)
+        gray_band = gray[context_top:context_bottom, :right + 1]
+        if laplacian is None:
+            band_laplacian = cv2.Laplacian(gray_band, depth)[top - context_top:]
+        else:
+            band_laplacian = laplacian[top:bottom]
+        padded = cv2.copyMakeBorder(gray_band, int(top == 0), int(bottom == height), 1, 1, cv2.BORDER_REFLECT_101)
+        variances[first:first + band_rows] = _band_variances(band_laplacian, padded, band - top, cols,
+                                                             window_size, legacy_borders)
+
+    map_bands(process, range(0, len(rows), band_rows), executor)
+    return variances, rows, cols
+
+
+def _last_covering_window(starts, window_size, stride, length):
+    """Index of the window that last covered each pixel, or -1 if none did"""
+    index = np.full(length, -1, dtype=np.intp)
+    if len(starts) == 0:
+        return index
+    positions = np.arange(length)
+    candidate = np.minimum(positions // stride, len(starts) - 1)
+    covered = positions - starts[candidate] < window_size
+    index[covered] = candidate[covered]
+    return index
+
+
+def compute_blur_map(gray, window_size=DEFAULT_WINDOW_SIZE, stride=None, laplacian=None,
+                     legacy_borders=True, band_pixels=DEFAULT_BAND_PIXELS, executor=None):
+    """
+    Per-pixel blur map as a uint8 array (255 = blurry, 0 = sharp).
+
+    Windows are painted in the same order as the original sliding window
+    loop, so every pixel takes the value of the last window covering it and
+    pixels outside all windows stay at 0.
+    """
+    if stride is None:
+        stride = max(1, window_size // 2)
+
+    height, width = gray.shape[:2]
+    variances, rows, cols = window_laplacian_variance(gray, window_size, stride, laplacian, legacy_borders,
+                                                      band_pixels, executor)
+    blur_map = np.zeros((height, width), dtype=np.uint8)
+    if variances.size == 0:
+        return blur_map
+
+    # uint8 truncation matches np.uint8() on the float values of the loop
+    values = np.clip(255 - variances / 2, 0, 255).astype(np.uint8)
+
+    row_index = _last_covering_window(rows, window_size, stride, height)
+    col_index = _last_covering_window(cols, window_size, stride, width)
+    row_mask = row_index >= 0
+    col_mask = col_index >= 0
+    blur_map[np.ix_(row_mask, col_mask)] = values[np.ix_(row_index[row_mask], col_index[col_mask])]
+
+    return blur_map
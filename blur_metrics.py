@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Blur metrics and the per-image feature context they share.
+
+Every metric takes a BlurFeatures object instead of a raw grayscale image.
+The features (Laplacian statistics, mean gradient magnitude, spectrum,
+edges) are computed lazily the first time a metric asks for them and then
+reused, so running several metrics on the same image computes each one once.
+
+The metrics only need reductions of the derivatives, so the Laplacian and
+the Sobel pair are never held for the whole image. They are computed in
+horizontal bands of about band_pixels pixels (blur_map.DEFAULT_BAND_PIXELS),
+each with one row of context, and reduced before the next band is computed.
+For 8-bit input the Laplacian is int16, which holds it exactly
+(|value| <= 4 * 255), and the Sobel pair is float32, which is just as exact
+and feeds cv2.magnitude directly. A 24 MP image used to allocate several
+hundred megabytes of full-size derivatives; the metrics now need about
+3 bytes per pixel from 12 MP up (see benchmarks/bench_blur_memory.py).
+Given an executor, the bands (and the FFT metric's row blocks) run on its
+threads. The per-band partial sums are combined in band order, so for a
+given band size the scores with and without an executor are equal up to
+floating-point summation order (the Sobel and gradient means differ by
+about 1e-11 relative; see benchmarks/bench_blur_tiles.py).
+
+The FFT metric only looks at the lowest 60x60 frequencies of the spectrum,
+so those are computed directly (see low_frequency_magnitude) instead of
+running a full complex FFT over the frame.
+
+Metrics are registered in BLUR_METRICS together with their weight in the
+combined score, so callers can run any subset:
+
+    features = BlurFeatures(gray)
+    scores = run_blur_metrics(features, ["laplacian", "edge_density"])
+
+A metric function returns its score before clipping to 100. Each metric also
+declares how its raw value scales with resolution for smooth content
+(scale_exponent), which blur_pyramid uses to score downscaled levels.
+"""
+from collections import OrderedDict
+from functools import cached_property
+
+import cv2
+import numpy as np
+
+from blur_map import DEFAULT_BAND_PIXELS, map_bands
+from instrumentation import stage
+
+# Half-width of the central (low-frequency) window of the spectrum used by the FFT metric
+SPECTRUM_WINDOW = 30
+
+
+def low_frequency_magnitude(gray, half=SPECTRUM_WINDOW, chunk_pixels=DEFAULT_BAND_PIXELS, executor=None):
+    """
+    |DFT| of gray at frequencies -half..half-1 on both axes, laid out like the
+    centre of np.fft.fftshift(np.fft.fft2(gray)).
+
+    Only (2 * half) ** 2 coefficients are needed, so the row transform is a
+    product with a (cols x half + 1) DFT basis - the input is real, so negative
+    column frequencies follow from conjugate symmetry - and the column
+    transform a product with a (2 * half + 1 x rows) basis. This does not
+    depend on the image size factoring well, and in float64 it matches
+    np.fft.fft2 to ~1e-12.
+    """
+    rows, cols = gray.shape
+    angles = (2 * np.pi / cols) * np.outer(np.arange(cols), np.arange(half + 1))
+    row_basis = np.concatenate([np.cos(angles), -np.sin(angles)], axis=1)
+
+    # Row transform in blocks so the float64 copy of the image stays small
+    chunk_rows = max(1, chunk_pixels // cols)
+    row_spectrum = np.empty((rows, 2 * (half + 1)))
+
+    def transform(start):
+        block = gray[start:start + chunk_rows].astype(np.float64)
+        np.matmul(block, row_basis, out=row_spectrum[start:start + chunk_rows])
+
+    map_bands(transform, range(0, rows, chunk_rows), executor)
+    row_spectrum = row_spectrum[:, :half + 1] + 1j * row_spectrum[:, half + 1:]
+
+    column_basis = np.exp((-2j * np.pi / rows) * np.outer(np.arange(-half, half + 1), np.arange(rows)))
+    positive = np.abs(column_basis @ row_spectrum)  # ky = -half..half, kx = 0..half
+
+    magnitude = np.empty((2 * half, 2 * half))
+    magnitude[:, half:] = positive[:2 * half, :half]
+    # |F(ky, kx)| == |F(-ky, -kx)| for real input
+    magnitude[:, :half] = positive[2 * half:0:-1, half:0:-1]
+    return magnitude
+
+
+class BlurFeatures:
+    """Lazily computed derivatives of one grayscale image"""
+
+    def __init__(self, gray, scale=1.0, band_pixels=DEFAULT_BAND_PIXELS, executor=None):
+        self.gray = gray
+        # Original pixels per pixel of gray along each axis (2 ** level on a pyramid level)
+        self.scale = scale
+        # Pixels per band of the banded derivatives (None: the whole image at once)
+        self.band_pixels = band_pixels
+        # Optional thread pool the bands run on
+        self.executor = executor
+
+    @property
+    def _derivative_depth(self):
+        # int16 is exact for 8-bit input, otherwise fall back to float32
+        return cv2.CV_16S if self.gray.dtype == np.uint8 else cv2.CV_32F
+
+    def _reduce_bands(self, derivative, reduce):
+        """
+        reduce(derivative(band)) for successive horizontal bands of the image,
+        in band order. Each band is filtered with the row above and below it,
+        so the values equal those of derivative applied to the whole image.
+        """
+        height, width = self.gray.shape[:2]
+        step = height if self.band_pixels is None else max(1, self.band_pixels // max(1, width))
+
+        def run(start):
+            stop = min(height, start + step)
+            top = max(0, start - 1)
+            return reduce(derivative(self.gray[top:min(height, stop + 1)])[start - top:stop - top])
+
+        return map_bands(run, range(0, height, step), self.executor)
+
+    @cached_property
+    def laplacian_variance(self):
+        def moments(band):
+            mean, std_dev = cv2.meanStdDev(band)
+            return mean[0, 0] * band.size, (std_dev[0, 0] ** 2 + mean[0, 0] ** 2) * band.size
+
+        sums = self._reduce_bands(lambda gray: cv2.Laplacian(gray, self._derivative_depth), moments)
+        count = self.gray.size
+        total = sum(band_sum for band_sum, _ in sums)
+        total_sq = sum(band_sq for _, band_sq in sums)
+        return max(0.0, total_sq / count - (total / count) ** 2)
+
+    @cached_property
+    def gradient_magnitude_mean(self):
+        def magnitude(gray):
+            return cv2.magnitude(cv2.Sobel(gray, cv2.CV_32F, 1, 0, ksize=3), cv2.Sobel(gray, cv2.CV_32F, 0, 1, ksize=3))
+
+        sums = self._reduce_bands(magnitude, lambda band: float(np.sum(band, dtype=np.float64)))
+        return sum(sums) / self.gray.size
+
+    @cached_property
+    def magnitude_spectrum(self):
+        f_transform = np.fft.fft2(self.gray)
+        f_shift = np.fft.fftshift(f_transform)
+        return np.log(np.abs(f_shift) * self.scale ** 2 + 1)
+
+    @cached_property
+    def spectrum_window(self):
+        """Central 60x60 window of magnitude_spectrum, without computing the rest"""
+        rows, cols = self.gray.shape
+        crow, ccol = rows//2, cols//2
+        if min(rows, cols) < 2 * SPECTRUM_WINDOW:
+            # The window does not fit; keep the original slicing of the full spectrum
+            return self.magnitude_spectrum[crow-30:crow+30, ccol-30:ccol+30]
+        # Low frequencies survive downscaling; only their amplitude shrinks with the pixel count
+        magnitude = low_frequency_magnitude(self.gray, chunk_pixels=self.band_pixels or self.gray.size,
+                                            executor=self.executor)
+        return np.log(magnitude * self.scale ** 2 + 1)
+
+    @cached_property
+    def edges(self):
+        return cv2.Canny(self.gray, 50, 150)
+
+
+class BlurMetric:
+    """A registered blur metric: a scoring function plus its weight in the combined score"""
+
+    def __init__(self, name, func, weight, label, scale_exponent=0):
+        self.name = name
+        self.func = func
+        self.weight = weight
+        self.label = label
+        # Raw value ~ scale ** scale_exponent when smooth content is downscaled by scale
+        self.scale_exponent = scale_exponent
+
+    def __call__(self, features):
+        return float(min(100, self.func(features)))
+
+    def score_range(self, features):
+        """
+        (low, high) estimate of the full-resolution score from features of a
+        downscaled level: the raw level score, and the same score undone by the
+        metric's scaling law. Equal at full resolution. Not a bound: detail
+        finer than the level (noise, fine texture) is lost on it.
+        """
+        raw = float(self.func(features))
+        rescaled = raw / features.scale ** self.scale_exponent
+        return float(min(100, min(raw, rescaled))), float(min(100, max(raw, rescaled)))
+
+
+BLUR_METRICS = OrderedDict()
+
+
+def register_blur_metric(name, weight, label=None, scale_exponent=0):
+    """Decorator registering a function of BlurFeatures as a blur metric"""
+    def decorator(func):
+        BLUR_METRICS[name] = BlurMetric(name, func, weight, label or name.replace('_', ' ').capitalize(),
+                                        scale_exponent)
+        return func
+    return decorator
+
+
+def as_features(image):
+    """Accept either a grayscale image or an existing BlurFeatures"""
+    return image if isinstance(image, BlurFeatures) else BlurFeatures(image)
+
+
+def unknown_blur_metrics(names):
+    """Names in `names` that are not registered"""
+    return [name for name in names if name not in BLUR_METRICS]
+
+
+def run_blur_metrics(features, names=None):
+    """Run the requested metrics (all registered ones by default) on shared features"""
+    if names is None:
+        names = list(BLUR_METRICS)
+    scores = OrderedDict()
+    for name in names:
+        # Shared features are computed by (and timed with) the first metric that needs them
+        with stage(f"blur.{name}"):
+            scores[name] = BLUR_METRICS[name](features)
+    return scores
+
+
+def weighted_blur_score(scores):
+    """Weighted average of metric scores, renormalized over the metrics that ran"""
+    total_weight = sum(BLUR_METRICS[name].weight for name in scores)
+    if total_weight == 0:
+        return 0.0
+    return sum(score * BLUR_METRICS[name].weight for name, score in scores.items()) / total_weight
+
+
+@register_blur_metric('laplacian', 0.3, 'Laplacian', scale_exponent=4)
+def laplacian_blur_score(features):
+    """Laplacian variance blur detection"""
+    return features.laplacian_variance / 10
+
+
+@register_blur_metric('sobel', 0.25, 'Sobel', scale_exponent=1)
+def sobel_blur_score(features):
+    """Sobel edge-based blur detection"""
+    return features.gradient_magnitude_mean / 2
+
+
+@register_blur_metric('fft', 0.2, 'FFT')
+def fft_blur_score(features):
+    """FFT-based blur detection"""
+    # Calculate high-frequency content
+    high_freq = features.spectrum_window
+
+    return np.mean(high_freq) * 2
+
+
+@register_blur_metric('gradient', 0.15, 'Gradient', scale_exponent=1)
+def gradient_blur_score(features):
+    """Gradient-based blur detection"""
+    return features.gradient_magnitude_mean / 3
+
+
+@register_blur_metric('edge_density', 0.1, 'Edge density', scale_exponent=1)
+def edge_density_blur_score(features):
+    """Edge density-based blur detection"""
+    edges = features.edges
+    edge_density = np.count_nonzero(edges) / (edges.shape[0] * edges.shape[1])
+    return edge_density * 1000
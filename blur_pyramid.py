@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Resolution-aware blur scoring on an image pyramid.
+
+The blur metrics are resolution dependent, so a downscaled level cannot
+reproduce the full-resolution scores; it can only estimate them. For each
+metric the level gives two estimates: the raw score on the level, and the
+same score undone by the metric's scaling law for smooth content
+(BlurMetric.scale_exponent; for example, gradients grow by 2 per level).
+For smooth content the full-resolution score usually lies between them.
+That is not a bound: pyrDown averages away sensor noise and texture finer
+than the level's pixels, so on noisy or finely textured images the
+full-resolution score can be far above both (a 12 MP frame of grey noise
+scores 53 at full resolution and 6-10 on its level). The FFT metric only
+looks at the lowest frequencies, which survive downscaling, so it is exact
+on every level.
+
+Full resolution (FULL) is therefore the default and is always exact. AUTO
+is an opt-in fast path for callers that accept approximate scores on
+images known to be smooth: score_blur() starts on the first pyramid level at
+or below max_pixels and stops there when the estimated range of the weighted
+score, widened by a margin, lies on one side of the SHARP / BLURRY threshold.
+Otherwise it moves up one level, and at full resolution the scores are
+exact. info["exact"] tells which one a result is. Images at or below
+max_pixels are always scored at full resolution.
+benchmarks/bench_blur_pyramid.py measures how far AUTO moves from FULL.
+
+    scores, info = score_blur(BlurFeatures(gray))
+"""
+import math
+from collections import OrderedDict
+
+import cv2
+
+from blur_metrics import BLUR_METRICS, BlurFeatures, run_blur_metrics, weighted_blur_score
+from instrumentation import stage
+
+FULL = 'full'
+AUTO = 'auto'
+RESOLUTIONS = (FULL, AUTO)
+
+# The web UI shows SHARP at score >= 50
+SHARP_THRESHOLD = 50
+DEFAULT_MAX_PIXELS = 4_000_000
+DEFAULT_MARGIN = 5.0
+# Never score on a level whose short side is below this
+MIN_LEVEL_SIDE = 256
+
+
+def pyramid_level_for(shape, max_pixels=DEFAULT_MAX_PIXELS, min_side=MIN_LEVEL_SIDE):
+    """Number of pyrDown steps until the image has at most max_pixels pixels"""
+    height, width = shape[:2]
+    level = 0
+    while height * width > max_pixels and min(height, width) // 2 >= min_side:
+        height, width = (height + 1) // 2, (width + 1) // 2
+        level += 1
+    return level
+
+
+def score_blur(features, names=None, resolution=FULL, max_pixels=DEFAULT_MAX_PIXELS,
+               threshold=SHARP_THRESHOLD, margin=DEFAULT_MARGIN):
+    """
+    Blur metric scores for the full-resolution features; with resolution=AUTO,
+    estimated on a pyramid level when that level decides.
+
+    Returns (scores, info). info records the level the scores come from
+    (0 = full resolution, exact), its scale, every level that was scored, and
+    the estimated range of the weighted score on that level.
+    """
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"Unknown blur resolution: {resolution}")
+    if names is None:
+        names = list(BLUR_METRICS)
+
+    start_level = pyramid_level_for(features.gray.shape, max_pixels) if resolution == AUTO else 0
+    pyramid = [features.gray]
+    with stage('blur.pyramid'):
+        for _ in range(start_level):
+            pyramid.append(cv2.pyrDown(pyramid[-1]))
+
+    full_pixels = features.gray.shape[0] * features.gray.shape[1]
+    levels_scored = []
+    for level in range(start_level, 0, -1):
+        gray = pyramid[level]
+        scale = math.sqrt(full_pixels / (gray.shape[0] * gray.shape[1]))
+        level_features = BlurFeatures(gray, scale=scale, band_pixels=features.band_pixels,
+                                      executor=features.executor)
+        with stage('blur.pyramid_level'):
+            ranges = OrderedDict((name, BLUR_METRICS[name].score_range(level_features)) for name in names)
+        low = weighted_blur_score(OrderedDict((name, bounds[0]) for name, bounds in ranges.items()))
+        high = weighted_blur_score(OrderedDict((name, bounds[1]) for name, bounds in ranges.items()))
+        levels_scored.append(level)
+
+        if low - margin >= threshold or high + margin < threshold:
+            # Decided on this level; report the middle of each metric's estimated range
+            scores = OrderedDict((name, (bounds[0] + bounds[1]) / 2) for name, bounds in ranges.items())
+            return scores, _info(resolution, level, scale, levels_scored, low, high)
+
+    scores = run_blur_metrics(features, names)
+    score = weighted_blur_score(scores)
+    return scores, _info(resolution, 0, 1.0, levels_scored + [0], score, score)
+
+
+def _info(resolution, level, scale, levels_scored, low, high):
+    return {
+        "mode": resolution,
+        "level": level,
+        "scale": round(scale, 3),
+        "levels_scored": levels_scored,
+        "exact": level == 0,
+        "score_range": [round(low, 2), round(high, 2)],
+    }
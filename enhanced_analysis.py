@@ -2,59 +2,288 @@
 # -*- coding: utf-8 -*-
 import cv2
 import numpy as np
-from PIL import Image, ImageEnhance, ImageFilter
-import pytesseract
-import base64
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from blur_map import DEFAULT_BAND_PIXELS, DEFAULT_WINDOW_SIZE, band_pixels_for, compute_blur_map
+from blur_metrics import (BLUR_METRICS, BlurFeatures, as_features,
+                          unknown_blur_metrics, weighted_blur_score)
+from blur_pyramid import FULL, RESOLUTIONS, score_blur
+from blur_regions import FACES, REGION_SOURCES, TEXT, Region, score_regions
+from face_engine import DEFAULT_PRESET, FaceEngine, check_options
+from frame_stream import DEFAULT_METRIC, DEFAULT_TOP_K, select_sharpest
+from instrumentation import propagate, stage, timed
+from ocr_backends import DEFAULT_BACKEND, DEFAULT_CONFIG, DEFAULT_LANG, make_backend
+from ocr_executor import COMPLETED, OCRExecutor
+from quality_gate import QualityGate
+from result_cache import image_digest, make_key
+from visualization import DEFAULT_OPTIONS
+
+# Analyses available through EnhancedAnalyzer.analyze
+ANALYSES = ('blur', 'face', 'ocr')
+
+
+def load_image(image):
+    """
+    Load a BGR image from a file path, encoded bytes or an already decoded array.
+    Returns None if it cannot be decoded.
+    """
+    if isinstance(image, np.ndarray):
+        return image
+    with stage('decode'):
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            return cv2.imdecode(np.frombuffer(image, np.uint8), cv2.IMREAD_COLOR)
+        return cv2.imread(str(image))
 
 class EnhancedAnalyzer:
-    def __init__(self):
-        # Load Haar cascade for face detection only
-        cascade_path = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-        self.face_cascade = cv2.CascadeClassifier(cascade_path)
+    def __init__(self, ocr_workers=4, ocr_early_exit_confidence=None, blur_resolution=FULL,
+                 face_preset=DEFAULT_PRESET, blur_band_pixels=DEFAULT_BAND_PIXELS, blur_workers=1,
+                 ocr_backend=DEFAULT_BACKEND, quality_gate=None):
+        # Haar cascade face detection on a downscaled image, preset per request (see face_engine)
+        self.face_engine = FaceEngine(preset=face_preset)
+        
+        # OCR preprocessing variants run concurrently, optionally stopping at the first confident pass
+        self.ocr_executor = OCRExecutor(max_workers=ocr_workers, early_exit_confidence=ocr_early_exit_confidence)
+        
+        # Resident tesseract engines when tesserocr is installed, else a tesseract process per pass
+        self.ocr_backend = make_backend(ocr_backend, pool_size=ocr_workers)
+        
+        # Blur scores are exact ('full') unless 'auto' opts in to pyramid estimates (see blur_pyramid)
+        if blur_resolution not in RESOLUTIONS:
+            raise ValueError(f"Unknown blur resolution: {blur_resolution}")
+        self.blur_resolution = blur_resolution
+        
+        # Blur derivatives and the blur map are computed in bands of this many pixels (None: whole image)
+        self.blur_band_pixels = blur_band_pixels
+        
+        # With several workers the bands of one blur request run on a shared thread pool
+        if blur_workers < 1:
+            raise ValueError("blur_workers must be at least 1")
+        self.blur_workers = blur_workers
+        self.blur_executor = (ThreadPoolExecutor(max_workers=blur_workers, thread_name_prefix='blur')
+                              if blur_workers > 1 else None)
+        
+        # Hopelessly blurry, tiny or badly exposed images skip OCR and face detection (QualityGate options,
+        # None to disable; see quality_gate)
+        self.quality_gate = QualityGate(**quality_gate) if quality_gate is not None else None
+        
+    def analyze(self, image, analyses=ANALYSES, blur_methods=None, early_exit_confidence=None, output=None,
+                cache=None, blur_resolution=None, blur_regions=None, face_options=None):
+        """
+        Run several analyses on one image with a single decode and grayscale conversion
+
+        Independent analyses run concurrently. Returns {"results": {name: result},
+        "timings_ms": {stage: milliseconds}}; a failing analysis reports its own
+        "error" entry without affecting the others. output is a
+        VisualizationOptions applied to every visualization. With a
+        ResultCache each analysis is looked up by image content first, and
+        "cache" reports hit/miss per analysis. blur_regions switches the blur
+        stage to region-of-interest scoring (see analyze_region_blur).
+        face_options: face detection preset and overrides (see
+        analyze_human_detection), also used for 'faces' blur regions. With a quality gate, the image is checked
+        once and a rejected image skips the gated analyses.
+        """
+        analyses = list(dict.fromkeys(analyses))
+        unknown = [name for name in analyses if name not in ANALYSES]
+        if unknown:
+            return {"error": f"Unknown analysis type(s): {', '.join(unknown)}"}
+        
+        timings = {}
+        started = time.perf_counter()
+        
+        # Load image once (path, encoded bytes or decoded array)
+        image = load_image(image)
+        if image is None:
+            return {"error": "Could not load image"}
+        timings['decode'] = (time.perf_counter() - started) * 1000
+        
+        # Grayscale once for the analyses that need it
+        gray = None
+        if 'blur' in analyses or 'face' in analyses:
+            stage_start = time.perf_counter()
+            with stage('grayscale'):
+                gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            timings['grayscale'] = (time.perf_counter() - stage_start) * 1000
+        
+        # One quality gate check shared by the gated analyses
+        quality = None
+        if self.quality_gate is not None and any(self.quality_gate.gates(name) for name in analyses):
+            quality = self.quality_gate.check(image if gray is None else gray)
+            timings['quality_gate'] = quality['check_ms']
+        
+        runners = {
+            'blur': lambda: self.analyze_blur_detection(image, methods=blur_methods, gray=gray, output=output,
+                                                        resolution=blur_resolution, regions=blur_regions,
+                                                        face_options=face_options),
+            'face': lambda: self.analyze_human_detection(image, gray=gray, output=output, quality=quality,
+                                                         **(face_options or {})),
+            'ocr': lambda: self.analyze_ocr(image, early_exit_confidence=early_exit_confidence, output=output,
+                                            quality=quality),
+        }
+        
+        output = output or DEFAULT_OPTIONS
+        use_cache = cache is not None and output.cacheable
+        if use_cache:
+            stage_start = time.perf_counter()
+            digest = image_digest(image)
+            timings['hash'] = (time.perf_counter() - stage_start) * 1000
+            params = {
+                'blur': {'methods': blur_methods, 'resolution': blur_resolution or self.blur_resolution,
+                         'regions': blur_regions},
+                'face': dict({'preset': self.face_engine.preset}, **(face_options or {})),
+                'ocr': {'early_exit_confidence': early_exit_confidence},
+            }
+            if blur_regions is not None and FACES in blur_regions:
+                # Face regions depend on the face detection options too
+                params['blur']['face_options'] = dict(params['face'])
+            for name in params:
+                if self.quality_gate is not None and self.quality_gate.gates(name):
+                    params[name]['quality_gate'] = self.quality_gate.params()
+        cache_status = {}
+        
+        def run_stage(name):
+            stage_start = time.perf_counter()
+            try:
+                if use_cache:
+                    key = make_key(digest, name, dict(params[name], output=output.cache_params()))
+                    result, hit = cache.get_or_compute(key, runners[name])
+                    cache_status[name] = 'hit' if hit else 'miss'
+                else:
+                    result = runners[name]()
+            except Exception as e:
+                result = {"error": f"{name} error: {str(e)}"}
+            return result, (time.perf_counter() - stage_start) * 1000
+        
+        if len(analyses) > 1:
+            with ThreadPoolExecutor(max_workers=len(analyses), thread_name_prefix='analyze') as pool:
+                futures = [pool.submit(propagate(run_stage), name) for name in analyses]
+                outcomes = dict(zip(analyses, (future.result() for future in futures)))
+        else:
+            outcomes = {name: run_stage(name) for name in analyses}
+        
+        results = {}
+        for name in analyses:
+            results[name], timings[name] = outcomes[name]
+        timings['total'] = (time.perf_counter() - started) * 1000
+        
+        analysis = {
+            "results": results,
+            "timings_ms": {stage: round(ms, 2) for stage, ms in timings.items()}
+        }
+        if use_cache:
+            analysis["cache"] = cache_status
+        return analysis
+    
+    def analyze_frames(self, frames, top_k=DEFAULT_TOP_K, metric=DEFAULT_METRIC, analyses=ANALYSES, output=None,
+                       **options):
+        """
+        Full analysis of only the sharpest frames of a clip or burst
+
+        frames: iterable of frame_stream.Frame (iter_video_frames /
+        iter_image_frames), consumed once with at most top_k frames in memory
+        metric: cheap blur metric used to rank every frame
+        options: passed to analyze() for each selected frame (blur_methods,
+        early_exit_confidence, cache, blur_resolution, blur_regions, face_options)
+        """
+        unknown = [name for name in analyses if name not in ANALYSES]
+        if unknown:
+            return {"error": f"Unknown analysis type(s): {', '.join(unknown)}"}
+        
+        started = time.perf_counter()
+        try:
+            best, stats = select_sharpest(frames, top_k, metric)
+        except ValueError as e:
+            return {"error": str(e)}
+        select_ms = (time.perf_counter() - started) * 1000
+        if not best:
+            return {"error": "No decodable frames"}
+        
+        output = output or DEFAULT_OPTIONS
+        top_frames = []
+        for frame in best:
+            analysis = self.analyze(frame.image, analyses=analyses, output=output, **options)
+            if "error" in analysis:
+                return analysis
+            entry = {
+                "index": frame.index,
+                "timestamp_ms": frame.timestamp_ms,
+                "sharpness": round(frame.sharpness, 2),
+                "image": output.encode(frame.image) if output.enabled else None,
+                "results": analysis["results"],
+                "timings_ms": analysis["timings_ms"]
+            }
+            if "cache" in analysis:
+                entry["cache"] = analysis["cache"]
+            top_frames.append(entry)
         
-    def analyze_ocr(self, image_path):
+        for key in ('min_sharpness', 'max_sharpness'):
+            stats[key] = round(stats[key], 2)
+        return {
+            "metric": metric,
+            "frames": stats,
+            "best_index": best[0].index,
+            "top_frames": top_frames,
+            "timings_ms": {
+                "select": round(select_ms, 2),
+                "total": round((time.perf_counter() - started) * 1000, 2)
+            }
+        }
+    
+    def analyze_ocr(self, image, early_exit_confidence=None, output=None, quality=None):
         """
         Enhanced OCR analysis targeting black text on green ID card background
+
+        image: file path, encoded image bytes or a decoded BGR array
+
+        early_exit_confidence: stop starting new variants once one reaches
+        this confidence (defaults to the analyzer setting)
+        output: VisualizationOptions (inline JPEG by default)
+        quality: optional precomputed quality gate verdict of the image
         """
-        # Load image
-        image = cv2.imread(image_path)
+        # Load image (path, encoded bytes or decoded array)
+        image = load_image(image)
         if image is None:
             return {"error": "Could not load image"}
         
-        # Convert to RGB for PIL operations
-        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        pil_image = Image.fromarray(image_rgb)
+        # Hopeless inputs skip the tesseract passes
+        rejected = self._quality_gate_rejection('ocr', image, quality=quality)
+        if rejected is not None:
+            return rejected
+        started = time.perf_counter()
         
         try:
-            # Multiple OCR attempts with black text targeting
-            ocr_results = []
-            
-            # 1. Black text extraction
-            black_text_pil = self._extract_black_text(pil_image)
-            ocr_results.append(self._run_ocr_with_config(black_text_pil, 'eng+urd', '--oem 3 --psm 6'))
-            
-            # 2. Enhanced contrast for black text
-            enhanced_black_pil = self._enhance_black_text_for_ocr(pil_image)
-            ocr_results.append(self._run_ocr_with_config(enhanced_black_pil, 'eng+urd', '--oem 3 --psm 6'))
+            # Black text is extracted once and every variant is built from it
+            with stage('ocr.black_text'):
+                black_text = self._extract_black_text(image)
             
-            # 3. Denoised black text
-            denoised_black_pil = self._denoise_black_text(pil_image)
-            ocr_results.append(self._run_ocr_with_config(denoised_black_pil, 'eng+urd', '--oem 3 --psm 6'))
-            
-            # 4. Sharpened black text
-            sharpened_black_pil = self._sharpen_black_text(pil_image)
-            ocr_results.append(self._run_ocr_with_config(sharpened_black_pil, 'eng+urd', '--oem 3 --psm 6'))
+            # Multiple OCR attempts with black text targeting
+            variants = [
+                # 1. Black text extraction
+                ("black_text", lambda: black_text),
+                # 2. Enhanced contrast for black text
+                ("enhanced", lambda: self._enhance_black_text_for_ocr(black_text)),
+                # 3. Denoised black text
+                ("denoised", lambda: self._denoise_black_text(black_text)),
+                # 4. Sharpened black text
+                ("sharpened", lambda: self._sharpen_black_text(black_text)),
+            ]
+            if early_exit_confidence is None:
+                early_exit_confidence = self.ocr_executor.early_exit_confidence
+            attempts = self.ocr_executor.run(
+                variants, lambda img: self._run_ocr_with_config(img, DEFAULT_LANG, DEFAULT_CONFIG),
+                early_exit_confidence=early_exit_confidence)
+            ocr_results = [attempt['result'] for attempt in attempts if attempt['status'] == COMPLETED]
             
             # Find best OCR result
             best_result = max(ocr_results, key=lambda x: x['confidence'])
             
             # Create OCR visualization highlighting black text regions
-            ocr_visualization = self._create_black_text_ocr_visualization(image, best_result)
+            ocr_visualization = self._create_black_text_ocr_visualization(image, best_result, black_text, output)
             
             # Language detection
             language_info = self._detect_languages(best_result['text'])
             
-            return {
+            result = {
                 "score": round(best_result['confidence'], 2),
                 "confidence": round(best_result['confidence'], 2),
                 "text_found": best_result['text_found'],
@@ -63,87 +292,242 @@ class EnhancedAnalyzer:
                 "language_info": language_info,
                 "visualization": ocr_visualization,
                 "details": f"Found {best_result['text_count']} black text elements with {best_result['confidence']:.1f}% avg confidence {language_info}",
-                "all_attempts": [r['confidence'] for r in ocr_results]
+                "all_attempts": [self._summarize_ocr_attempt(attempt) for attempt in attempts],
+                "variant_latency_ms": {attempt['variant']: round(attempt['latency_ms'], 1)
+                                       for attempt in attempts if attempt['status'] == COMPLETED}
             }
+            if self.quality_gate is not None:
+                self.quality_gate.record_run('ocr', (time.perf_counter() - started) * 1000)
+            return result
             
         except Exception as e:
             return {"error": f"OCR error: {str(e)}"}
     
-    def analyze_human_detection(self, image_path):
+    def _quality_gate_rejection(self, analysis, image, quality=None):
+        """The result replacing `analysis` when the quality gate rejects the image, or None to run it"""
+        gate = self.quality_gate
+        if gate is None or not gate.gates(analysis):
+            return None
+        if quality is None:
+            quality = gate.check(image)
+        if quality['passed']:
+            return None
+        gate.record_skip(analysis)
+        
+        # The analysis' usual fields, empty, so clients can treat it like a result with nothing found
+        empty = {
+            'ocr': {"score": 0, "confidence": 0, "text_found": False, "text_count": 0, "detected_text": "",
+                    "language_info": "", "all_attempts": [], "variant_latency_ms": {}},
+            'face': {"human_detected": False, "confidence": 0, "face_count": 0, "total_detections": 0,
+                     "faces": [], "detection": None},
+        }
+        return dict(empty.get(analysis, {}), visualization=None, rejected=quality,
+                    details=f"Skipped by the quality gate: image is {quality['details']}")
+    
+    def _summarize_ocr_attempt(self, attempt):
+        """Per-variant entry for all_attempts: which variants ran, their confidence and latency"""
+        ran = attempt['status'] == COMPLETED
+        return {
+            "variant": attempt['variant'],
+            "status": attempt['status'],
+            "confidence": round(float(attempt['confidence']), 2) if ran else None,
+            "latency_ms": round(attempt['latency_ms'], 1) if ran else None
+        }
+    
+    def analyze_human_detection(self, image, gray=None, output=None, preset=None, quality=None, **detection):
         """
         Face detection with visualization
+
+        image: file path, encoded image bytes or a decoded BGR array
+        gray: optional precomputed grayscale of the image
+        output: VisualizationOptions (inline JPEG by default)
+        preset: 'fast', 'balanced' or 'accurate' (defaults to the analyzer setting)
+        quality: optional precomputed quality gate verdict of the image
+        detection: scale_factor, min_neighbors, min_face, max_face overrides
         """
-        # Load image
-        image = cv2.imread(image_path)
+        try:
+            check_options(preset, **detection)
+        except (TypeError, ValueError) as e:
+            return {"error": f"Invalid face detection options: {str(e)}"}
+        
+        # Load image (path, encoded bytes or decoded array)
+        image = load_image(image)
         if image is None:
             return {"error": "Could not load image"}
         
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        if gray is None:
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
         
-        # Face detection only
-        faces = self.face_cascade.detectMultiScale(gray, 1.1, 5, minSize=(20, 20))
+        # Hopeless inputs skip face detection
+        rejected = self._quality_gate_rejection('face', gray, quality=quality)
+        if rejected is not None:
+            return rejected
+        started = time.perf_counter()
+        
+        # Face detection only (on a downscaled copy, boxes in original coordinates)
+        faces, params = self.face_engine.detect(gray, preset, **detection)
         
         # Calculate confidence based on face detection
         confidence = self._calculate_face_confidence(faces, image.shape)
         
-        # Create visualization
-        vis_image = image.copy()
-        
-        # Draw bounding boxes for detected faces
-        for (x, y, w, h) in faces:
-            cv2.rectangle(vis_image, (x, y), (x+w, y+h), (0, 255, 0), 2)  # Green for faces
-            cv2.putText(vis_image, "Face", (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+        output = output or DEFAULT_OPTIONS
+        vis_b64 = None
+        if output.enabled:
+            # Create visualization
+            vis_image = image.copy()
+            
+            # Draw bounding boxes for detected faces
+            for (x, y, w, h) in faces:
+                cv2.rectangle(vis_image, (x, y), (x+w, y+h), (0, 255, 0), 2)  # Green for faces
+                cv2.putText(vis_image, "Face", (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+            
+            # Encode (base64 data URI or stored URL)
+            vis_b64 = output.encode(vis_image)
         
-        # Convert to base64
-        _, buffer = cv2.imencode('.jpg', vis_image)
-        vis_b64 = f"data:image/jpeg;base64,{base64.b64encode(buffer).decode('utf-8')}"
+        if self.quality_gate is not None:
+            self.quality_gate.record_run('face', (time.perf_counter() - started) * 1000)
         
         return {
             "human_detected": len(faces) > 0,
             "confidence": round(confidence, 2),
             "face_count": len(faces),
             "total_detections": len(faces),
+            "faces": faces.tolist(),
+            "detection": params,
             "visualization": vis_b64,
             "details": self._generate_face_detection_details(faces, confidence)
         }
     
-    def analyze_blur_detection(self, image_path):
+    def _detect_faces(self, gray, face_options=None):
+        """Face rectangles (x, y, w, h), with the analyzer's default preset unless face_options say otherwise"""
+        return self.face_engine.detect(gray, **(face_options or {}))[0]
+    
+    def _detect_text_boxes(self, image):
+        """Word boxes (x, y, w, h) from one OCR pass over the extracted black text"""
+        result = self._run_ocr_with_config(self._extract_black_text(image), DEFAULT_LANG, DEFAULT_CONFIG)
+        return [(x, y, w, h) for (x, y, w, h, _, _) in result['boxes']]
+    
+    def analyze_blur_detection(self, image, methods=None, gray=None, output=None, resolution=None, regions=None,
+                               face_options=None):
         """
         Enhanced blur detection with blur map visualization
+
+        image: file path, encoded image bytes or a decoded BGR array
+        methods: optional list of metric names from BLUR_METRICS to run;
+        all registered metrics run when omitted.
+        gray: optional precomputed grayscale of the image
+        output: VisualizationOptions (inline JPEG by default); the blur map
+        is not computed at all when visualizations are off
+        resolution: 'full' always scores at full resolution; 'auto' estimates
+        the scores of large images on a pyramid level (approximate, see
+        blur_pyramid) and only escalates near the SHARP / BLURRY threshold
+        (defaults to the analyzer setting)
+        regions: score only these regions instead of the whole frame (see
+        analyze_region_blur); the full-frame metrics and blur map are skipped
+        face_options: face detection preset and overrides for 'faces' regions
         """
-        # Load image
-        image = cv2.imread(image_path)
+        if regions is not None:
+            return self.analyze_region_blur(image, regions, methods=methods, gray=gray, face_options=face_options)
+        
+        if methods is not None:
+            unknown = unknown_blur_metrics(methods)
+            if unknown:
+                return {"error": f"Unknown blur method(s): {', '.join(unknown)}"}
+        resolution = resolution or self.blur_resolution
+        if resolution not in RESOLUTIONS:
+            return {"error": f"Unknown blur resolution: {resolution}"}
+        
+        # Load image (path, encoded bytes or decoded array)
+        image = load_image(image)
         if image is None:
             return {"error": "Could not load image"}
         
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        if gray is None:
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
         
-        # Multiple blur detection methods
-        methods = {
-            "laplacian": self._laplacian_blur_detection(gray),
-            "sobel": self._sobel_blur_detection(gray),
-            "fft": self._fft_blur_detection(gray),
-            "gradient": self._gradient_blur_detection(gray),
-            "edge_density": self._edge_density_blur_detection(gray)
-        }
+        # Features are computed once (in bands) and shared by every metric
+        features = BlurFeatures(gray, band_pixels=band_pixels_for(gray.size, self.blur_band_pixels, self.blur_workers),
+                                executor=self.blur_executor)
+        
+        # Multiple blur detection methods, on a pyramid level when that decides
+        methods, resolution_info = score_blur(features, methods, resolution)
         
         # Calculate weighted average
-        weights = {"laplacian": 0.3, "sobel": 0.25, "fft": 0.2, "gradient": 0.15, "edge_density": 0.1}
-        weighted_score = sum(methods[method] * weights[method] for method in methods)
+        weighted_score = weighted_blur_score(methods)
         
         # Create blur map visualization
-        blur_map = self._create_blur_map(gray)
+        output = output or DEFAULT_OPTIONS
+        blur_map = self._create_blur_map(features, output=output) if output.enabled else None
         
         return {
             "score": round(weighted_score, 2),
-            "methods": methods,
+            "methods": dict(methods),
             "blur_map": blur_map,
-            "details": f"Multi-method blur analysis: Laplacian={methods['laplacian']:.1f}, Sobel={methods['sobel']:.1f}, FFT={methods['fft']:.1f}"
+            "details": self._generate_blur_details(methods),
+            "resolution": resolution_info
         }
     
-    def _run_ocr_with_config(self, pil_image, lang, config):
-        """Run OCR with specific configuration"""
-        ocr_data = pytesseract.image_to_data(pil_image, output_type=pytesseract.Output.DICT, config=config, lang=lang)
+    def analyze_region_blur(self, image, regions, methods=None, gray=None, face_options=None):
+        """
+        Blur scores for regions of interest and a combined verdict
+
+        regions: any mix of 'faces' (detected face boxes), 'text' (OCR word
+        boxes) and (x, y, w, h) rectangles in image coordinates. The verdict
+        is 'sharp' only when every region is; score is the weakest region's.
+        Only the regions are scored, so the cost follows their area.
+        face_options: preset and overrides for the 'faces' detection (see
+        analyze_human_detection)
+        """
+        regions = list(regions)
+        sources = [region for region in regions if isinstance(region, str)]
+        unknown = [source for source in sources if source not in REGION_SOURCES]
+        if unknown:
+            return {"error": f"Unknown blur region source(s): {', '.join(unknown)}"}
+        rects = [region for region in regions if not isinstance(region, str)]
+        if any(len(rect) != 4 or rect[2] <= 0 or rect[3] <= 0 for rect in rects):
+            return {"error": "Blur regions must be (x, y, width, height) with positive size"}
+        if methods is not None:
+            unknown = unknown_blur_metrics(methods)
+            if unknown:
+                return {"error": f"Unknown blur method(s): {', '.join(unknown)}"}
+        try:
+            check_options(**(face_options or {}))
+        except (TypeError, ValueError) as e:
+            return {"error": f"Invalid face detection options: {str(e)}"}
+        
+        # Load image (path, encoded bytes or decoded array)
+        image = load_image(image)
+        if image is None:
+            return {"error": "Could not load image"}
+        
+        if gray is None:
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        
+        boxes = [Region('rect', tuple(rect)) for rect in rects]
+        if FACES in sources:
+            boxes += [Region('face', tuple(face)) for face in self._detect_faces(gray, face_options)]
+        if TEXT in sources:
+            boxes += [Region('text', box) for box in self._detect_text_boxes(image)]
+        
+        result = score_regions(gray, boxes, methods)
+        if result["region_count"]:
+            details = (f"Region blur analysis: {result['sharp_regions']}/{result['region_count']} regions sharp, "
+                       f"weakest {result['score']:.1f}")
+        else:
+            details = "Region blur analysis: no regions found to score"
+        result.update(blur_map=None, details=details)
+        return result
+    
+    def _generate_blur_details(self, methods):
+        """Generate blur analysis description from the metrics that ran"""
+        # The full run keeps the original three-method summary; subsets list every metric that ran
+        shown = ("laplacian", "sobel", "fft") if len(methods) == len(BLUR_METRICS) else list(methods)
+        summary = ", ".join(f"{BLUR_METRICS[name].label}={methods[name]:.1f}" for name in shown)
+        return f"Multi-method blur analysis: {summary}"
+    
+    def _run_ocr_with_config(self, image, lang, config):
+        """Run OCR with specific configuration (image is a uint8 NumPy array)"""
+        ocr_data = self.ocr_backend.image_to_data(image, lang, config)
         
         if not ocr_data['text'] or all(text.strip() == '' for text in ocr_data['text']):
             return {"confidence": 0, "text_found": False, "text_count": 0, "text": "", "boxes": []}
@@ -178,13 +562,10 @@ class EnhancedAnalyzer:
             "boxes": boxes
         }
     
-    def _extract_black_text(self, pil_image):
-        """Extract black text regions from green ID card background"""
-        # Convert to numpy array
-        img_array = np.array(pil_image)
-        
+    def _black_text_mask(self, image):
+        """Mask of black text pixels on a green ID card background (BGR input)"""
         # Convert to HSV for better color segmentation
-        hsv = cv2.cvtColor(img_array, cv2.COLOR_RGB2HSV)
+        hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
         
         # Define black color range (low saturation, low value)
         lower_black = np.array([0, 0, 0])
@@ -198,72 +579,55 @@ class EnhancedAnalyzer:
         black_mask = cv2.morphologyEx(black_mask, cv2.MORPH_CLOSE, kernel)
         black_mask = cv2.morphologyEx(black_mask, cv2.MORPH_OPEN, kernel)
         
-        # Create white background with black text
-        result = np.ones_like(img_array) * 255  # White background
-        result[black_mask == 255] = [0, 0, 0]   # Black text
-        
-        return Image.fromarray(result)
+        return black_mask
+    
+    def _extract_black_text(self, image):
+        """Extract black text from green ID card background as a grayscale image"""
+        # White background with black text, straight from the inverted mask
+        return cv2.bitwise_not(self._black_text_mask(image))
     
-    def _enhance_black_text_for_ocr(self, pil_image):
+    def _enhance_black_text_for_ocr(self, black_text):
         """Enhance black text specifically for OCR on ID cards"""
-        # Extract black text first
-        black_text_pil = self._extract_black_text(pil_image)
-        
-        # Convert to grayscale
-        gray = black_text_pil.convert('L')
-        
         # Apply adaptive threshold to make text more prominent
-        gray_array = np.array(gray)
-        adaptive_thresh = cv2.adaptiveThreshold(gray_array, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
+        adaptive_thresh = cv2.adaptiveThreshold(black_text, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
         
         # Invert to get black text on white background
-        inverted = cv2.bitwise_not(adaptive_thresh)
-        
-        return Image.fromarray(inverted)
+        return cv2.bitwise_not(adaptive_thresh)
     
-    def _denoise_black_text(self, pil_image):
+    def _denoise_black_text(self, black_text):
         """Apply denoising specifically for black text"""
-        # Extract black text first
-        black_text_pil = self._extract_black_text(pil_image)
-        
-        # Convert to numpy array
-        img_array = np.array(black_text_pil)
-        
         # Apply bilateral filter for edge-preserving denoising
-        denoised = cv2.bilateralFilter(img_array, 9, 75, 75)
-        
-        # Apply morphological operations to clean up text
-        kernel = np.ones((1, 1), np.uint8)
-        denoised = cv2.morphologyEx(denoised, cv2.MORPH_CLOSE, kernel)
-        
-        return Image.fromarray(denoised)
+        return cv2.bilateralFilter(black_text, 9, 75, 75)
     
-    def _sharpen_black_text(self, pil_image):
-        """Apply sharpening specifically for black text"""
-        # Extract black text first
-        black_text_pil = self._extract_black_text(pil_image)
-        
-        # Apply unsharp mask
-        sharpened = black_text_pil.filter(ImageFilter.UnsharpMask(radius=1, percent=200, threshold=2))
-        
-        return sharpened
+    def _sharpen_black_text(self, black_text, sigma=1.0, amount=2.0, threshold=2):
+        """Apply sharpening specifically for black text (unsharp mask)"""
+        # Same rule as PIL's UnsharpMask: only differences above the threshold are boosted
+        blurred = cv2.GaussianBlur(black_text, (0, 0), sigma)
+        diff = cv2.subtract(black_text, blurred, dtype=cv2.CV_16S)
+        sharpened = cv2.addWeighted(black_text, 1.0, diff, amount, 0, dtype=cv2.CV_16S)
+        sharpened = np.where(np.abs(diff) >= threshold, sharpened, black_text)
+        return np.clip(sharpened, 0, 255).astype(np.uint8)
     
-    def _create_black_text_ocr_visualization(self, image, ocr_result):
+    @timed('ocr.visualization')
+    def _create_black_text_ocr_visualization(self, image, ocr_result, black_text=None, output=None):
         """Create OCR visualization highlighting black text regions"""
+        output = output or DEFAULT_OPTIONS
+        if not output.enabled:
+            return None
+        
         vis_image = image.copy()
         
         if not ocr_result['text_found']:
             # If no text found, show black text extraction
-            black_text_pil = self._extract_black_text(Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB)))
-            black_text_array = np.array(black_text_pil)
-            black_text_bgr = cv2.cvtColor(black_text_array, cv2.COLOR_RGB2BGR)
+            if black_text is None:
+                black_text = self._extract_black_text(image)
+            black_text_bgr = cv2.cvtColor(black_text, cv2.COLOR_GRAY2BGR)
             
             # Add overlay text
             cv2.putText(black_text_bgr, "No black text detected", (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
             
-            # Convert to base64
-            _, buffer = cv2.imencode('.jpg', black_text_bgr)
-            return f"data:image/jpeg;base64,{base64.b64encode(buffer).decode('utf-8')}"
+            # Encode (base64 data URI or stored URL)
+            return output.encode(black_text_bgr)
         else:
             # Draw bounding boxes for detected black text
             for box in ocr_result['boxes']:
@@ -288,9 +652,8 @@ class EnhancedAnalyzer:
             cv2.putText(vis_image, "Black Text Detection", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
             cv2.putText(vis_image, "Green ID Card Background", (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
         
-        # Convert to base64
-        _, buffer = cv2.imencode('.jpg', vis_image)
-        return f"data:image/jpeg;base64,{base64.b64encode(buffer).decode('utf-8')}"
+        # Encode (base64 data URI or stored URL)
+        return output.encode(vis_image)
     
     def _detect_languages(self, text):
         """Enhanced language detection"""
@@ -315,66 +678,37 @@ class EnhancedAnalyzer:
     
     def _laplacian_blur_detection(self, gray):
         """Laplacian variance blur detection"""
-        laplacian_var = cv2.Laplacian(gray, cv2.CV_64F).var()
-        return min(100, (laplacian_var / 10))
+        return BLUR_METRICS["laplacian"](as_features(gray))
     
     def _sobel_blur_detection(self, gray):
         """Sobel edge-based blur detection"""
-        sobel_x = cv2.Sobel(gray, cv2.CV_64F, 1, 0, ksize=3)
-        sobel_y = cv2.Sobel(gray, cv2.CV_64F, 0, 1, ksize=3)
-        sobel_magnitude = np.sqrt(sobel_x**2 + sobel_y**2)
-        return min(100, np.mean(sobel_magnitude) / 2)
+        return BLUR_METRICS["sobel"](as_features(gray))
     
     def _fft_blur_detection(self, gray):
         """FFT-based blur detection"""
-        # Apply FFT
-        f_transform = np.fft.fft2(gray)
-        f_shift = np.fft.fftshift(f_transform)
-        magnitude_spectrum = np.log(np.abs(f_shift) + 1)
-        
-        # Calculate high-frequency content
-        rows, cols = gray.shape
-        crow, ccol = rows//2, cols//2
-        high_freq = magnitude_spectrum[crow-30:crow+30, ccol-30:ccol+30]
-        
-        return min(100, np.mean(high_freq) * 2)
+        return BLUR_METRICS["fft"](as_features(gray))
     
     def _gradient_blur_detection(self, gray):
         """Gradient-based blur detection"""
-        grad_x = cv2.Sobel(gray, cv2.CV_64F, 1, 0, ksize=3)
-        grad_y = cv2.Sobel(gray, cv2.CV_64F, 0, 1, ksize=3)
-        gradient_magnitude = np.sqrt(grad_x**2 + grad_y**2)
-        return min(100, np.mean(gradient_magnitude) / 3)
+        return BLUR_METRICS["gradient"](as_features(gray))
     
     def _edge_density_blur_detection(self, gray):
         """Edge density-based blur detection"""
-        edges = cv2.Canny(gray, 50, 150)
-        edge_density = np.sum(edges > 0) / (edges.shape[0] * edges.shape[1])
-        return min(100, edge_density * 1000)
+        return BLUR_METRICS["edge_density"](as_features(gray))
     
-    def _create_blur_map(self, gray):
-        """Create detailed blur map visualization"""
-        # Create local blur map using sliding window
-        height, width = gray.shape
-        blur_map = np.zeros((height, width))
-        window_size = 15
-        
-        for i in range(0, height - window_size, window_size//2):
-            for j in range(0, width - window_size, window_size//2):
-                window = gray[i:i+window_size, j:j+window_size]
-                laplacian_var = cv2.Laplacian(window, cv2.CV_64F).var()
-                blur_value = min(255, max(0, 255 - (laplacian_var / 2)))
-                blur_map[i:i+window_size, j:j+window_size] = blur_value
-        
-        # Normalize and convert to uint8
-        blur_map = np.uint8(blur_map)
+    @timed('blur.map')
+    def _create_blur_map(self, gray, window_size=DEFAULT_WINDOW_SIZE, stride=None, output=None):
+        """Create detailed blur map visualization (gray may be a BlurFeatures)"""
+        # Local blur map from per-window Laplacian variance (integral images, in bands)
+        features = as_features(gray)
+        blur_map = compute_blur_map(features.gray, window_size=window_size, stride=stride,
+                                    band_pixels=features.band_pixels, executor=features.executor)
         
         # Apply colormap for better visualization
         blur_map_colored = cv2.applyColorMap(blur_map, cv2.COLORMAP_JET)
         
-        # Convert to base64
-        _, buffer = cv2.imencode('.jpg', blur_map_colored)
-        return f"data:image/jpeg;base64,{base64.b64encode(buffer).decode('utf-8')}"
+        # Encode (base64 data URI or stored URL)
+        return (output or DEFAULT_OPTIONS).encode(blur_map_colored)
     
     def _calculate_face_confidence(self, faces, image_shape):
         """Calculate confidence based on face detection"""
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Haar cascade face detection on a downscaled image, tunable per request.
+
+detectMultiScale(gray, 1.1, 5, minSize=(20, 20)) on a full-resolution 12 MP
+photo scans dozens of pyramid levels, most of them looking for faces far
+smaller than any real subject. FaceEngine derives the smallest face worth
+finding from the image (min_face: a fraction of the shorter side, never
+below MIN_FACE_PIXELS). It then downscales the image so that this face
+lands just above the cascade's 24x24 window, detects there, and maps the
+boxes back to original coordinates:
+
+    engine = FaceEngine()
+    faces, info = engine.detect(gray)                      # 'balanced'
+    faces, info = engine.detect(gray, preset='fast')
+    faces, info = engine.detect(gray, preset='accurate', min_neighbors=3, max_face=800)
+
+Presets (individual parameters override them; sizes are in original pixels):
+
+    fast        scale_factor 1.2, min_neighbors 4, faces >= 8% of the shorter side,
+                detected at the cascade window size
+    balanced    scale_factor 1.1, min_neighbors 5, faces >= 4%, 1.25x the window
+    accurate    scale_factor 1.1, min_neighbors 5, faces >= 2%, 1.5x the window
+
+CascadeClassifier is not safe to call from several threads at once. Instead
+of serialising every request on one lock, the engine keeps a small cache of
+loaded classifiers and lends one to each concurrent detection.
+"""
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+
+from instrumentation import stage
+
+DEFAULT_CASCADE = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+
+FAST = 'fast'
+BALANCED = 'balanced'
+ACCURATE = 'accurate'
+
+# Faces are never looked for below this size, whatever the image size
+MIN_FACE_PIXELS = 20
+
+# min_face_fraction: smallest face as a fraction of the shorter image side
+# detect_margin: how many times the cascade window the smallest face is after downscaling
+FacePreset = namedtuple('FacePreset', ['scale_factor', 'min_neighbors', 'min_face_fraction', 'detect_margin'])
+
+PRESETS = {
+    FAST: FacePreset(scale_factor=1.2, min_neighbors=4, min_face_fraction=0.08, detect_margin=1.0),
+    BALANCED: FacePreset(scale_factor=1.1, min_neighbors=5, min_face_fraction=0.04, detect_margin=1.25),
+    ACCURATE: FacePreset(scale_factor=1.1, min_neighbors=5, min_face_fraction=0.02, detect_margin=1.5),
+}
+DEFAULT_PRESET = BALANCED
+
+# Per-request parameters accepted next to the preset
+OPTIONS = ('preset', 'scale_factor', 'min_neighbors', 'min_face', 'max_face')
+
+
+def check_options(preset=None, scale_factor=None, min_neighbors=None, min_face=None, max_face=None):
+    """Validate per-request detection options; raises ValueError"""
+    if preset is not None and preset not in PRESETS:
+        raise ValueError(f"Unknown face preset: {preset} (use {', '.join(PRESETS)})")
+    if scale_factor is not None and scale_factor <= 1:
+        raise ValueError("scale_factor must be greater than 1")
+    if min_neighbors is not None and (min_neighbors < 0 or int(min_neighbors) != min_neighbors):
+        raise ValueError("min_neighbors must be a non-negative integer")
+    if min_face is not None and min_face <= 0:
+        raise ValueError("min_face must be positive")
+    if max_face is not None and (max_face <= 0 or (min_face is not None and max_face < min_face)):
+        raise ValueError("max_face must be positive and not below min_face")
+
+
+def detection_params(shape, preset=DEFAULT_PRESET, scale_factor=None, min_neighbors=None, min_face=None,
+                     max_face=None, window=24):
+    """
+    detectMultiScale parameters for an image of this shape.
+
+    Returns a dict with the effective scale_factor, min_neighbors, min_face
+    and max_face (original pixels, max_face None for unbounded) and
+    detect_scale, the factor the image is resized by before detection
+    (unrounded; FaceEngine.detect reports it rounded).
+    """
+    check_options(preset, scale_factor, min_neighbors, min_face, max_face)
+    settings = PRESETS[preset]
+    height, width = shape[:2]
+    if min_face is None:
+        min_face = max(MIN_FACE_PIXELS, settings.min_face_fraction * min(height, width))
+    # The smallest face should still cover the cascade window after resizing
+    detect_scale = min(1.0, window * settings.detect_margin / min_face)
+    return {
+        "preset": preset,
+        "scale_factor": float(scale_factor or settings.scale_factor),
+        "min_neighbors": int(settings.min_neighbors if min_neighbors is None else min_neighbors),
+        "min_face": int(round(min_face)),
+        "max_face": int(round(max_face)) if max_face is not None else None,
+        "detect_scale": detect_scale,
+    }
+
+
+class FaceEngine:
+    """Downscaled Haar cascade face detection with per-request presets"""
+
+    def __init__(self, cascade_path=DEFAULT_CASCADE, preset=DEFAULT_PRESET):
+        check_options(preset)
+        self.cascade_path = cascade_path
+        self.preset = preset
+        self._lock = threading.Lock()
+        self._idle = [self._load()]
+        self.window = self._idle[0].getOriginalWindowSize()[0] if self.loaded else 24
+
+    def _load(self):
+        return cv2.CascadeClassifier(self.cascade_path)
+
+    @property
+    def loaded(self):
+        with self._lock:
+            return bool(self._idle) and not self._idle[0].empty()
+
+    @contextmanager
+    def _classifier(self):
+        """Borrow a classifier no other thread is using, loading another one if all are busy"""
+        with self._lock:
+            classifier = self._idle.pop() if self._idle else None
+        if classifier is None:
+            with stage('face.load_cascade'):
+                classifier = self._load()
+        try:
+            yield classifier
+        finally:
+            with self._lock:
+                self._idle.append(classifier)
+
+    def detect(self, gray, preset=None, **options):
+        """
+        Face boxes (x, y, w, h) in original coordinates plus the parameters used.
+
+        options: scale_factor, min_neighbors, min_face, max_face (see OPTIONS);
+        raises ValueError on invalid values. A min_face above the shorter
+        image side (or a max_face below the effective min_face) finds no faces.
+        """
+        params = detection_params(gray.shape, preset or self.preset, window=self.window, **options)
+        # Resize with the exact scale; a rounded one can be 0 for a huge min_face
+        scale = params["detect_scale"]
+        params["detect_scale"] = round(scale, 4)
+        max_face = params["max_face"]
+        if params["min_face"] > min(gray.shape[:2]) or (max_face is not None and max_face < params["min_face"]):
+            # No face of the requested size fits in the image
+            params["detect_size"] = [0, 0]
+            return np.empty((0, 4), dtype=int), params
+
+        small = gray
+        if scale < 1:
+            with stage('face.downscale'):
+                small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+        min_size = max(self.window, int(round(params["min_face"] * scale)))
+        max_size = params["max_face"]
+        max_size = (int(round(max_size * scale)),) * 2 if max_size is not None else (0, 0)
+        with self._classifier() as classifier, stage('face.detect'):
+            faces = classifier.detectMultiScale(small, params["scale_factor"], params["min_neighbors"],
+                                                minSize=(min_size, min_size), maxSize=max_size)
+
+        faces = np.asarray(faces, dtype=np.float64).reshape(-1, 4)
+        if scale < 1:
+            faces = faces / scale
+        params["detect_size"] = [small.shape[1], small.shape[0]]
+        return np.round(faces).astype(int), params
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Pick the sharpest frames of a video clip or an image burst.
+
+The capture app used to extract frames itself and post every one of them to
+/blur_detection. select_sharpest() takes any iterable of frames instead.
+iter_video_frames() decodes a video file lazily, and iter_image_frames()
+decodes a burst of encoded images one at a time. Each frame is scored with
+one cheap blur metric (the Laplacian variance by default) on a grayscale
+copy shrunk to SCORE_MAX_EDGE. Only a running top-K is kept, so memory is
+bounded by K frames however long the clip is. The full analyses then run on
+those K frames only (see EnhancedAnalyzer.analyze_frames):
+
+    frames = iter_video_frames('clip.mp4', stride=2)
+    best, stats = select_sharpest(frames, k=3)
+    best[0].index, best[0].timestamp_ms, best[0].sharpness, best[0].image
+
+Sharpness is the metric's raw (unclipped) value, so frames that would all
+score 100 are still ranked. Values are only comparable within one call.
+"""
+import heapq
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from blur_metrics import BLUR_METRICS, BlurFeatures
+from instrumentation import stage
+
+DEFAULT_METRIC = 'laplacian'
+DEFAULT_TOP_K = 3
+# Frames are scored on a grayscale copy with at most this long edge
+SCORE_MAX_EDGE = 640
+
+# timestamp_ms is None for bursts; image is None when a burst image cannot be decoded
+Frame = namedtuple('Frame', ['index', 'timestamp_ms', 'image'])
+ScoredFrame = namedtuple('ScoredFrame', ['index', 'timestamp_ms', 'sharpness', 'image'])
+
+
+def iter_video_frames(path, stride=1, max_frames=None):
+    """
+    Decode a video file lazily, yielding every stride-th frame.
+
+    Skipped frames are only grabbed, not converted. Stops after max_frames
+    yielded frames; raises ValueError when the file cannot be opened.
+    """
+    if stride < 1:
+        raise ValueError("stride must be at least 1")
+    capture = cv2.VideoCapture(str(path))
+    try:
+        if not capture.isOpened():
+            raise ValueError("Could not open video")
+        index = yielded = 0
+        while max_frames is None or yielded < max_frames:
+            if index % stride:
+                if not capture.grab():
+                    break
+            else:
+                with stage('stream.decode'):
+                    ok, image = capture.read()
+                if not ok:
+                    break
+                yield Frame(index, round(capture.get(cv2.CAP_PROP_POS_MSEC), 1), image)
+                yielded += 1
+            index += 1
+    finally:
+        capture.release()
+
+
+def iter_image_frames(payloads, max_frames=None, stride=1):
+    """
+    Decode encoded images (bytes, or callables returning bytes) one at a time,
+    every stride-th one, keeping their position in `payloads` as the index.
+    Skipped callables are not called. Stops after max_frames yielded frames.
+    """
+    if stride < 1:
+        raise ValueError("stride must be at least 1")
+    yielded = 0
+    for index, payload in enumerate(payloads):
+        if max_frames is not None and yielded >= max_frames:
+            break
+        if index % stride:
+            continue
+        yielded += 1
+        if callable(payload):
+            payload = payload()
+        with stage('stream.decode'):
+            image = cv2.imdecode(np.frombuffer(payload, np.uint8), cv2.IMREAD_COLOR) if payload else None
+        yield Frame(index, None, image)
+
+
+def shrink_gray(image, max_edge=SCORE_MAX_EDGE):
+    """Grayscale copy of a BGR (or already grayscale) image with at most max_edge pixels on its long edge"""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    scale = max_edge / max(gray.shape[:2])
+    if scale < 1:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return gray
+
+
+def frame_sharpness(image, metric=DEFAULT_METRIC, max_edge=SCORE_MAX_EDGE):
+    """Raw value of one blur metric on a shrunken grayscale copy of the frame"""
+    return float(BLUR_METRICS[metric].func(BlurFeatures(shrink_gray(image, max_edge))))
+
+
+def select_sharpest(frames, k=DEFAULT_TOP_K, metric=DEFAULT_METRIC, max_edge=SCORE_MAX_EDGE):
+    """
+    The k sharpest frames, sharpest first, plus counters.
+
+    frames: iterable of Frame, consumed once. At most k frames (and the one
+    being scored) are held at any time. Ties go to the earlier frame.
+    """
+    if metric not in BLUR_METRICS:
+        raise ValueError(f"Unknown blur metric: {metric}")
+    if k < 1:
+        raise ValueError("k must be at least 1")
+
+    # Min-heap of (sharpness, -index, frame): the weakest kept frame is on top
+    kept = []
+    stats = {'frames': 0, 'scored': 0, 'unreadable': 0, 'min_sharpness': None, 'max_sharpness': None}
+    for frame in frames:
+        stats['frames'] += 1
+        if frame.image is None:
+            stats['unreadable'] += 1
+            continue
+        with stage('stream.score'):
+            sharpness = frame_sharpness(frame.image, metric, max_edge)
+        if not stats['scored']:
+            stats['min_sharpness'] = stats['max_sharpness'] = sharpness
+        stats['scored'] += 1
+        stats['min_sharpness'] = min(stats['min_sharpness'], sharpness)
+        stats['max_sharpness'] = max(stats['max_sharpness'], sharpness)
+
+        entry = (sharpness, -frame.index, ScoredFrame(frame.index, frame.timestamp_ms, sharpness, frame.image))
+        if len(kept) < k:
+            heapq.heappush(kept, entry)
+        elif entry[:2] > kept[0][:2]:
+            heapq.heapreplace(kept, entry)
+
+    best = [entry[2] for entry in sorted(kept, key=lambda entry: entry[:2], reverse=True)]
+    return best, stats
@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Lightweight per-stage timing and request metrics.
+
+Code paths are wrapped in named stages:
+
+    with stage('face.detect'):
+        faces = cascade.detectMultiScale(gray, ...)
+
+    @timed('blur.map')
+    def _create_blur_map(...): ...
+
+Every stage feeds a latency histogram in the process-wide REGISTRY. The web
+app also records request counts, in-flight requests, request and response
+sizes, and input image dimensions, and serves everything at /metrics in the
+Prometheus text format. Metrics are per process.
+
+Stages that run while a request is active are also collected for that
+request (see begin_request), which is how the optional Server-Timing header
+is built. Work handed to thread pools keeps its request when it is
+submitted through propagate().
+
+With instrumentation disabled (configure(enabled=False)), stage() returns a
+shared no-op context manager, so the cost is one function call per stage.
+"""
+import bisect
+import contextvars
+import functools
+import threading
+import time
+from collections import OrderedDict
+
+PREFIX = 'image_analysis_'
+
+# Seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+MEGAPIXEL_BUCKETS = (0.1, 0.3, 1, 2, 5, 12, 24, 48, 100)
+BYTE_BUCKETS = (1e3, 1e4, 1e5, 5e5, 1e6, 2e6, 5e6, 1e7, 1.6e7, 5e7)
+
+enabled = True
+
+_request_timings = contextvars.ContextVar('request_timings', default=None)
+
+
+def configure(**options):
+    """Set options for this process: enabled (True / False)"""
+    global enabled
+    enabled = options.get('enabled', enabled)
+
+
+class Histogram:
+    """Cumulative-bucket histogram (Prometheus semantics)"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Histograms, counters and gauges keyed by name and labels"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help = OrderedDict()
+        self._types = {}
+        self._series = OrderedDict()  # name -> {labels tuple: Histogram or number}
+
+    def _series_for(self, name, kind, help_text):
+        if name not in self._series:
+            self._series[name] = OrderedDict()
+            self._types[name] = kind
+            self._help[name] = help_text
+        return self._series[name]
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, help_text='', **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series_for(name, 'histogram', help_text)
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def inc(self, name, amount=1, help_text='', **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series_for(name, 'counter', help_text)
+            series[key] = series.get(key, 0) + amount
+
+    def gauge_add(self, name, amount, help_text='', **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series_for(name, 'gauge', help_text)
+            series[key] = series.get(key, 0) + amount
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+            self._types.clear()
+            self._help.clear()
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name, series in self._series.items():
+                full_name = PREFIX + name
+                if self._help[name]:
+                    lines.append(f"# HELP {full_name} {self._help[name]}")
+                lines.append(f"# TYPE {full_name} {self._types[name]}")
+                for labels, value in series.items():
+                    if isinstance(value, Histogram):
+                        cumulative = 0
+                        for bound, count in zip(value.buckets + ('+Inf',), value.counts):
+                            cumulative += count
+                            lines.append(f"{full_name}_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+                        lines.append(f"{full_name}_sum{_labels(labels)} {value.sum:.6f}")
+                        lines.append(f"{full_name}_count{_labels(labels)} {value.count}")
+                    else:
+                        lines.append(f"{full_name}{_labels(labels)} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+
+REGISTRY = Registry()
+
+
+class _Stage:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        REGISTRY.observe('stage_duration_seconds', elapsed, help_text='Time spent per processing stage',
+                         stage=self.name)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((self.name, elapsed))
+        return False
+
+
+class _NoOpStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NOOP = _NoOpStage()
+
+
+def stage(name):
+    """Context manager timing one stage"""
+    if not enabled:
+        return _NOOP
+    return _Stage(name)
+
+
+def timed(name):
+    """Decorator timing every call of a function as a stage"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def propagate(func):
+    """Bind func to a copy of the current context, so stages it runs on another thread count for this request"""
+    if not enabled:
+        return func
+    return functools.partial(contextvars.copy_context().run, func)
+
+
+def observe_image(image):
+    """Record the dimensions of a decoded input image"""
+    if not enabled or image is None:
+        return
+    height, width = image.shape[:2]
+    REGISTRY.observe('image_megapixels', height * width / 1e6, MEGAPIXEL_BUCKETS,
+                     help_text='Decoded input image size in megapixels')
+    REGISTRY.observe('image_long_edge_pixels', max(height, width), (256, 512, 1024, 2048, 4096, 8192, 16384),
+                     help_text='Longest edge of decoded input images')
+
+
+def begin_request():
+    """Start collecting stage timings for the current request; returns a token for end_request"""
+    return _request_timings.set([])
+
+
+def end_request(token):
+    """Stop collecting and return the request's [(stage, seconds)]"""
+    timings = _request_timings.get() or []
+    _request_timings.reset(token)
+    return timings
+
+
+def request_timings():
+    """Stage timings collected so far for the current request (empty outside a request)"""
+    return list(_request_timings.get() or ())
+
+
+def server_timing_header(timings):
+    """Server-Timing header value; repeated stages are summed"""
+    totals = OrderedDict()
+    for name, seconds in timings:
+        totals[name] = totals.get(name, 0.0) + seconds
+    return ', '.join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in totals.items())
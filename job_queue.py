@@ -0,0 +1,462 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Asynchronous analysis jobs: submit, poll, or get a webhook callback.
+
+A slow OCR request used to hold an HTTP worker thread for its whole run, so
+under load the fast blur and face requests queued behind it. JobQueue
+decouples the two sides. Requests only enqueue a job and return its id.
+Each analysis type has its own worker pool and its own bounded priority
+queue, so OCR jobs cannot starve blur jobs:
+
+    queue = JobQueue(MemoryBackend(), runner, workers={'ocr': 2, 'blur': 4, 'face': 2})
+    queue.start()
+    job_id = queue.submit('blur', image_bytes, params, priority='high')
+    queue.get(job_id)   # {'status': 'queued' | 'running' | 'done' | 'failed', ...}
+
+submit() raises QueueFull once a type has max_depth jobs waiting; the web
+app turns that into 429. Jobs run in priority order (high, normal, low) and
+first-in first-out within a priority. When a job has a callback_url, the
+finished job is POSTed there as JSON.
+
+Callbacks are off unless callback_hosts lists the hosts they may go to
+('hooks.example.com', '.example.com' for its subdomains, '*' for any host).
+Unless allow_private is set, a callback is only sent to public addresses:
+the host is resolved when the callback is sent, the connection goes to the
+address that was checked, and loopback, private, link-local and other
+non-global addresses are refused. Redirects are not followed, and proxies
+are not used.
+
+Backends hold the queues, job records and uploaded images:
+
+    MemoryBackend  in-process (the default; one process only)
+    RedisBackend   any server speaking the Redis protocol (Redis, Valkey,
+                   KeyDB, ...), so several processes or nodes share the
+                   queues and any of them can answer a poll. Needs the
+                   optional `redis` package.
+
+Finished jobs and their results expire after result_ttl_seconds. On Redis,
+a job that never finishes (its worker crashed) and its image expire after
+pending_ttl_seconds, so nothing is left behind for good.
+"""
+import heapq
+import ipaddress
+import itertools
+import json
+import socket
+import threading
+import time
+import urllib.parse
+import urllib.request
+import uuid
+
+from result_cache import json_default
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+PRIORITIES = {'high': 0, 'normal': 1, 'low': 2}
+
+DEFAULT_WORKERS = {'ocr': 2, 'blur': 4, 'face': 2}
+
+
+class QueueFull(Exception):
+    """The queue for this analysis type already holds max_depth jobs"""
+
+
+class MemoryBackend:
+    """Queues, job records and images in this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._queues = {}
+        self._jobs = {}
+        self._images = {}
+        self._sequence = itertools.count()
+
+    def enqueue(self, job, image, max_depth, ttl_seconds=None):
+        # ttl_seconds is for shared backends; here unfinished jobs go with the process
+        with self._lock:
+            queue = self._queues.setdefault(job['type'], [])
+            if max_depth is not None and len(queue) >= max_depth:
+                raise QueueFull(job['type'])
+            self._jobs[job['id']] = dict(job)
+            self._images[job['id']] = image
+            heapq.heappush(queue, (job['priority'], next(self._sequence), job['id']))
+            self._ready.notify_all()
+
+    def dequeue(self, job_type, timeout):
+        """Id of the next job of this type, waiting up to timeout seconds; None if there is none"""
+        with self._lock:
+            queue = self._queues.setdefault(job_type, [])
+            if not queue:
+                self._ready.wait(timeout)
+            if not queue:
+                return None
+            return heapq.heappop(queue)[2]
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def update(self, job_id, ttl_seconds=None, **fields):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+
+    def pop_image(self, job_id):
+        with self._lock:
+            return self._images.pop(job_id, None)
+
+    def depth(self, job_type):
+        with self._lock:
+            return len(self._queues.get(job_type, ()))
+
+    def expire(self, ttl_seconds):
+        """Forget finished jobs older than ttl_seconds"""
+        cutoff = time.time() - ttl_seconds
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job['status'] in (DONE, FAILED) and job['finished_at'] < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def wake(self):
+        with self._lock:
+            self._ready.notify_all()
+
+
+class RedisBackend:
+    """Queues and job records on a Redis-protocol server, shared by every process using the same prefix"""
+
+    def __init__(self, url='redis://localhost:6379/0', prefix='image-analysis', client=None):
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise RuntimeError("RedisBackend needs the 'redis' package (pip install redis)")
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, *parts):
+        return ':'.join((self.prefix,) + parts)
+
+    def enqueue(self, job, image, max_depth, ttl_seconds=None):
+        """Queue a job; its record and image expire after ttl_seconds unless it finishes first"""
+        import redis
+
+        queue_key = self._key('queue', job['type'])
+        sequence = self.client.incr(self._key('sequence'))
+        # Lower score first: priority, then submission order
+        score = job['priority'] * 1e13 + sequence
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(queue_key)
+                    if max_depth is not None and pipe.zcard(queue_key) >= max_depth:
+                        raise QueueFull(job['type'])
+                    pipe.multi()
+                    pipe.set(self._key('job', job['id']), json.dumps(job, default=json_default), ex=ttl_seconds)
+                    pipe.set(self._key('image', job['id']), image, ex=ttl_seconds)
+                    pipe.zadd(queue_key, {job['id']: score})
+                    pipe.execute()
+                    return
+                except redis.WatchError:
+                    continue
+
+    def dequeue(self, job_type, timeout):
+        popped = self.client.bzpopmin(self._key('queue', job_type), timeout=max(1, int(round(timeout))))
+        if popped is None:
+            return None
+        job_id = popped[1]
+        return job_id.decode() if isinstance(job_id, bytes) else job_id
+
+    def get(self, job_id):
+        payload = self.client.get(self._key('job', job_id))
+        return json.loads(payload) if payload is not None else None
+
+    def update(self, job_id, ttl_seconds=None, **fields):
+        key = self._key('job', job_id)
+        # Only the worker running a job updates it, so read-modify-write is safe
+        job = self.get(job_id)
+        if job is None:
+            return
+        job.update(fields)
+        # Without a new TTL the key keeps the one it was queued with
+        if ttl_seconds is None:
+            self.client.set(key, json.dumps(job, default=json_default), keepttl=True)
+        else:
+            self.client.set(key, json.dumps(job, default=json_default), ex=ttl_seconds)
+
+    def pop_image(self, job_id):
+        key = self._key('image', job_id)
+        with self.client.pipeline() as pipe:
+            pipe.get(key)
+            pipe.delete(key)
+            image, _ = pipe.execute()
+        return image
+
+    def depth(self, job_type):
+        return self.client.zcard(self._key('queue', job_type))
+
+    def expire(self, ttl_seconds):
+        # Finished job records carry a Redis TTL (see update)
+        pass
+
+    def wake(self):
+        pass
+
+
+def is_public_address(address):
+    """Whether an IP address is globally routable (not loopback, private, link-local, multicast, ...)"""
+    ip = ipaddress.ip_address(address.split('%')[0])
+    if ip.version == 6 and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+def callback_host_allowed(host, allowed_hosts):
+    """Whether host matches an entry of allowed_hosts ('name', '.domain' or '*')"""
+    host = host.lower().rstrip('.')
+    for pattern in allowed_hosts:
+        pattern = pattern.lower()
+        if pattern == '*' or host == pattern or (pattern.startswith('.') and host.endswith(pattern)):
+            return True
+    return False
+
+
+def check_callback_url(url, allowed_hosts, allow_private=False):
+    """Raise ValueError unless url may receive job callbacks (host names are resolved when sending)"""
+    if not allowed_hosts:
+        raise ValueError("job callbacks are disabled")
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise ValueError("callback_url must be an http(s) URL")
+    if not callback_host_allowed(parts.hostname, allowed_hosts):
+        raise ValueError(f"callback host is not allowed: {parts.hostname}")
+    try:
+        literal = ipaddress.ip_address(parts.hostname)
+    except ValueError:
+        return
+    if not allow_private and not is_public_address(str(literal)):
+        raise ValueError(f"callback address is not public: {parts.hostname}")
+
+
+def _connect_checked(address, timeout, source_address=None, allow_private=False):
+    """socket.create_connection, refusing hosts that resolve to a non-public address"""
+    host, port = address
+    infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    if not allow_private:
+        blocked = [info[4][0] for info in infos if not is_public_address(info[4][0])]
+        if blocked:
+            raise OSError(f"callback host {host} resolves to a non-public address ({blocked[0]})")
+    error = OSError(f"callback host {host} did not resolve")
+    # Connect to the checked addresses, not to a second lookup of the name
+    for info in infos:
+        try:
+            return socket.create_connection(info[4][:2], timeout, source_address)
+        except OSError as e:
+            error = e
+    raise error
+
+
+class _CheckedConnections:
+    """urllib handler mixin whose connections go through _connect_checked"""
+    allow_private = False
+
+    def do_open(self, http_class, req, **http_conn_args):
+        def create_connection(address, timeout, source_address=None):
+            return _connect_checked(address, timeout, source_address, self.allow_private)
+
+        def connection(host, **kwargs):
+            conn = http_class(host, **kwargs)
+            conn._create_connection = create_connection
+            return conn
+        return super().do_open(connection, req, **http_conn_args)
+
+
+class _CheckedHTTPHandler(_CheckedConnections, urllib.request.HTTPHandler):
+    pass
+
+
+class _CheckedHTTPSHandler(_CheckedConnections, urllib.request.HTTPSHandler):
+    pass
+
+
+class _NoRedirects(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        # A redirect could point anywhere; report the 3xx instead
+        return None
+
+
+def post_callback(url, job, timeout, allow_private=False):
+    """POST the finished job as JSON; returns {"status_code"} or {"error"}"""
+    body = json.dumps(job, default=json_default).encode('utf-8')
+    callback = urllib.request.Request(url, data=body, method='POST',
+                                      headers={'Content-Type': 'application/json'})
+    handlers = [_CheckedHTTPHandler(), _CheckedHTTPSHandler()]
+    for handler in handlers:
+        handler.allow_private = allow_private
+    opener = urllib.request.build_opener(urllib.request.ProxyHandler({}), _NoRedirects, *handlers)
+    try:
+        with opener.open(callback, timeout=timeout) as response:
+            return {"status_code": response.status}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+class JobQueue:
+    """Bounded per-type priority queues with a worker pool per analysis type"""
+
+    def __init__(self, backend, runner, workers=None, max_depth=100, result_ttl_seconds=3600,
+                 callback_timeout=10, poll_interval=1.0, callback_hosts=None, callback_allow_private=False,
+                 pending_ttl_seconds=86400):
+        """
+        runner(job_type, image_bytes, params) returns the result dict of one
+        job; a result with an "error" entry marks the job failed.
+        workers: threads per analysis type; only these types are accepted.
+        callback_hosts: hosts callback_url may point to (None: callbacks off)
+        callback_allow_private: also send callbacks to non-public addresses
+        pending_ttl_seconds: how long a shared backend keeps a job that has
+        not finished, and its image (a crashed worker never finishes it)
+        """
+        self.backend = backend
+        self.runner = runner
+        self.workers = dict(DEFAULT_WORKERS if workers is None else workers)
+        self.max_depth = max_depth
+        self.result_ttl_seconds = result_ttl_seconds
+        self.pending_ttl_seconds = pending_ttl_seconds
+        self.callback_timeout = callback_timeout
+        self.poll_interval = poll_interval
+        self.callback_hosts = tuple(callback_hosts or ())
+        self.callback_allow_private = callback_allow_private
+
+        self._threads = []
+        self._stopping = threading.Event()
+        self._counters_lock = threading.Lock()
+        self._counters = {'submitted': 0, 'rejected': 0, 'completed': 0, 'failed': 0}
+
+    def _count(self, name):
+        with self._counters_lock:
+            self._counters[name] += 1
+
+    def start(self):
+        """Start the worker threads (idempotent)"""
+        if self._threads:
+            return
+        self._stopping.clear()
+        for job_type, count in self.workers.items():
+            for index in range(count):
+                thread = threading.Thread(target=self._work, args=(job_type,),
+                                          name=f"jobs-{job_type}-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self.backend.wake()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def submit(self, job_type, image, params=None, priority='normal', callback_url=None):
+        """Queue a job and return its id; raises QueueFull or ValueError"""
+        if job_type not in self.workers:
+            raise ValueError(f"Unknown job type: {job_type}")
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority} (use {', '.join(PRIORITIES)})")
+        if callback_url:
+            check_callback_url(callback_url, self.callback_hosts, self.callback_allow_private)
+
+        self.backend.expire(self.result_ttl_seconds)
+        job = {
+            'id': uuid.uuid4().hex,
+            'type': job_type,
+            'priority': PRIORITIES[priority],
+            'params': params or {},
+            'callback_url': callback_url,
+            'status': QUEUED,
+            'submitted_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+            'result': None,
+            'error': None,
+        }
+        try:
+            self.backend.enqueue(job, image, self.max_depth, self.pending_ttl_seconds)
+        except QueueFull:
+            self._count('rejected')
+            raise
+        self._count('submitted')
+        return job['id']
+
+    def get(self, job_id):
+        """The job record (without params), or None if unknown or expired"""
+        job = self.backend.get(job_id)
+        if job is None:
+            return None
+        job.pop('params', None)
+        job['priority'] = next(name for name, value in PRIORITIES.items() if value == job['priority'])
+        if job['started_at'] is not None:
+            job['queue_seconds'] = round(job['started_at'] - job['submitted_at'], 3)
+        if job['finished_at'] is not None:
+            job['run_seconds'] = round(job['finished_at'] - job['started_at'], 3)
+        return job
+
+    def _work(self, job_type):
+        while not self._stopping.is_set():
+            try:
+                job_id = self.backend.dequeue(job_type, self.poll_interval)
+            except Exception:
+                # Backend unavailable (e.g. Redis restarting); try again shortly
+                self._stopping.wait(self.poll_interval)
+                continue
+            if job_id is not None:
+                self._run(job_id)
+
+    def _run(self, job_id):
+        job = self.backend.get(job_id)
+        image = self.backend.pop_image(job_id)
+        if job is None:
+            return
+        self.backend.update(job_id, status=RUNNING, started_at=time.time())
+
+        try:
+            if image is None:
+                raise RuntimeError("Job image is no longer available")
+            result = self.runner(job['type'], image, job['params'])
+            error = result.get("error")
+        except Exception as e:
+            result, error = None, f"{job['type']} error: {str(e)}"
+
+        status = FAILED if error else DONE
+        self.backend.update(job_id, ttl_seconds=self.result_ttl_seconds, status=status,
+                            finished_at=time.time(), result=None if error else result, error=error)
+        self._count('failed' if error else 'completed')
+
+        if job['callback_url']:
+            try:
+                # Checked again: with a shared backend the job may come from another configuration
+                check_callback_url(job['callback_url'], self.callback_hosts, self.callback_allow_private)
+                webhook = post_callback(job['callback_url'], self.get(job_id), self.callback_timeout,
+                                        self.callback_allow_private)
+            except ValueError as e:
+                webhook = {"error": str(e)}
+            self.backend.update(job_id, ttl_seconds=self.result_ttl_seconds, webhook=webhook)
+
+    def stats(self):
+        """Queue depths, pool sizes and job counters"""
+        with self._counters_lock:
+            counters = dict(self._counters)
+        return dict(
+            counters,
+            backend=type(self.backend).__name__,
+            max_depth=self.max_depth,
+            queues={job_type: {'depth': self.backend.depth(job_type), 'workers': count}
+                    for job_type, count in self.workers.items()},
+        )
@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Where the tesseract passes of the OCR analysis run.
+
+pytesseract.image_to_data starts a new tesseract process for every call.
+The process writes the image to a temp file, loads the eng+urd models and
+prints TSV. analyze_ocr makes four such calls per request, and on small ID
+card crops the process start and model loading take most of the time. Two
+backends are available:
+
+  pytesseract  a tesseract subprocess per pass; needs only the tesseract
+               binary (the previous behaviour, and the fallback)
+  tesserocr    a pool of resident tesseract engines through the C API
+               (optional tesserocr package). Each engine keeps its models
+               loaded, and recognition releases the GIL, so the OCR
+               variants' threads run engines in parallel.
+
+make_backend('auto') picks tesserocr when it can be imported and otherwise
+falls back to pytesseract:
+
+    backend = make_backend('auto', pool_size=4)
+    data = backend.image_to_data(gray, DEFAULT_LANG, DEFAULT_CONFIG)
+    data['text'], data['conf'], data['left'], ...
+
+Both return the dict of pytesseract.Output.DICT: one list per TSV column,
+numbers as int (confidences truncated) and text as str. Results therefore
+do not depend on the backend beyond what the tesseract versions differ in.
+"""
+import shlex
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+from instrumentation import stage
+
+AUTO = 'auto'
+PYTESSERACT = 'pytesseract'
+TESSEROCR = 'tesserocr'
+BACKENDS = (AUTO, PYTESSERACT, TESSEROCR)
+DEFAULT_BACKEND = AUTO
+
+# Languages and options of the OCR analysis passes
+DEFAULT_LANG = 'eng+urd'
+DEFAULT_CONFIG = '--oem 3 --psm 6'
+
+TSV_COLUMNS = ('level', 'page_num', 'block_num', 'par_num', 'line_num', 'word_num',
+               'left', 'top', 'width', 'height', 'conf', 'text')
+
+
+def parse_config(config):
+    """(oem, psm, variables) from tesseract command-line options such as '--oem 3 --psm 6 -c name=value'"""
+    oem = psm = None
+    variables = {}
+    args = shlex.split(config or '')
+    index = 0
+    while index < len(args):
+        arg = args[index]
+        value = args[index + 1] if index + 1 < len(args) else None
+        if arg in ('--oem', '--psm') and value is not None:
+            if arg == '--oem':
+                oem = int(value)
+            else:
+                psm = int(value)
+            index += 2
+        elif arg == '-c' and value is not None and '=' in value:
+            name, _, setting = value.partition('=')
+            variables[name] = setting
+            index += 2
+        else:
+            raise ValueError(f"Unsupported tesseract option: {arg}")
+    return oem, psm, variables
+
+
+def tsv_to_dict(tsv):
+    """Tesseract TSV rows (without the header) as pytesseract.Output.DICT"""
+    data = {column: [] for column in TSV_COLUMNS}
+    text_column = len(TSV_COLUMNS) - 1
+    for line in tsv.splitlines():
+        if not line:
+            continue
+        cells = line.split('\t')
+        # The text cell is missing when a row's text is empty
+        cells += [''] * (len(TSV_COLUMNS) - len(cells))
+        for index, (column, cell) in enumerate(zip(TSV_COLUMNS, cells)):
+            if index == text_column:
+                data[column].append(cell)
+                continue
+            try:
+                data[column].append(int(float(cell)))
+            except ValueError:
+                data[column].append(cell)
+    return data
+
+
+class PytesseractBackend:
+    """A tesseract subprocess per pass (pytesseract.image_to_data)"""
+
+    name = PYTESSERACT
+
+    def image_to_data(self, image, lang=DEFAULT_LANG, config=DEFAULT_CONFIG):
+        import pytesseract
+        return pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT, config=config, lang=lang)
+
+    def warm_up(self, lang=DEFAULT_LANG, config=DEFAULT_CONFIG):
+        """Check the binary and language data; one tiny pass pulls the models into the OS page cache"""
+        import pytesseract
+
+        version = str(pytesseract.get_tesseract_version())
+        languages = pytesseract.get_languages(config='')
+        missing = [name for name in lang.split('+') if name not in languages]
+        pytesseract.image_to_string(np.full((32, 32), 255, np.uint8), lang='eng' if missing else lang)
+        return {'available': True, 'backend': self.name, 'version': version, 'missing_languages': missing}
+
+    def stats(self):
+        return {'backend': self.name}
+
+    def close(self):
+        pass
+
+
+class TesserocrBackend:
+    """
+    Resident tesseract engines (tesserocr.PyTessBaseAPI), at most pool_size
+    in use at once. Engines are created on first use for each
+    (lang, oem, psm, variables) combination and then reused.
+    """
+
+    name = TESSEROCR
+
+    def __init__(self, pool_size=4, tessdata_path=None):
+        try:
+            import tesserocr
+        except ImportError:
+            raise RuntimeError("TesserocrBackend needs the 'tesserocr' package (pip install tesserocr)")
+        self._tesserocr = tesserocr
+        self.pool_size = max(1, int(pool_size))
+        self.tessdata_path = tessdata_path
+        self._slots = threading.BoundedSemaphore(self.pool_size)
+        self._lock = threading.Lock()
+        self._idle = {}  # engine key -> [PyTessBaseAPI]
+        self._created = 0
+
+    def _create(self, key):
+        lang, oem, psm, variables = key
+        tesserocr = self._tesserocr
+        options = {'lang': lang, 'variables': dict(variables)}
+        if self.tessdata_path:
+            options['path'] = self.tessdata_path
+        if oem is not None:
+            options['oem'] = tesserocr.OEM(oem)
+        if psm is not None:
+            options['psm'] = tesserocr.PSM(psm)
+        with stage('ocr.load_engine'):
+            engine = tesserocr.PyTessBaseAPI(**options)
+        with self._lock:
+            self._created += 1
+        return engine
+
+    @contextmanager
+    def _engine(self, lang, config):
+        """Borrow an idle engine for these options, creating one if none is idle"""
+        oem, psm, variables = parse_config(config)
+        key = (lang, oem, psm, tuple(sorted(variables.items())))
+        with self._slots:
+            with self._lock:
+                idle = self._idle.get(key)
+                engine = idle.pop() if idle else None
+            if engine is None:
+                engine = self._create(key)
+            try:
+                yield engine
+            finally:
+                engine.Clear()
+                with self._lock:
+                    self._idle.setdefault(key, []).append(engine)
+
+    def image_to_data(self, image, lang=DEFAULT_LANG, config=DEFAULT_CONFIG):
+        """Same result as PytesseractBackend for a uint8 array (2-D, or 3 channels passed through as-is)"""
+        image = np.ascontiguousarray(image)
+        height, width = image.shape[:2]
+        channels = 1 if image.ndim == 2 else image.shape[2]
+        with self._engine(lang, config) as engine:
+            engine.SetImageBytes(image.tobytes(), width, height, channels, width * channels)
+            # Recognize releases the GIL; the TSV is then read from the recognised page
+            engine.Recognize()
+            tsv = engine.GetTSVText(0)
+        return tsv_to_dict(tsv or '')
+
+    def warm_up(self, lang=DEFAULT_LANG, config=DEFAULT_CONFIG):
+        """Load one engine with the analysis options so the first request does not pay for it"""
+        tesserocr = self._tesserocr
+        _, languages = tesserocr.get_languages(self.tessdata_path) if self.tessdata_path else tesserocr.get_languages()
+        missing = [name for name in lang.split('+') if name not in languages]
+        with self._engine('eng' if missing else lang, config):
+            pass
+        return {'available': True, 'backend': self.name, 'version': tesserocr.tesseract_version().split()[1],
+                'missing_languages': missing}
+
+    def stats(self):
+        with self._lock:
+            return {'backend': self.name, 'pool_size': self.pool_size, 'engines_loaded': self._created,
+                    'engines_idle': sum(len(idle) for idle in self._idle.values())}
+
+    def close(self):
+        with self._lock:
+            engines = [engine for idle in self._idle.values() for engine in idle]
+            self._idle.clear()
+        for engine in engines:
+            engine.End()
+
+
+def make_backend(name=DEFAULT_BACKEND, pool_size=4):
+    """An OCR backend by name; 'auto' prefers tesserocr and falls back to pytesseract"""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown OCR backend: {name} (use {', '.join(BACKENDS)})")
+    if name == PYTESSERACT:
+        return PytesseractBackend()
+    try:
+        return TesserocrBackend(pool_size=pool_size)
+    except RuntimeError:
+        if name == TESSEROCR:
+            raise
+        return PytesseractBackend()
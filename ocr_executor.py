@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Concurrent execution of the OCR preprocessing variants.
+
+Each variant is a (name, build) pair where build() returns the preprocessed
+image. Variants run on a bounded thread pool; tesseract runs as a separate
+process or, with the tesserocr backend, releases the GIL (as OpenCV does),
+so threads give real parallelism.
+
+With an early-exit confidence set, no further variants are started once one
+of them reaches the threshold. Each run keeps at most max_workers of its
+variants submitted at a time, but the pool is shared by concurrent runs, so
+a submitted variant may still be waiting for a thread. Such variants are
+withdrawn and, like the variants never submitted, reported as "skipped".
+Variants already running cannot be interrupted: they run to completion on
+their pool thread, their result is ignored, and they are reported as
+"cancelled". With max_workers=1 this turns into the sequential "stop at the
+first good pass" policy.
+"""
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from instrumentation import propagate, stage
+
+# Attempt statuses reported in all_attempts
+COMPLETED = 'completed'
+CANCELLED = 'cancelled'
+SKIPPED = 'skipped'
+
+_UNSET = object()
+
+
+class OCRExecutor:
+    """Runs OCR variants on a bounded worker pool with an optional early-exit policy"""
+
+    def __init__(self, max_workers=4, early_exit_confidence=None):
+        self.max_workers = max(1, int(max_workers))
+        self.early_exit_confidence = early_exit_confidence
+        self._pool = None
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='ocr')
+        return self._pool
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def run(self, variants, ocr, early_exit_confidence=_UNSET):
+        """
+        Run ocr(build()) for every (name, build) variant.
+
+        Returns one attempt per variant, in variant order:
+        {"variant", "status", "confidence", "latency_ms", "result"}.
+        Exceptions raised by a variant propagate to the caller.
+        """
+        threshold = self.early_exit_confidence if early_exit_confidence is _UNSET else early_exit_confidence
+        attempts = {
+            name: {"variant": name, "status": SKIPPED, "confidence": None, "latency_ms": None, "result": None}
+            for name, _ in variants
+        }
+
+        def task(name, build):
+            start = time.perf_counter()
+            with stage(f"ocr.preprocess.{name}"):
+                image = build()
+            with stage(f"ocr.tesseract.{name}"):
+                result = ocr(image)
+            return result, (time.perf_counter() - start) * 1000
+
+        queue = list(variants)
+        running = {}
+        stop = False
+
+        def submit_next():
+            while queue and len(running) < self.max_workers:
+                name, build = queue.pop(0)
+                running[self.pool.submit(propagate(task), name, build)] = name
+
+        submit_next()
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                result, latency_ms = future.result()
+                attempts[name].update(status=COMPLETED, confidence=result['confidence'],
+                                      latency_ms=latency_ms, result=result)
+                if threshold is not None and result['confidence'] >= threshold:
+                    stop = True
+            if stop:
+                for future, name in running.items():
+                    # cancel() only withdraws a variant still waiting for a pool thread
+                    attempts[name]['status'] = SKIPPED if future.cancel() else CANCELLED
+                break
+            submit_next()
+
+        return [attempts[name] for name, _ in variants]
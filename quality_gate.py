@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Early-reject quality gate in front of OCR and face detection.
+
+analyze_ocr runs four tesseract passes, the most expensive path of the
+service, and it used to run them on inputs too blurry, too small or too
+badly exposed for anything to be found. QualityGate checks the image first,
+on a grayscale copy shrunk to max_edge (frame_stream.shrink_gray, a few
+milliseconds even at 12 MP):
+
+  too_small   shorter side below min_side pixels
+  too_dark    mean grey level below min_brightness
+  too_bright  mean grey level above max_brightness
+  too_blurry  raw Laplacian metric (variance / 10) below min_sharpness
+
+The first failing check, in that order, is the reason. An image that fails
+skips the gated analyses (OCR and face detection by default), which return
+their usual fields, empty, plus "rejected" with the verdict (see
+EnhancedAnalyzer). Blur analysis is never gated; its scores are the
+explanation.
+
+The defaults only reject hopeless inputs. On the synthetic corpus, from
+640x400 to 4000x3000, the ID card scores 28-54 and a Gaussian-blurred one
+2.4-15 (sigma 1/1000 of the long edge), 1.4-2.4 (2/1000) and 0.35-0.54
+(3/1000, where no text is legible).
+
+    gate = QualityGate(min_sharpness=1.0)
+    verdict = gate.check(image)
+    if not verdict['passed']:
+        gate.record_skip('ocr')
+
+stats() counts checks, rejections per reason and skipped analyses, and
+estimates the time saved. Each skip is credited, when it happens, with the
+analysis's mean latency over the runs the gate let through so far
+(record_run). With instrumentation enabled the same counters, and the same
+saved time, are exported as quality_gate_* metrics.
+"""
+import threading
+import time
+
+import cv2
+
+import instrumentation
+from blur_metrics import BLUR_METRICS, BlurFeatures
+from frame_stream import SCORE_MAX_EDGE, shrink_gray
+
+TOO_SMALL = 'too_small'
+TOO_DARK = 'too_dark'
+TOO_BRIGHT = 'too_bright'
+TOO_BLURRY = 'too_blurry'
+REASONS = (TOO_SMALL, TOO_DARK, TOO_BRIGHT, TOO_BLURRY)
+
+DEFAULT_MIN_SIDE = 32
+DEFAULT_MIN_BRIGHTNESS = 15
+DEFAULT_MAX_BRIGHTNESS = 245
+DEFAULT_MIN_SHARPNESS = 1.0
+DEFAULT_GATED_ANALYSES = ('ocr', 'face')
+
+
+class QualityGate:
+    """Cheap size, exposure and sharpness checks deciding whether the expensive analyses run"""
+
+    def __init__(self, min_side=DEFAULT_MIN_SIDE, min_brightness=DEFAULT_MIN_BRIGHTNESS,
+                 max_brightness=DEFAULT_MAX_BRIGHTNESS, min_sharpness=DEFAULT_MIN_SHARPNESS,
+                 max_edge=SCORE_MAX_EDGE, analyses=DEFAULT_GATED_ANALYSES):
+        if min_brightness > max_brightness:
+            raise ValueError("min_brightness must not exceed max_brightness")
+        self.min_side = min_side
+        self.min_brightness = min_brightness
+        self.max_brightness = max_brightness
+        self.min_sharpness = min_sharpness
+        self.max_edge = max_edge
+        self.analyses = tuple(analyses)
+
+        self._lock = threading.Lock()
+        self._counters = {'checked': 0, 'passed': 0, 'check_ms': 0.0}
+        self._rejected = {reason: 0 for reason in REASONS}
+        self._skipped = {name: 0 for name in self.analyses}
+        # Estimated ms saved per analysis, credited at each skip (also the saved_seconds metric)
+        self._saved_ms = {name: 0.0 for name in self.analyses}
+        # Latency of the gated analyses when they do run: name -> [runs, total ms]
+        self._runs = {name: [0, 0.0] for name in self.analyses}
+
+    def gates(self, analysis):
+        return analysis in self.analyses
+
+    def params(self):
+        """Thresholds, for result cache keys and the stats"""
+        return {'min_side': self.min_side, 'min_brightness': self.min_brightness,
+                'max_brightness': self.max_brightness, 'min_sharpness': self.min_sharpness,
+                'max_edge': self.max_edge}
+
+    def check(self, image):
+        """
+        Verdict for a BGR or grayscale image: {"passed", "reason", "details",
+        "checks": {"width", "height", "brightness", "sharpness"}, "check_ms"}
+        """
+        started = time.perf_counter()
+        with instrumentation.stage('quality_gate'):
+            height, width = image.shape[:2]
+            gray = shrink_gray(image, self.max_edge)
+            brightness = float(cv2.mean(gray)[0])
+            sharpness = float(BLUR_METRICS['laplacian'].func(BlurFeatures(gray)))
+
+        if min(height, width) < self.min_side:
+            reason, details = TOO_SMALL, f"too small ({width}x{height}, minimum side {self.min_side} px)"
+        elif brightness < self.min_brightness:
+            reason, details = TOO_DARK, f"too dark (mean {brightness:.0f} < {self.min_brightness})"
+        elif brightness > self.max_brightness:
+            reason, details = TOO_BRIGHT, f"too bright (mean {brightness:.0f} > {self.max_brightness})"
+        elif sharpness < self.min_sharpness:
+            reason, details = TOO_BLURRY, f"too blurry (sharpness {sharpness:.2f} < {self.min_sharpness})"
+        else:
+            reason, details = None, "passed"
+        check_ms = (time.perf_counter() - started) * 1000
+
+        with self._lock:
+            self._counters['checked'] += 1
+            self._counters['check_ms'] += check_ms
+            if reason is None:
+                self._counters['passed'] += 1
+            else:
+                self._rejected[reason] += 1
+        if reason is not None and instrumentation.enabled:
+            instrumentation.REGISTRY.inc('quality_gate_rejected_total', help_text='Images rejected by the quality gate',
+                                         reason=reason)
+        return {
+            "passed": reason is None,
+            "reason": reason,
+            "details": details,
+            "checks": {"width": width, "height": height, "brightness": round(brightness, 1),
+                       "sharpness": round(sharpness, 3)},
+            "check_ms": round(check_ms, 2)
+        }
+
+    def record_run(self, analysis, ms):
+        """Latency of a gated analysis that ran; the estimate of what a skip saves"""
+        if analysis in self._runs:
+            with self._lock:
+                self._runs[analysis][0] += 1
+                self._runs[analysis][1] += ms
+
+    def _mean_ms(self, analysis):
+        runs, total = self._runs[analysis]
+        return total / runs if runs else 0.0
+
+    def record_skip(self, analysis):
+        """Count an analysis skipped because its image was rejected"""
+        with self._lock:
+            self._skipped[analysis] += 1
+            saved_ms = self._mean_ms(analysis)
+            self._saved_ms[analysis] += saved_ms
+        if instrumentation.enabled:
+            registry = instrumentation.REGISTRY
+            registry.inc('quality_gate_skipped_total', help_text='Analyses skipped by the quality gate',
+                         analysis=analysis)
+            registry.inc('quality_gate_saved_seconds_total', saved_ms / 1000,
+                         help_text='Estimated analysis time saved by the quality gate', analysis=analysis)
+
+    def stats(self):
+        """Checks, rejections per reason, skipped analyses and the estimated time saved"""
+        with self._lock:
+            analyses = {}
+            for name in self.analyses:
+                mean_ms = self._mean_ms(name)
+                analyses[name] = {'skipped': self._skipped[name], 'runs': self._runs[name][0],
+                                  'mean_ms': round(mean_ms, 1),
+                                  'saved_ms': round(self._saved_ms[name], 1)}
+            return {
+                'thresholds': self.params(),
+                'checked': self._counters['checked'],
+                'passed': self._counters['passed'],
+                'rejected': dict(self._rejected),
+                'check_ms': round(self._counters['check_ms'], 1),
+                'analyses': analyses,
+                'saved_ms': round(sum(self._saved_ms.values()), 1),
+            }
@@ -0,0 +1,442 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Persistent, incremental quality index of an image archive (SQLite).
+
+Every indexed file gets one row with its absolute path, size, mtime and
+content hash, and the results of the batch analyses (batch_analysis's
+analyze_path): the blur score and its five method scores, face count and
+confidence, and the OCR summary. The same columns as the batch CSV output
+are stored, and the full result of each analysis is kept as JSON.
+
+A re-scan only analyses what it has to:
+
+  unchanged  same size and mtime as indexed: not even read
+  touched    size or mtime changed but the content hash did not: the row's
+             file metadata is updated
+  reused     a new path whose content is already indexed (a copy or a
+             move): the results are copied from that row
+  analyzed   new or changed content, or analyses the row does not have
+             yet (only the missing analyses are run)
+
+Rows also record the analysis options (blur resolution, face preset), so
+changing them re-analyses the archive. Files that failed are not retried
+until they change, unless retry_errors is set. Queries read the indexed
+columns only, so nothing is recomputed.
+
+Usage:
+    python quality_index.py scan archive.db scans/ more_scans/ --analyses blur,face --workers 8
+    python quality_index.py query archive.db --filter 'blur_laplacian<40' --filter 'face_count=0'
+    python quality_index.py stats archive.db
+
+Python API:
+    from quality_index import QualityIndex
+    with QualityIndex("archive.db") as index:
+        index.scan(["scans/"])
+        rows = index.query([("blur_laplacian", "<", 40), ("face_count", "=", 0)])
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from batch_analysis import ANALYSES, CSV_FIELDS, analyze_path, flatten_record, init_worker, iter_image_paths
+from result_cache import json_default
+
+SCHEMA_VERSION = 1
+
+# Result columns: the batch CSV fields without path, status, error and timings
+RESULT_COLUMNS = [field for field in CSV_FIELDS if field not in ('path', 'status', 'error')
+                  and not field.startswith('time_')]
+FILE_COLUMNS = ['path', 'size', 'mtime_ns', 'content_hash', 'analyses', 'options', 'status', 'error',
+                'results', 'timings', 'indexed_at']
+COLUMNS = FILE_COLUMNS + RESULT_COLUMNS
+TEXT_COLUMNS = {'path', 'content_hash', 'analyses', 'options', 'status', 'error', 'results', 'timings', 'ocr_text'}
+# Columns that can be filtered and sorted on
+QUERY_COLUMNS = [column for column in COLUMNS if column not in ('results', 'timings', 'options')]
+OPERATORS = ('<=', '>=', '!=', '<', '>', '=')
+# Indexed columns for the common queries
+INDEXED_COLUMNS = ('content_hash', 'blur_score', 'blur_laplacian', 'face_count', 'ocr_score', 'status')
+
+_FILTER_PATTERN = re.compile(r'^\s*(\w+)\s*(' + '|'.join(re.escape(op) for op in OPERATORS) + r')\s*(.*?)\s*$')
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """Hash of the file content"""
+    hasher = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as handle:
+        for chunk in iter(lambda: handle.read(chunk_size), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def parse_filter(text):
+    """('column', 'op', value) from 'column<op>value', e.g. 'blur_laplacian<40' or 'ocr_text_found=false'"""
+    match = _FILTER_PATTERN.match(text)
+    if not match:
+        raise ValueError(f"Invalid filter: {text} (expected COLUMN{'|'.join(OPERATORS)}VALUE)")
+    column, op, value = match.groups()
+    if value.lower() in ('null', 'none'):
+        value = None
+    elif value.lower() in ('true', 'false'):
+        value = value.lower() == 'true'
+    elif column not in TEXT_COLUMNS:
+        try:
+            value = float(value)
+        except ValueError:
+            raise ValueError(f"Invalid filter: {column} needs a number, not {value!r}")
+    return column, op, value
+
+
+def _column_value(value):
+    # Missing analyses are '' in the flattened record and NULL in the index
+    if value == '':
+        return None
+    if hasattr(value, 'item'):
+        return value.item()
+    return value
+
+
+class QualityIndex:
+    """SQLite index of analysis results, keyed by absolute file path"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.connection = sqlite3.connect(db_path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self._create_schema()
+
+    def _create_schema(self):
+        version = self.connection.execute('PRAGMA user_version').fetchone()[0]
+        if version not in (0, SCHEMA_VERSION):
+            raise RuntimeError(f"{self.db_path} has index schema {version}, this version reads {SCHEMA_VERSION}")
+        definitions = []
+        for column in COLUMNS:
+            kind = 'TEXT' if column in TEXT_COLUMNS else 'REAL'
+            if column in ('size', 'mtime_ns', 'human_detected', 'face_count', 'ocr_text_found', 'ocr_text_count'):
+                kind = 'INTEGER'
+            definitions.append(f"{column} {kind}{' PRIMARY KEY' if column == 'path' else ''}")
+        with self.connection:
+            self.connection.execute(f"CREATE TABLE IF NOT EXISTS images ({', '.join(definitions)})")
+            for column in INDEXED_COLUMNS:
+                self.connection.execute(f"CREATE INDEX IF NOT EXISTS images_{column} ON images ({column})")
+            self.connection.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+    def get(self, path):
+        """The row of one file as a dict, or None when it is not indexed"""
+        row = self.connection.execute('SELECT * FROM images WHERE path = ?', (os.path.abspath(path),)).fetchone()
+        return dict(row) if row else None
+
+    def _find_content(self, content_hash, options):
+        """An indexed row with this content and options that analysed without errors"""
+        row = self.connection.execute(
+            "SELECT * FROM images WHERE content_hash = ? AND options = ? AND status = 'ok' ORDER BY indexed_at DESC",
+            (content_hash, options)).fetchone()
+        return dict(row) if row else None
+
+    def _store(self, row):
+        placeholders = ', '.join('?' for _ in COLUMNS)
+        self.connection.execute(f"INSERT OR REPLACE INTO images ({', '.join(COLUMNS)}) VALUES ({placeholders})",
+                                [row.get(column) for column in COLUMNS])
+
+    def _store_record(self, record, file_info, analyses_run, previous=None):
+        """
+        Store an analyze_path record of analyses_run, merged into the previous
+        row when that is for the same content. Failed analyses count as done,
+        so an unchanged file is not retried on every scan.
+        """
+        results, timings, analyses = {}, {}, set()
+        if previous and previous['content_hash'] == file_info['content_hash'] \
+                and previous['options'] == file_info['options'] and previous['status'] == 'ok':
+            results = json.loads(previous['results'])
+            timings = json.loads(previous['timings'])
+            analyses = set(previous['analyses'].split(','))
+        results.update(record['results'])
+        timings.update(record['timings'])
+        analyses.update(analyses_run)
+
+        merged = {'path': file_info['path'], 'status': record['status'], 'error': record.get('error'),
+                  'results': results, 'timings': timings}
+        row = {column: _column_value(value) for column, value in flatten_record(merged).items()
+               if column in RESULT_COLUMNS}
+        row.update(file_info, status=record['status'], error=record.get('error'),
+                   analyses=','.join(name for name in ANALYSES if name in analyses),
+                   results=json.dumps(results, ensure_ascii=False, default=json_default),
+                   timings=json.dumps(timings), indexed_at=time.time())
+        self._store(row)
+
+    def scan(self, inputs=(), analyses=ANALYSES, workers=None, file_list=None, prune=False, retry_errors=False,
+             max_in_flight=None, blur_resolution='full', face_preset='balanced', blur_workers=1,
+             ocr_workers=1, commit_every=100, progress=None):
+        """
+        Bring the index up to date with the images under `inputs`.
+
+        analyses, workers, max_in_flight, blur_resolution, face_preset,
+        blur_workers and ocr_workers are as in batch_analysis.run_batch.
+        prune: drop rows of files under the scanned directories that no
+        longer exist
+        retry_errors: analyse unchanged files whose last analysis failed
+        commit_every: rows written per transaction; an interrupted scan
+        keeps everything committed before it
+        progress: optional callable receiving (path, outcome, counts)
+
+        Returns counts per outcome (see the module docstring) and timings.
+        """
+        analyses = tuple(analyses)
+        unknown = [name for name in analyses if name not in ANALYSES]
+        if unknown:
+            raise ValueError(f"Unknown analyses: {', '.join(unknown)}")
+        options = json.dumps({'blur_resolution': blur_resolution, 'face_preset': face_preset}, sort_keys=True)
+        workers = workers or os.cpu_count() or 1
+        max_in_flight = max_in_flight or 2 * workers
+
+        started = time.perf_counter()
+        counts = {'seen': 0, 'unchanged': 0, 'touched': 0, 'reused': 0, 'analyzed': 0, 'errors': 0,
+                  'missing': 0, 'removed': 0}
+        seen = set()
+        pending = {}  # future -> (file_info, analyses, previous row)
+        uncommitted = 0
+
+        def record_outcome(path, outcome):
+            nonlocal uncommitted
+            counts[outcome] += 1
+            if outcome != 'unchanged':
+                uncommitted += 1
+                if uncommitted >= commit_every:
+                    self.connection.commit()
+                    uncommitted = 0
+            if progress:
+                progress(path, outcome, counts)
+
+        def drain(return_when):
+            finished, _ = wait(pending, return_when=return_when)
+            for future in finished:
+                file_info, todo, previous = pending.pop(future)
+                record = future.result()
+                self._store_record(record, file_info, todo, previous)
+                if record['status'] != 'ok':
+                    counts['errors'] += 1
+                record_outcome(file_info['path'], 'analyzed')
+
+        executor = None
+        try:
+            for path in iter_image_paths(inputs, file_list):
+                path = os.path.abspath(path)
+                if path in seen:
+                    continue
+                seen.add(path)
+                counts['seen'] += 1
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    record_outcome(path, 'missing')
+                    continue
+
+                previous = self.get(path)
+                covered = previous is not None and previous['options'] == options \
+                    and set(analyses) <= set(previous['analyses'].split(','))
+                retry = previous is not None and previous['status'] != 'ok' and retry_errors
+                if previous and previous['size'] == stat.st_size and previous['mtime_ns'] == stat.st_mtime_ns \
+                        and covered and not retry:
+                    record_outcome(path, 'unchanged')
+                    continue
+
+                file_info = {'path': path, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                             'content_hash': file_digest(path), 'options': options}
+                same_content = previous is not None and previous['content_hash'] == file_info['content_hash']
+                if same_content and covered and not retry:
+                    with self.connection:
+                        self.connection.execute('UPDATE images SET size = ?, mtime_ns = ? WHERE path = ?',
+                                                (stat.st_size, stat.st_mtime_ns, path))
+                    record_outcome(path, 'touched')
+                    continue
+
+                if not same_content:
+                    copy = self._find_content(file_info['content_hash'], options)
+                    if copy and set(analyses) <= set(copy['analyses'].split(',')):
+                        copy.update(file_info, indexed_at=time.time())
+                        self._store(copy)
+                        record_outcome(path, 'reused')
+                        continue
+
+                # Same content and options: only the analyses the row is missing
+                todo = analyses
+                if same_content and previous['options'] == options and previous['status'] == 'ok':
+                    todo = tuple(name for name in analyses if name not in previous['analyses'].split(','))
+                if executor is None:
+                    executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                                   initargs=(blur_resolution, face_preset, blur_workers,
+                                                             ocr_workers))
+                # Backpressure: wait for a slot before reading further input
+                if len(pending) >= max_in_flight:
+                    drain(FIRST_COMPLETED)
+                pending[executor.submit(analyze_path, path, todo)] = (file_info, todo, previous)
+            if pending:
+                drain(ALL_COMPLETED)
+            if prune:
+                counts['removed'] = self._prune(inputs, seen)
+        except BaseException:
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        else:
+            if executor is not None:
+                executor.shutdown()
+        finally:
+            self.connection.commit()
+
+        elapsed = time.perf_counter() - started
+        counts['elapsed_seconds'] = round(elapsed, 3)
+        counts['files_per_second'] = round(counts['seen'] / elapsed, 3) if elapsed > 0 else 0.0
+        return counts
+
+    def _prune(self, inputs, seen):
+        """Delete rows under the scanned directories whose files were not seen"""
+        removed = 0
+        for root in inputs:
+            if not os.path.isdir(root):
+                continue
+            prefix = os.path.join(os.path.abspath(root), '')
+            rows = self.connection.execute("SELECT path FROM images WHERE substr(path, 1, ?) = ?",
+                                           (len(prefix), prefix)).fetchall()
+            stale = [(row['path'],) for row in rows if row['path'] not in seen]
+            self.connection.executemany('DELETE FROM images WHERE path = ?', stale)
+            removed += len(stale)
+        return removed
+
+    def query(self, filters=(), order_by=None, descending=False, limit=None, columns=None):
+        """
+        Indexed rows matching every (column, op, value) filter, as dicts.
+
+        op is one of <, <=, >, >=, =, != (a None value matches NULL with =
+        and non-NULL with !=). Example, sharpness-failing images without a
+        face: [('blur_laplacian', '<', 40), ('face_count', '=', 0)].
+        columns: the columns to return (default: all but the JSON ones)
+        """
+        columns = list(columns or QUERY_COLUMNS)
+        for column in columns + [column for column, _, _ in filters] + ([order_by] if order_by else []):
+            if column not in COLUMNS:
+                raise ValueError(f"Unknown index column: {column}")
+        clauses, params = [], []
+        for column, op, value in filters:
+            if op not in OPERATORS:
+                raise ValueError(f"Unknown operator: {op}")
+            if value is None:
+                if op not in ('=', '!='):
+                    raise ValueError(f"{column}{op}NULL is not a valid filter")
+                clauses.append(f"{column} IS {'NOT ' if op == '!=' else ''}NULL")
+            else:
+                clauses.append(f"{column} {op} ?")
+                params.append(value)
+        sql = f"SELECT {', '.join(columns)} FROM images"
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        sql += f" ORDER BY {order_by or 'path'}{' DESC' if descending else ''}"
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(int(limit))
+        return [dict(row) for row in self.connection.execute(sql, params)]
+
+    def stats(self):
+        """Row counts per status and per analysis"""
+        by_status = dict(self.connection.execute('SELECT status, COUNT(*) FROM images GROUP BY status').fetchall())
+        analysed = {name: self.connection.execute("SELECT COUNT(*) FROM images WHERE ',' || analyses || ',' LIKE ?",
+                                                  (f'%,{name},%',)).fetchone()[0]
+                    for name in ANALYSES}
+        return {'files': sum(by_status.values()), 'by_status': by_status, 'by_analysis': analysed}
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Incremental SQLite quality index of image archives")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    scan = commands.add_parser('scan', help='index new and changed images')
+    scan.add_argument('db', help='index database file (created if missing)')
+    scan.add_argument('inputs', nargs='*', help='image files or directories (searched recursively)')
+    scan.add_argument('--file-list', help="file with one image path per line ('-' for stdin)")
+    scan.add_argument('--analyses', default=','.join(ANALYSES),
+                      help='comma-separated analyses to run: blur,face,ocr (default: all)')
+    scan.add_argument('--workers', type=int, help='worker processes (default: CPU count)')
+    scan.add_argument('--max-in-flight', type=int, help='maximum queued images (default: 2 x workers)')
+    scan.add_argument('--blur-resolution', choices=['full', 'auto'], default='full',
+                      help='blur scoring resolution, as in batch_analysis.py (default: full)')
+    scan.add_argument('--face-preset', choices=['fast', 'balanced', 'accurate'], default='balanced',
+                      help='face detection preset (default: balanced)')
+    scan.add_argument('--blur-workers', type=int, default=1, help='threads per process for the blur bands')
+    scan.add_argument('--ocr-workers', type=int, default=1, help='threads per process for the OCR variants')
+    scan.add_argument('--prune', action='store_true', help='drop rows of deleted files under the directories')
+    scan.add_argument('--retry-errors', action='store_true', help='re-analyse unchanged files that failed')
+    scan.add_argument('--quiet', action='store_true', help='do not print progress')
+
+    query = commands.add_parser('query', help='list indexed images matching filters')
+    query.add_argument('db', help='index database file')
+    query.add_argument('--filter', action='append', default=[], dest='filters',
+                       help="COLUMN<op>VALUE with op one of < <= > >= = != (repeatable, all must match), "
+                            "e.g. 'blur_laplacian<40' 'face_count=0'")
+    query.add_argument('--order-by', help='column to sort by (default: path)')
+    query.add_argument('--desc', action='store_true', help='sort in descending order')
+    query.add_argument('--limit', type=int, help='maximum rows')
+    query.add_argument('--columns', help='comma-separated columns to print (default: all but the JSON ones)')
+    query.add_argument('--format', choices=['paths', 'jsonl'], default='jsonl', help='output format')
+
+    stats = commands.add_parser('stats', help='row counts per status and analysis')
+    stats.add_argument('db', help='index database file')
+    args = parser.parse_args(argv)
+
+    if args.command == 'scan' and not args.inputs and not args.file_list:
+        parser.error('no inputs given')
+
+    with QualityIndex(args.db) as index:
+        if args.command == 'stats':
+            print(json.dumps(index.stats(), indent=2))
+            return 0
+
+        if args.command == 'query':
+            try:
+                columns = [name.strip() for name in args.columns.split(',')] if args.columns else None
+                if args.format == 'paths':
+                    columns = ['path']
+                rows = index.query([parse_filter(text) for text in args.filters], order_by=args.order_by,
+                                   descending=args.desc, limit=args.limit, columns=columns)
+            except ValueError as e:
+                parser.error(str(e))
+            for row in rows:
+                print(row['path'] if args.format == 'paths' else json.dumps(row, ensure_ascii=False))
+            return 0
+
+        def report(path, outcome, counts):
+            if not args.quiet and outcome == 'analyzed' and counts['analyzed'] % 100 == 0:
+                print(f"  {counts['analyzed']} images analysed of {counts['seen']} seen ({counts['errors']} errors)",
+                      file=sys.stderr)
+
+        analyses = [name.strip() for name in args.analyses.split(',') if name.strip()]
+        try:
+            summary = index.scan(args.inputs, analyses=analyses, workers=args.workers, file_list=args.file_list,
+                                 prune=args.prune, retry_errors=args.retry_errors,
+                                 max_in_flight=args.max_in_flight, blur_resolution=args.blur_resolution,
+                                 face_preset=args.face_preset, blur_workers=args.blur_workers,
+                                 ocr_workers=args.ocr_workers, progress=report)
+        except ValueError as e:
+            parser.error(str(e))
+
+    print(json.dumps(summary, indent=2), file=sys.stderr)
+    return 0 if summary['errors'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Content-addressed cache of analysis results.
+
+Entries are keyed by a hash of the decoded pixels (plus shape and dtype),
+the analysis type and its parameters, so re-submitting the same scan - even
+re-encoded or under another file name - returns the stored result instead of
+rerunning the pipeline.
+
+There are two tiers:
+
+    memory  bounded LRU (entry count and total bytes), always on
+    disk    optional directory of JSON files (e.g. results/cache), bounded
+            by total bytes and shared between worker processes
+
+Both tiers expire entries after ttl_seconds. Results are stored as JSON so
+the byte size of each entry is known and disk entries are portable. Per-run
+timings (TIMING_FIELDS) are cleared before storing: a hit ran nothing, so it
+must not report the latencies of the run that filled the cache.
+Counters (hits per tier, misses, evictions, expirations) are available from
+stats() for sizing the cache.
+"""
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+# Per-run timings inside analysis results, and what a cached copy reports instead
+TIMING_FIELDS = {'latency_ms': None, 'variant_latency_ms': {}, 'check_ms': None}
+
+
+def json_default(value):
+    """json.dumps default= for NumPy scalars (as Python numbers) and anything else JSON does not know (as str)"""
+    return value.item() if hasattr(value, 'item') else str(value)
+
+
+def image_digest(image):
+    """Hash of the decoded pixels of an ndarray, including its shape and dtype"""
+    hasher = hashlib.blake2b(digest_size=20)
+    hasher.update(f"{image.shape}|{image.dtype}".encode())
+    hasher.update(image.data if image.flags['C_CONTIGUOUS'] else image.tobytes())
+    return hasher.hexdigest()
+
+
+def make_key(digest, analysis, params=None):
+    """Cache key for one analysis of the image with the given image_digest() and parameters"""
+    params_json = json.dumps(params or {}, sort_keys=True, default=json_default)
+    params_digest = hashlib.blake2b(params_json.encode(), digest_size=8).hexdigest()
+    return f"{digest}-{analysis}-{params_digest}"
+
+
+def without_timings(result):
+    """Copy of a result with the TIMING_FIELDS cleared at any depth"""
+    if isinstance(result, dict):
+        return {key: copy.copy(TIMING_FIELDS[key]) if key in TIMING_FIELDS else without_timings(value)
+                for key, value in result.items()}
+    if isinstance(result, list):
+        return [without_timings(item) for item in result]
+    return result
+
+
+def is_cacheable(result):
+    """Errors are never cached"""
+    return "error" not in result
+
+
+class ResultCache:
+    """Two-tier (memory LRU + optional disk) cache of JSON-serializable results"""
+
+    def __init__(self, max_entries=256, max_bytes=256 * 1024 * 1024, ttl_seconds=3600,
+                 disk_dir=None, disk_max_bytes=1024 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (stored_at, payload bytes)
+        self._bytes = 0
+        self._counters = {
+            'hits': 0, 'memory_hits': 0, 'disk_hits': 0, 'misses': 0,
+            'stores': 0, 'evictions': 0, 'disk_evictions': 0, 'expirations': 0,
+        }
+
+        self._disk_bytes = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._disk_files())
+
+    def _expired(self, stored_at, now):
+        return self.ttl_seconds is not None and now - stored_at > self.ttl_seconds
+
+    def get(self, key):
+        """Cached result for key, or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, payload = entry
+                if not self._expired(stored_at, now):
+                    self._entries.move_to_end(key)
+                    self._counters['hits'] += 1
+                    self._counters['memory_hits'] += 1
+                    return json.loads(payload)
+                self._remove(key)
+                self._counters['expirations'] += 1
+
+        payload, stored_at = self._disk_get(key, now)
+        with self._lock:
+            if payload is None:
+                self._counters['misses'] += 1
+                return None
+            self._counters['hits'] += 1
+            self._counters['disk_hits'] += 1
+            # Promote to the memory tier, keeping the original age
+            self._insert(key, stored_at, payload)
+        return json.loads(payload)
+
+    def put(self, key, result):
+        """Store a result without its timings (must be JSON-serializable, NumPy scalars allowed)"""
+        payload = json.dumps(without_timings(result), default=json_default).encode('utf-8')
+        now = time.time()
+        with self._lock:
+            self._counters['stores'] += 1
+            self._insert(key, now, payload)
+        self._disk_put(key, payload)
+
+    def get_or_compute(self, key, compute, should_store=is_cacheable):
+        """Return (result, hit); compute and store the result on a miss"""
+        result = self.get(key)
+        if result is not None:
+            return result, True
+        result = compute()
+        if should_store(result):
+            self.put(key, result)
+        return result, False
+
+    def _insert(self, key, stored_at, payload):
+        if key in self._entries:
+            self._remove(key)
+        if self.max_bytes is not None and len(payload) > self.max_bytes:
+            return
+        self._entries[key] = (stored_at, payload)
+        self._bytes += len(payload)
+        while self._entries and (len(self._entries) > self.max_entries
+                                 or (self.max_bytes is not None and self._bytes > self.max_bytes)):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self._counters['evictions'] += 1
+
+    def _remove(self, key):
+        _, payload = self._entries.pop(key)
+        self._bytes -= len(payload)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _disk_files(self):
+        """(path, size, mtime) of every disk entry"""
+        files = []
+        for entry in os.scandir(self.disk_dir):
+            if entry.name.endswith('.json'):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files.append((entry.path, stat.st_size, stat.st_mtime))
+        return files
+
+    def _disk_get(self, key, now):
+        if not self.disk_dir:
+            return None, None
+        path = self._disk_path(key)
+        try:
+            stored_at = os.path.getmtime(path)
+            if self._expired(stored_at, now):
+                os.remove(path)
+                with self._lock:
+                    self._counters['expirations'] += 1
+                return None, None
+            with open(path, 'rb') as handle:
+                return handle.read(), stored_at
+        except OSError:
+            return None, None
+
+    def _disk_put(self, key, payload):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, 'wb') as handle:
+                handle.write(payload)
+            os.replace(temp_path, path)
+        except OSError:
+            return
+        with self._lock:
+            self._disk_bytes += len(payload)
+            over_budget = self._disk_bytes > self.disk_max_bytes
+        if over_budget:
+            self._disk_evict()
+
+    def _disk_evict(self):
+        """Drop expired and then oldest disk entries until under the byte budget"""
+        now = time.time()
+        files = sorted(self._disk_files(), key=lambda item: item[2])
+        total = sum(size for _, size, _ in files)
+        evicted = expired = 0
+        for path, size, mtime in files:
+            is_expired = self._expired(mtime, now)
+            if not is_expired and total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            if is_expired:
+                expired += 1
+            else:
+                evicted += 1
+        with self._lock:
+            self._disk_bytes = total
+            self._counters['disk_evictions'] += evicted
+            self._counters['expirations'] += expired
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self.disk_dir:
+            for path, _, _ in self._disk_files():
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+            with self._lock:
+                self._disk_bytes = 0
+
+    def stats(self):
+        """Counters and current sizes of both tiers"""
+        with self._lock:
+            lookups = self._counters['hits'] + self._counters['misses']
+            return dict(
+                self._counters,
+                hit_ratio=round(self._counters['hits'] / lookups, 4) if lookups else 0.0,
+                entries=len(self._entries),
+                bytes=self._bytes,
+                max_entries=self.max_entries,
+                max_bytes=self.max_bytes,
+                ttl_seconds=self.ttl_seconds,
+                disk_enabled=bool(self.disk_dir),
+                disk_bytes=self._disk_bytes,
+                disk_max_bytes=self.disk_max_bytes if self.disk_dir else None,
+            )
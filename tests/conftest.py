@@ -0,0 +1,31 @@
+import importlib
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The modules live at the repository root; the synthetic corpus in benchmarks/
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    """The web app, imported in a scratch directory (it creates uploads/ and results/ there)"""
+    scratch = tmp_path_factory.mktemp('app')
+    cwd = os.getcwd()
+    os.chdir(scratch)
+    try:
+        module = importlib.import_module('app')
+    finally:
+        os.chdir(cwd)
+    for name in ('UPLOAD_FOLDER', 'RESULTS_FOLDER', 'VISUALIZATION_FOLDER', 'RESULT_CACHE_DIR'):
+        module.app.config[name] = str(scratch / module.app.config[name])
+    return module
+
+
+@pytest.fixture
+def client(app_module):
+    app_module.app.config['TESTING'] = True
+    return app_module.app.test_client()
@@ -0,0 +1,123 @@
+import io
+import struct
+import threading
+import zlib
+
+import cv2
+import numpy as np
+import pytest
+
+from admission import (CONCURRENCY, DEFAULT_MAX_PIXELS, MEMORY, TOO_LARGE, AdmissionController, Rejected,
+                       image_dimensions, memory_budget_for, memory_cost, pixel_count)
+
+ANALYSES = ('blur', 'face', 'ocr')
+
+
+def png_header(width, height):
+    """A PNG signature and IHDR chunk claiming width x height, without the pixels"""
+    ihdr = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + struct.pack('>I', len(ihdr)) + b'IHDR' + ihdr
+            + struct.pack('>I', zlib.crc32(b'IHDR' + ihdr)))
+
+
+@pytest.mark.parametrize('extension', ['.png', '.jpg', '.bmp'])
+def test_image_dimensions_from_header(extension):
+    _, encoded = cv2.imencode(extension, np.zeros((37, 53, 3), np.uint8))
+    stream = io.BytesIO(encoded.tobytes())
+    assert image_dimensions(stream) == (53, 37)
+    assert stream.tell() == 0
+
+
+def test_image_dimensions_of_unknown_data():
+    assert image_dimensions(io.BytesIO(b'not an image')) is None
+
+
+def test_largest_accepted_image_fits_the_default_budget_alone():
+    budget = memory_budget_for(DEFAULT_MAX_PIXELS, ANALYSES)
+    assert memory_cost((8000, 6000), ANALYSES) <= budget
+    controller = AdmissionController({name: 1 for name in ANALYSES}, memory_budget=budget,
+                                     max_pixels=DEFAULT_MAX_PIXELS)
+    with controller.admit(ANALYSES, memory_cost((8000, 6000), ANALYSES), pixel_count((8000, 6000))):
+        pass
+    assert controller.stats()['admitted'] == 1
+
+
+def test_image_above_max_pixels_is_too_large():
+    controller = AdmissionController({'blur': 1}, max_pixels=1000)
+    with pytest.raises(Rejected) as rejected:
+        with controller.admit(['blur'], pixels=1001):
+            pass
+    assert rejected.value.reason == TOO_LARGE and rejected.value.retry_after is None
+
+
+def test_estimate_above_the_budget_is_too_large():
+    controller = AdmissionController({'blur': 1}, memory_budget=100)
+    with pytest.raises(Rejected) as rejected:
+        with controller.admit(['blur'], 101):
+            pass
+    assert rejected.value.reason == TOO_LARGE
+
+
+def test_busy_slot_rejects_after_the_queue_timeout():
+    controller = AdmissionController({'ocr': 1}, queue_timeout=0.05, retry_after=7)
+    with controller.admit(['ocr']):
+        with pytest.raises(Rejected) as rejected:
+            with controller.admit(['ocr', 'blur']):
+                pass
+    assert rejected.value.reason == CONCURRENCY and rejected.value.retry_after == 7
+    # Other analysis types are not held up
+    with controller.admit(['blur']):
+        pass
+    assert controller.stats()['rejected'][CONCURRENCY] == 1
+
+
+def test_too_many_waiting_requests_are_rejected_at_once():
+    controller = AdmissionController({'face': 1}, queue_timeout=5, max_waiting=0)
+    with controller.admit(['face']):
+        with pytest.raises(Rejected, match='waiting'):
+            with controller.admit(['face']):
+                pass
+
+
+def test_exhausted_memory_budget_rejects_then_recovers():
+    controller = AdmissionController({'blur': 2}, memory_budget=100, queue_timeout=0.05)
+    with controller.admit(['blur'], 60):
+        assert controller.stats()['memory_reserved_bytes'] == 60
+        with pytest.raises(Rejected) as rejected:
+            with controller.admit(['blur'], 60):
+                pass
+        assert rejected.value.reason == MEMORY
+    with controller.admit(['blur'], 60):
+        pass
+    assert controller.stats()['memory_reserved_bytes'] == 0
+
+
+def test_waiting_request_is_admitted_when_memory_is_released():
+    controller = AdmissionController({'blur': 2}, memory_budget=100, queue_timeout=5)
+    held, admitted = threading.Event(), threading.Event()
+
+    def first():
+        with controller.admit(['blur'], 60):
+            held.set()
+            admitted.wait(0.1)
+
+    thread = threading.Thread(target=first)
+    thread.start()
+    held.wait(5)
+    with controller.admit(['blur'], 60):
+        admitted.set()
+    thread.join()
+    assert controller.stats()['admitted'] == 2
+
+
+def test_app_budget_admits_a_48_mp_analyze(app_module):
+    controller = app_module.admission_controller
+    factors = app_module.app.config['ADMISSION_MEMORY_FACTORS']
+    assert memory_cost((8000, 6000), ANALYSES, factors) <= controller.memory_budget
+
+
+def test_app_answers_413_for_an_oversized_image(client):
+    response = client.post('/blur_detection',
+                           data={'file': (io.BytesIO(png_header(10000, 10000)), 'huge.png')})
+    assert response.status_code == 413
+    assert response.get_json()['reason'] == TOO_LARGE
@@ -0,0 +1,41 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Imports the app with the background warm-up held back, then reports which heavy modules are loaded
+IMPORT_APP = """
+import json, sys
+sys.path.insert(0, sys.argv[1])
+import analyzer_registry
+analyzer_registry.start_warm_up = lambda: None
+import app
+print(json.dumps(sorted(name for name in ('cv2', 'numpy', 'pytesseract', 'PIL', 'enhanced_analysis')
+                        if name in sys.modules)))
+"""
+
+
+def test_importing_the_app_skips_the_heavy_modules(tmp_path):
+    # The app creates its upload and result folders in the working directory
+    output = subprocess.run([sys.executable, '-c', IMPORT_APP, ROOT], cwd=tmp_path, capture_output=True, text=True,
+                            check=True).stdout
+    assert json.loads(output) == []
+
+
+def test_one_analyzer_per_process(app_module):
+    registry = app_module.analyzer_registry
+    analyzer = registry.get_analyzer()
+    assert registry.get_analyzer() is analyzer and registry.warm_up() is analyzer
+    status = registry.status()
+    assert status['ready'] and status['status'] == registry.READY
+    assert status['components']['face_cascade'] == {'loaded': True}
+    assert 'tesseract' in status['components']
+
+
+def test_health_reports_the_warm_up(app_module, client):
+    app_module.analyzer_registry.get_analyzer()
+    response = client.get('/health')
+    assert response.status_code == 200
+    assert response.get_json()['warm_up']['ready'] is True
@@ -0,0 +1,85 @@
+import io
+from tempfile import SpooledTemporaryFile
+
+import cv2
+import pytest
+
+from corpus import face_scene
+
+
+def upload(image, name='scan.png', **fields):
+    _, buffer = cv2.imencode('.png', image)
+    return dict(fields, file=(io.BytesIO(buffer.tobytes()), name))
+
+
+@pytest.fixture(scope='module')
+def faces_image():
+    return face_scene(800, 600, seed=2)[0]
+
+
+def test_blur_face_regions_follow_face_options(client, faces_image):
+    default = client.post('/blur_detection', data=upload(faces_image, regions='faces', visualize='off'))
+    assert default.status_code == 200
+    assert default.get_json()['results']['region_count'] > 0
+
+    # The face options reach the detector and are part of the cache key
+    none_fit = client.post('/blur_detection', data=upload(faces_image, regions='faces', visualize='off',
+                                                          min_face='100000'))
+    assert none_fit.status_code == 200
+    assert none_fit.headers.get('X-Cache') == 'MISS'
+    assert none_fit.get_json()['results']['region_count'] == 0
+
+    again = client.post('/blur_detection', data=upload(faces_image, regions='faces', visualize='off'))
+    assert again.headers.get('X-Cache') == 'HIT'
+    assert again.get_json()['results'] == default.get_json()['results']
+
+
+def test_blur_face_regions_reject_bad_face_options(client, faces_image):
+    response = client.post('/blur_detection', data=upload(faces_image, regions='faces', face_preset='slowest'))
+    assert response.status_code == 400
+
+
+def test_analyze_passes_face_options_to_blur_regions(client, faces_image):
+    response = client.post('/analyze', data=upload(faces_image, analyses='blur,face', regions='faces',
+                                                   visualize='off', min_face='100000'))
+    results = response.get_json()['results']
+    assert results['face']['face_count'] == 0
+    assert results['blur']['region_count'] == 0
+
+
+@pytest.mark.parametrize('size, on_disk', [(512, False), (4096, True)])
+def test_uploads_spill_to_disk_only_above_the_threshold(app_module, monkeypatch, size, on_disk):
+    monkeypatch.setitem(app_module.app.config, 'UPLOAD_SPOOL_THRESHOLD', 1024)
+    data = {'file': (io.BytesIO(b'x' * size), 'scan.png')}
+    with app_module.app.test_request_context('/blur_detection', method='POST', data=data):
+        stream = app_module.request.files['file'].stream
+        assert isinstance(stream, SpooledTemporaryFile)
+        assert stream._rolled == on_disk
+        assert stream.read() == b'x' * size
+
+
+def test_spilled_upload_is_analysed(client, app_module, monkeypatch, faces_image):
+    monkeypatch.setitem(app_module.app.config, 'UPLOAD_SPOOL_THRESHOLD', 1024)
+    response = client.post('/blur_detection', data=upload(faces_image, visualize='off'))
+    assert response.status_code == 200
+    assert response.get_json()['results']['score'] > 0
+
+
+def test_analyze_reports_a_failing_stage_and_runs_the_others(client, app_module, monkeypatch):
+    def broken(*args, **kwargs):
+        raise RuntimeError('cascade missing')
+
+    analyzer = app_module.analyzer_registry.get_analyzer()
+    monkeypatch.setattr(analyzer, 'analyze_human_detection', broken)
+    image = face_scene(640, 480, seed=9)[0]
+    response = client.post('/analyze', data=upload(image, analyses='blur,face,ocr', visualize='off'))
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['success'] is False
+    assert body['results']['face'] == {'error': 'face error: cascade missing'}
+    assert 'error' not in body['results']['blur'] and body['results']['blur']['score'] > 0
+    assert 'ocr' in body['results']
+    # The failed stage is timed like the others
+    timings = body['timings_ms']
+    assert {'decode', 'blur', 'face', 'ocr', 'encode_original', 'total'} <= set(timings)
+    assert all(value >= 0 for value in timings.values())
@@ -0,0 +1,97 @@
+import cv2
+import pytest
+
+import batch_analysis
+from corpus import make_image
+
+
+@pytest.fixture
+def image_path(tmp_path):
+    path = tmp_path / 'card.png'
+    cv2.imwrite(str(path), make_image('id_card', 320, 200, 0))
+    return str(path)
+
+
+@pytest.fixture
+def worker(monkeypatch):
+    """A fresh per-process analyzer, dropped again after the test"""
+    monkeypatch.setattr(batch_analysis, '_worker_analyzer', None)
+    batch_analysis.init_worker()
+    return batch_analysis._worker_analyzer
+
+
+def test_failing_analysis_does_not_stop_the_others(worker, image_path, monkeypatch):
+    def broken(image, output=None):
+        raise RuntimeError("cascade missing")
+
+    monkeypatch.setattr(worker, 'analyze_human_detection', broken)
+    monkeypatch.setattr(worker, 'analyze_ocr', lambda image, output=None: {'score': 0, 'text_found': False})
+    record = batch_analysis.analyze_path(image_path, ('blur', 'face', 'ocr'))
+
+    assert record['status'] == 'error'
+    assert record['errors'] == {'face': "face error: cascade missing"}
+    assert record['error'] == "face error: cascade missing"
+    # The analyses before and after the failure both ran and kept their results
+    assert set(record['results']) == {'blur', 'ocr'}
+    assert {'blur', 'face', 'ocr'} <= set(record['timings'])
+
+
+def test_every_error_is_recorded(worker, image_path, monkeypatch):
+    monkeypatch.setattr(worker, 'analyze_human_detection', lambda image, output=None: {'error': "no faces"})
+    monkeypatch.setattr(worker, 'analyze_ocr', lambda image, output=None: {'error': "no tesseract"})
+    record = batch_analysis.analyze_path(image_path, ('blur', 'face', 'ocr'))
+
+    assert record['errors'] == {'face': "no faces", 'ocr': "no tesseract"}
+    assert record['error'] == "no faces; no tesseract"
+    assert list(record['results']) == ['blur']
+    row = batch_analysis.flatten_record(record)
+    assert row['status'] == 'error' and row['blur_score'] != ''
+
+
+def test_successful_record_has_no_errors(worker, image_path):
+    record = batch_analysis.analyze_path(image_path, ('blur',))
+    assert record['status'] == 'ok'
+    assert 'errors' not in record and 'error' not in record
+    assert 'visualization' not in record['results']['blur']
+
+
+def test_unreadable_image_is_an_error(worker, tmp_path):
+    path = tmp_path / 'broken.png'
+    path.write_bytes(b'not an image')
+    record = batch_analysis.analyze_path(str(path), ('blur',))
+    assert record['status'] == 'error'
+    assert record['error'] == 'Could not load image'
+    assert record['results'] == {}
+
+
+def test_worker_runs_one_ocr_variant_at_a_time(worker):
+    # The process pool already uses every core
+    assert worker.ocr_executor.max_workers == 1
+
+
+def test_worker_ocr_threads_can_be_raised(monkeypatch):
+    monkeypatch.setattr(batch_analysis, '_worker_analyzer', None)
+    batch_analysis.init_worker(ocr_workers=3)
+    assert batch_analysis._worker_analyzer.ocr_executor.max_workers == 3
+
+
+@pytest.mark.parametrize('fmt', ['jsonl', 'csv'])
+def test_resume_skips_only_successful_records(tmp_path, fmt):
+    output = str(tmp_path / f'results.{fmt}')
+    writer = batch_analysis.ResultWriter(output, fmt)
+    writer.write({'path': 'good.png', 'status': 'ok', 'results': {}, 'timings': {}})
+    writer.write({'path': 'bad.png', 'status': 'error', 'error': 'Could not load image', 'results': {},
+                  'timings': {}})
+    writer.close()
+    assert batch_analysis.completed_paths(output, fmt) == {'good.png'}
+
+
+def test_rerun_retries_failed_images(tmp_path, image_path):
+    broken = tmp_path / 'broken.png'
+    broken.write_bytes(b'not an image')
+    output = str(tmp_path / 'results.jsonl')
+
+    first = batch_analysis.run_batch([str(tmp_path)], output, analyses=('blur',), workers=1)
+    assert first['processed'] == 2 and first['errors'] == 1
+    second = batch_analysis.run_batch([str(tmp_path)], output, analyses=('blur',), workers=1)
+    assert second['skipped'] == 1 and second['processed'] == 1 and second['errors'] == 1
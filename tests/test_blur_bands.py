@@ -0,0 +1,96 @@
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+import pytest
+
+from blur_map import band_pixels_for, compute_blur_map
+from blur_metrics import BlurFeatures, run_blur_metrics
+from corpus import synthetic_scene
+
+BAND_PIXELS = 1 << 16
+
+
+@pytest.fixture(scope='module')
+def gray():
+    return synthetic_scene(640, 480, seed=3)
+
+
+def loop_blur_map(gray, window_size=15):
+    """The original sliding-window loop the vectorized map replaced"""
+    height, width = gray.shape
+    blur_map = np.zeros((height, width))
+    for i in range(0, height - window_size, window_size // 2):
+        for j in range(0, width - window_size, window_size // 2):
+            laplacian_var = cv2.Laplacian(gray[i:i + window_size, j:j + window_size], cv2.CV_64F).var()
+            blur_map[i:i + window_size, j:j + window_size] = min(255, max(0, 255 - laplacian_var / 2))
+    return np.uint8(blur_map)
+
+
+def test_banded_blur_map_equals_unbanded(gray):
+    banded = compute_blur_map(gray, band_pixels=BAND_PIXELS)
+    unbanded = compute_blur_map(gray, band_pixels=None)
+    np.testing.assert_array_equal(banded, unbanded)
+
+
+def test_blur_map_matches_window_loop(gray):
+    crop = gray[:120, :160]
+    np.testing.assert_array_equal(compute_blur_map(crop, band_pixels=1 << 12), loop_blur_map(crop))
+
+
+@pytest.mark.parametrize('band_pixels', [1 << 12, BAND_PIXELS])
+def test_banded_metrics_equal_unbanded(gray, band_pixels):
+    banded = run_blur_metrics(BlurFeatures(gray, band_pixels=band_pixels))
+    unbanded = run_blur_metrics(BlurFeatures(gray, band_pixels=None))
+    assert banded.keys() == unbanded.keys()
+    for name in unbanded:
+        assert banded[name] == pytest.approx(unbanded[name], rel=1e-9), name
+
+
+def test_banded_derivatives_equal_whole_image(gray):
+    features = BlurFeatures(gray, band_pixels=BAND_PIXELS)
+    laplacian = cv2.Laplacian(gray, cv2.CV_64F)
+    gradient = cv2.magnitude(cv2.Sobel(gray, cv2.CV_64F, 1, 0, ksize=3), cv2.Sobel(gray, cv2.CV_64F, 0, 1, ksize=3))
+    assert features.laplacian_variance == pytest.approx(laplacian.var(), rel=1e-9)
+    assert features.gradient_magnitude_mean == pytest.approx(gradient.mean(), rel=1e-6)
+
+
+def peak_bytes_per_pixel(func, gray):
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / gray.size
+
+
+def test_bands_bound_peak_memory():
+    gray = np.random.default_rng(0).integers(0, 256, (1500, 2000), dtype=np.uint8)
+
+    def metrics(band_pixels):
+        features = BlurFeatures(gray, band_pixels=band_pixels)
+        return lambda: (features.laplacian_variance, features.gradient_magnitude_mean)
+
+    banded = peak_bytes_per_pixel(metrics(1 << 18), gray)
+    unbanded = peak_bytes_per_pixel(metrics(None), gray)
+    assert banded < 2.0 < 8.0 < unbanded
+
+    # The map itself is one byte per pixel; the banded Laplacian adds little on top
+    banded = peak_bytes_per_pixel(lambda: compute_blur_map(gray, band_pixels=1 << 18), gray)
+    unbanded = peak_bytes_per_pixel(lambda: compute_blur_map(gray, band_pixels=None), gray)
+    assert banded < 4.0 < 12.0 < unbanded
+
+
+def test_executor_matches_serial(gray):
+    band_pixels = band_pixels_for(gray.size, workers=4)
+    serial = run_blur_metrics(BlurFeatures(gray, band_pixels=band_pixels))
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        threaded = run_blur_metrics(BlurFeatures(gray, band_pixels=band_pixels, executor=executor))
+        blur_map = compute_blur_map(gray, band_pixels=band_pixels, executor=executor)
+    assert threaded.keys() == serial.keys()
+    # Equal up to floating-point summation order
+    for name in serial:
+        assert threaded[name] == pytest.approx(serial[name], rel=1e-9), name
+    np.testing.assert_array_equal(blur_map, compute_blur_map(gray, band_pixels=band_pixels))
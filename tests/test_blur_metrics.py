@@ -0,0 +1,91 @@
+import cv2
+import numpy as np
+import pytest
+
+from blur_metrics import BLUR_METRICS, BlurFeatures, run_blur_metrics, weighted_blur_score
+from corpus import make_image
+
+
+# The per-metric computations BlurFeatures replaced, each starting from the grayscale image
+
+
+def baseline_laplacian(gray):
+    return min(100, cv2.Laplacian(gray, cv2.CV_64F).var() / 10)
+
+
+def baseline_gradient_mean(gray):
+    grad_x = cv2.Sobel(gray, cv2.CV_64F, 1, 0, ksize=3)
+    grad_y = cv2.Sobel(gray, cv2.CV_64F, 0, 1, ksize=3)
+    return np.mean(np.sqrt(grad_x**2 + grad_y**2))
+
+
+def baseline_spectrum_window(gray):
+    magnitude_spectrum = np.log(np.abs(np.fft.fftshift(np.fft.fft2(gray))) + 1)
+    rows, cols = gray.shape
+    crow, ccol = rows//2, cols//2
+    return magnitude_spectrum[crow-30:crow+30, ccol-30:ccol+30]
+
+
+def baseline_scores(gray):
+    edges = cv2.Canny(gray, 50, 150)
+    return {
+        "laplacian": baseline_laplacian(gray),
+        "sobel": min(100, baseline_gradient_mean(gray) / 2),
+        "fft": min(100, np.mean(baseline_spectrum_window(gray)) * 2),
+        "gradient": min(100, baseline_gradient_mean(gray) / 3),
+        "edge_density": min(100, np.sum(edges > 0) / (edges.shape[0] * edges.shape[1]) * 1000),
+    }
+
+
+def gray_image(kind, width, height, sigma=0):
+    image = make_image(kind, width, height, 7)
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return cv2.GaussianBlur(image, (0, 0), sigma) if sigma else image
+
+
+# Sharp and blurred content, even and odd sizes, and an image smaller than the spectrum window
+CASES = [('sharp', 640, 480, 0), ('sharp', 517, 333, 3), ('texture', 640, 480, 2), ('id_card', 401, 251, 1.5),
+         ('gaussian', 48, 40, 0)]
+
+
+@pytest.fixture(params=CASES, ids=lambda case: '-'.join(map(str, case)))
+def gray(request):
+    return gray_image(*request.param)
+
+
+def test_shared_features_match_the_separate_computations(gray):
+    features = BlurFeatures(gray)
+    assert features.laplacian_variance == pytest.approx(cv2.Laplacian(gray, cv2.CV_64F).var(), rel=1e-9)
+    # The magnitude is float32 now
+    assert features.gradient_magnitude_mean == pytest.approx(baseline_gradient_mean(gray), rel=1e-5)
+    np.testing.assert_allclose(features.spectrum_window, baseline_spectrum_window(gray), rtol=1e-9, atol=1e-9)
+    np.testing.assert_array_equal(features.edges, cv2.Canny(gray, 50, 150))
+
+
+def test_scores_match_the_baseline(gray):
+    expected = baseline_scores(gray)
+    scores = run_blur_metrics(BlurFeatures(gray))
+    assert list(scores) == list(expected)
+    for name, value in expected.items():
+        assert scores[name] == pytest.approx(value, rel=1e-5), name
+    weights = {"laplacian": 0.3, "sobel": 0.25, "fft": 0.2, "gradient": 0.15, "edge_density": 0.1}
+    assert weighted_blur_score(scores) == pytest.approx(sum(expected[name] * weights[name] for name in weights),
+                                                        rel=1e-5)
+
+
+def test_features_are_computed_once():
+    features = BlurFeatures(gray_image('sharp', 320, 240))
+    run_blur_metrics(features, ['sobel'])
+    magnitude = features.__dict__['gradient_magnitude_mean']
+    features.__dict__['gradient_magnitude_mean'] = magnitude * 2
+    # gradient reuses the cached value instead of recomputing it
+    assert run_blur_metrics(features, ['gradient'])['gradient'] == pytest.approx(min(100, magnitude * 2 / 3))
+
+
+def test_subset_scores_are_renormalized():
+    scores = run_blur_metrics(BlurFeatures(gray_image('texture', 320, 240, 2)), ['sobel', 'fft'])
+    assert list(scores) == ['sobel', 'fft']
+    weights = BLUR_METRICS['sobel'].weight, BLUR_METRICS['fft'].weight
+    expected = (scores['sobel'] * weights[0] + scores['fft'] * weights[1]) / sum(weights)
+    assert weighted_blur_score(scores) == pytest.approx(expected)
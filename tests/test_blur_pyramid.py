@@ -0,0 +1,67 @@
+import cv2
+import numpy as np
+import pytest
+
+from blur_metrics import BlurFeatures, weighted_blur_score
+from blur_pyramid import AUTO, FULL, score_blur
+from corpus import synthetic_scene, synthetic_texture
+from enhanced_analysis import EnhancedAnalyzer
+from visualization import VisualizationOptions
+
+# Small images with a small working size, so AUTO scores on pyramid level 1
+MAX_PIXELS = 200_000
+
+
+def grey_noise(width, height, sigma=12, seed=0):
+    noise = np.random.default_rng(seed).normal(0, sigma, (height, width))
+    return np.clip(128 + noise, 0, 255).astype(np.uint8)
+
+
+def weighted(gray, **kwargs):
+    scores, info = score_blur(BlurFeatures(gray), **kwargs)
+    return weighted_blur_score(scores), info
+
+
+@pytest.mark.parametrize('gray', [grey_noise(800, 600), synthetic_scene(800, 600), synthetic_texture(800, 600)],
+                         ids=['noise', 'scene', 'texture'])
+def test_default_is_full_resolution(gray):
+    score, info = weighted(gray, max_pixels=MAX_PIXELS)
+    full, _ = weighted(gray, resolution=FULL)
+    assert score == full
+    assert info['mode'] == FULL and info['exact'] and info['levels_scored'] == [0]
+
+
+def test_analyzer_default_is_exact_on_large_noisy_image():
+    # Above the 4 MP pyramid working size; a level estimate scores this about 8 instead of 53
+    gray = grey_noise(2400, 1800)
+    image = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+    result = EnhancedAnalyzer(ocr_workers=1).analyze_blur_detection(image, output=VisualizationOptions(mode='off'))
+    full, _ = weighted(gray, resolution=FULL)
+    assert result['resolution']['exact']
+    assert result['score'] == round(full, 2)
+    assert result['score'] >= 50
+
+
+def test_auto_below_working_size_is_exact():
+    gray = synthetic_scene(400, 300)
+    auto, info = weighted(gray, resolution=AUTO, max_pixels=MAX_PIXELS)
+    assert info['exact'] and auto == weighted(gray, resolution=FULL)[0]
+
+
+def test_auto_level_estimate_is_not_a_bound_on_noise():
+    # The documented limitation: pyrDown averages the noise away, so the full
+    # score lies far outside the range estimated on the level
+    gray = grey_noise(800, 600)
+    full, _ = weighted(gray, resolution=FULL)
+    auto, info = weighted(gray, resolution=AUTO, max_pixels=MAX_PIXELS)
+    assert info['level'] == 1 and not info['exact']
+    low, high = info['score_range']
+    assert low <= auto <= high < full - 20
+
+
+def test_auto_escalates_near_threshold():
+    gray = synthetic_texture(800, 600)
+    full, _ = weighted(gray, resolution=FULL)
+    auto, info = weighted(gray, resolution=AUTO, max_pixels=MAX_PIXELS, threshold=full)
+    assert info['exact'] and info['levels_scored'] == [1, 0]
+    assert auto == full
@@ -0,0 +1,89 @@
+import io
+
+import cv2
+import pytest
+
+from blur_pyramid import SHARP_THRESHOLD
+from blur_regions import BLURRY, NO_REGIONS, SHARP, Region, clip_box, score_regions
+from corpus import make_image
+from enhanced_analysis import EnhancedAnalyzer
+
+LEFT = (20, 20, 260, 400)
+RIGHT = (360, 20, 260, 400)
+
+
+@pytest.fixture(scope='module')
+def half_blurred():
+    """Sharp left half, heavily blurred right half"""
+    image = make_image('sharp', 640, 480, 5)
+    image[:, 320:] = cv2.GaussianBlur(image, (0, 0), 6)[:, 320:]
+    return image
+
+
+@pytest.fixture(scope='module')
+def gray(half_blurred):
+    return cv2.cvtColor(half_blurred, cv2.COLOR_BGR2GRAY)
+
+
+@pytest.mark.parametrize('box, clipped', [
+    ((10, 20, 100, 80), (10, 20, 100, 80)),          # inside and large enough: unchanged
+    ((-50, -30, 150, 130), (0, 0, 100, 100)),        # negative origin: clipped to the image
+    ((600, 400, 100, 100), (576, 400, 64, 80)),      # past the far edges: clipped, then grown inwards
+    ((100, 100, 10, 10), (73, 73, 64, 64)),          # small: grown around its centre
+    ((-40, 50, 45, 8), (0, 22, 64, 64)),             # mostly outside and small: grown within the image
+    ((640, 0, 50, 50), None),                        # entirely right of the image
+    ((-60, -60, 50, 50), None),                      # entirely above and left
+])
+def test_clip_box(box, clipped):
+    assert clip_box(box, (480, 640)) == clipped
+
+
+def test_clip_box_never_exceeds_a_small_image():
+    assert clip_box((5, 5, 10, 10), (40, 30)) == (0, 0, 30, 40)
+
+
+def test_half_blurred_regions(gray):
+    result = score_regions(gray, [Region('rect', LEFT), Region('rect', RIGHT)])
+    left, right = result['regions']
+    assert left['sharp'] and left['score'] >= SHARP_THRESHOLD
+    assert not right['sharp'] and right['score'] < SHARP_THRESHOLD
+    # One blurry region fails the image; the combined score is the weakest region's
+    assert result['verdict'] == BLURRY and result['score'] == right['score']
+    assert result['region_count'] == 2 and result['sharp_regions'] == 1
+
+    sharp_only = score_regions(gray, [Region('rect', LEFT)])
+    assert sharp_only['verdict'] == SHARP and sharp_only['score'] == left['score']
+
+
+def test_regions_outside_the_image_are_dropped(gray):
+    result = score_regions(gray, [Region('rect', (700, 10, 50, 50))])
+    assert result == {"score": None, "verdict": NO_REGIONS, "regions": [], "region_count": 0, "sharp_regions": 0}
+    result = score_regions(gray, [Region('rect', (-20, -20, 300, 300)), Region('rect', (-100, 0, 50, 50))])
+    assert result['region_count'] == 1
+    assert result['regions'][0]['box'] == [-20, -20, 300, 300]
+    assert result['regions'][0]['scored_box'] == [0, 0, 280, 280]
+
+
+def test_region_metric_subset(gray):
+    result = score_regions(gray, [Region('rect', LEFT)], names=['laplacian', 'sobel'])
+    assert set(result['regions'][0]['methods']) == {'laplacian', 'sobel'}
+
+
+def test_analyzer_validates_regions(half_blurred):
+    analyzer = EnhancedAnalyzer()
+    assert 'error' in analyzer.analyze_region_blur(half_blurred, ['eyes'])
+    assert 'error' in analyzer.analyze_region_blur(half_blurred, [(0, 0, 0, 10)])
+    assert 'error' in analyzer.analyze_region_blur(half_blurred, [LEFT], methods=['nope'])
+    result = analyzer.analyze_region_blur(half_blurred, [LEFT, RIGHT])
+    assert result['verdict'] == BLURRY and result['details'].startswith('Region blur analysis: 1/2 regions sharp')
+
+
+def test_blur_route_scores_rects(client, half_blurred):
+    _, buffer = cv2.imencode('.png', half_blurred)
+    rects = ';'.join(','.join(str(value) for value in box) for box in (LEFT, RIGHT))
+    response = client.post('/blur_detection', data={'file': (io.BytesIO(buffer.tobytes()), 'card.png'),
+                                                    'rects': rects, 'visualize': 'off'})
+    assert response.status_code == 200
+    results = response.get_json()['results']
+    assert [region['sharp'] for region in results['regions']] == [True, False]
+    assert results['verdict'] == BLURRY
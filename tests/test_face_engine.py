@@ -0,0 +1,77 @@
+import cv2
+import numpy as np
+import pytest
+
+from corpus import face_scene
+from enhanced_analysis import EnhancedAnalyzer
+from face_engine import FaceEngine, detection_params
+from visualization import VisualizationOptions
+
+
+def iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    overlap_w = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    overlap_h = max(0, min(ay + ah, by + bh) - max(ay, by))
+    overlap = overlap_w * overlap_h
+    return overlap / (aw * ah + bw * bh - overlap)
+
+
+@pytest.fixture(scope='module')
+def engine():
+    return FaceEngine()
+
+
+@pytest.fixture(scope='module')
+def scene():
+    image, truth = face_scene(3200, 2400, seed=0)
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), truth
+
+
+def test_boxes_are_mapped_back_to_original_coordinates(engine, scene):
+    gray, truth = scene
+    faces, params = engine.detect(gray, preset='balanced')
+    assert params['detect_scale'] < 1
+    assert params['detect_size'] == [round(3200 * params['detect_scale']), round(2400 * params['detect_scale'])]
+    # Every drawn face at or above the preset's smallest face is found in place
+    for box in truth:
+        if box[2] >= params['min_face']:
+            assert max(iou(box, face) for face in faces.tolist()) > 0.7, box
+
+
+def test_min_face_above_the_shorter_side_finds_nothing(engine, scene):
+    gray, _ = scene
+    for min_face in (1e9, 2401):
+        faces, params = engine.detect(gray, min_face=min_face)
+        assert faces.shape == (0, 4)
+        assert params['detect_size'] == [0, 0]
+
+
+def test_min_face_at_the_shorter_side_still_detects(engine, scene):
+    gray, _ = scene
+    faces, params = engine.detect(gray, min_face=2400)
+    assert faces.shape[1] == 4
+    assert min(params['detect_size']) >= engine.window
+
+
+def test_max_face_below_min_face_finds_nothing(engine, scene):
+    gray, _ = scene
+    faces, _ = engine.detect(gray, max_face=5)
+    assert len(faces) == 0
+
+
+def test_detect_scale_is_reported_rounded(engine, scene):
+    gray, _ = scene
+    # Rounded to 4 decimals this scale would be 0
+    exact = detection_params(gray.shape, min_face=1e6, window=engine.window)['detect_scale']
+    assert exact > 0 and round(exact, 4) == 0
+    _, params = engine.detect(gray, min_face=2399.5)
+    assert params['detect_scale'] == round(params['detect_scale'], 4)
+
+
+def test_huge_min_face_is_not_an_error():
+    image = cv2.cvtColor(np.full((480, 640), 128, np.uint8), cv2.COLOR_GRAY2BGR)
+    result = EnhancedAnalyzer(ocr_workers=1).analyze_human_detection(
+        image, output=VisualizationOptions(mode='off'), min_face=1e9)
+    assert "error" not in result
+    assert result['face_count'] == 0 and result['faces'] == []
@@ -0,0 +1,141 @@
+import io
+
+import cv2
+import numpy as np
+import pytest
+
+from corpus import make_image
+from enhanced_analysis import EnhancedAnalyzer
+from frame_stream import Frame, iter_image_frames, iter_video_frames, select_sharpest
+from visualization import VisualizationOptions
+
+# Gaussian sigma per frame: frames 1 and 4 are equally sharp, then 3, 0, 2
+SIGMAS = (2.0, 0, 6.0, 1.0, 0)
+
+
+@pytest.fixture(scope='module')
+def burst():
+    sharp = make_image('sharp', 160, 120, 4)
+    return [cv2.GaussianBlur(sharp, (0, 0), sigma) if sigma else sharp.copy() for sigma in SIGMAS]
+
+
+def encoded(images):
+    return [cv2.imencode('.png', image)[1].tobytes() for image in images]
+
+
+@pytest.fixture
+def video_path(tmp_path, burst):
+    path = str(tmp_path / 'clip.avi')
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 10, (160, 120))
+    if not writer.isOpened():
+        pytest.skip('no MJPG video writer in this OpenCV build')
+    for image in burst:
+        writer.write(image)
+    writer.release()
+    return path
+
+
+def test_top_k_sharpest_first_ties_to_the_earlier_frame(burst):
+    frames = [Frame(index, None, image) for index, image in enumerate(burst)]
+    best, stats = select_sharpest(frames, k=3)
+    assert [frame.index for frame in best] == [1, 4, 3]
+    assert best[0].sharpness >= best[1].sharpness > best[2].sharpness
+    assert stats['frames'] == stats['scored'] == 5 and stats['unreadable'] == 0
+    assert stats['max_sharpness'] == best[0].sharpness
+
+    best, _ = select_sharpest(frames, k=10)
+    assert [frame.index for frame in best] == [1, 4, 3, 0, 2]
+
+
+def test_select_rejects_bad_arguments(burst):
+    with pytest.raises(ValueError, match='metric'):
+        select_sharpest([], metric='nope')
+    with pytest.raises(ValueError):
+        select_sharpest([], k=0)
+
+
+def test_image_frames_stride_and_max_frames(burst):
+    payloads = encoded(burst)
+    assert [frame.index for frame in iter_image_frames(payloads, stride=2)] == [0, 2, 4]
+    assert [frame.index for frame in iter_image_frames(payloads, max_frames=2, stride=2)] == [0, 2]
+
+    # Skipped frames are not even read
+    read = []
+    readers = [lambda index=index: read.append(index) or payloads[index] for index in range(5)]
+    list(iter_image_frames(readers, stride=3))
+    assert read == [0, 3]
+
+
+def test_undecodable_burst_frames_are_counted(burst):
+    frames = list(iter_image_frames(encoded(burst[:2]) + [b'not an image', b'']))
+    assert [frame.image is None for frame in frames] == [False, False, True, True]
+    _, stats = select_sharpest(frames)
+    assert stats['unreadable'] == 2 and stats['scored'] == 2
+
+
+def test_video_frames_stride_and_max_frames(video_path):
+    assert [frame.index for frame in iter_video_frames(video_path)] == [0, 1, 2, 3, 4]
+    frames = list(iter_video_frames(video_path, stride=2, max_frames=2))
+    assert [frame.index for frame in frames] == [0, 2]
+    assert frames[1].timestamp_ms > frames[0].timestamp_ms
+
+
+def test_unopenable_video(tmp_path):
+    path = tmp_path / 'broken.avi'
+    path.write_bytes(b'not a video')
+    with pytest.raises(ValueError, match='Could not open video'):
+        list(iter_video_frames(str(path)))
+
+
+def test_analyze_frames_runs_the_top_k_only(burst):
+    analyzer = EnhancedAnalyzer()
+    frames = (Frame(index, None, image) for index, image in enumerate(burst))
+    result = analyzer.analyze_frames(frames, top_k=2, analyses=('blur',), output=VisualizationOptions(mode='off'))
+    assert result['best_index'] == 1
+    assert [frame['index'] for frame in result['top_frames']] == [1, 4]
+    assert all(set(frame['results']) == {'blur'} and frame['image'] is None for frame in result['top_frames'])
+    assert result['frames']['frames'] == 5
+
+
+@pytest.mark.parametrize('frames, error', [
+    ([], 'No decodable frames'),
+    ([Frame(0, None, None), Frame(1, None, None)], 'No decodable frames'),
+])
+def test_analyze_frames_without_a_usable_frame(frames, error):
+    assert EnhancedAnalyzer().analyze_frames(iter(frames), analyses=('blur',)) == {'error': error}
+
+
+def test_analyze_frames_route_with_a_burst(client, burst):
+    files = [(io.BytesIO(payload), f'frame{index}.png') for index, payload in enumerate(encoded(burst))]
+    response = client.post('/analyze_frames', data={'frames': files, 'analyses': 'blur', 'top_k': '2',
+                                                    'stride': '2', 'visualize': 'off'})
+    assert response.status_code == 200
+    body = response.get_json()
+    # Frames 0, 2 and 4 are scored, with their positions in the upload
+    assert [frame['index'] for frame in body['top_frames']] == [4, 0]
+    assert body['frames']['frames'] == 3 and body['success']
+
+
+def test_analyze_frames_route_with_a_video(client, video_path):
+    with open(video_path, 'rb') as handle:
+        data = {'video': (io.BytesIO(handle.read()), 'clip.avi'), 'analyses': 'blur', 'top_k': '1',
+                'max_frames': '4', 'visualize': 'off'}
+    response = client.post('/analyze_frames', data=data)
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['frames']['frames'] == 4
+    assert body['best_index'] == 1
+
+
+def test_analyze_frames_route_errors(client):
+    response = client.post('/analyze_frames', data={'video': (io.BytesIO(b'not a video'), 'clip.avi'),
+                                                    'analyses': 'blur'})
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Could not open video'
+
+    response = client.post('/analyze_frames', data={'frames': [(io.BytesIO(b'junk'), 'a.png')],
+                                                    'analyses': 'blur'})
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'No decodable frames'
+
+    assert client.post('/analyze_frames', data={}).status_code == 400
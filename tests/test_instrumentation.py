@@ -0,0 +1,128 @@
+import io
+import re
+import threading
+
+import cv2
+import pytest
+
+import instrumentation
+from corpus import make_image
+from instrumentation import Registry, server_timing_header
+
+# One Prometheus text-format sample: name, optional labels, value
+SAMPLE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\]|\\.)*"'
+                    r'(,[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\]|\\.)*")*\})? -?[0-9.e+-]+$')
+
+
+def sample_value(text, name, **labels):
+    """Value of one sample in rendered metrics, None when absent"""
+    wanted = set(f'{key}="{value}"' for key, value in labels.items())
+    for line in text.splitlines():
+        if line.startswith('#'):
+            continue
+        series, value = line.rsplit(' ', 1)
+        sample_name, _, label_text = series.partition('{')
+        if sample_name == name and set(filter(None, label_text.rstrip('}').split(','))) == wanted:
+            return float(value)
+    return None
+
+
+def upload(image, **fields):
+    _, buffer = cv2.imencode('.png', image)
+    return dict(fields, file=(io.BytesIO(buffer.tobytes()), 'scan.png'))
+
+
+def test_render_format():
+    registry = Registry()
+    registry.observe('latency_seconds', 0.003, buckets=(0.001, 0.01), help_text='Latency', stage='a')
+    registry.observe('latency_seconds', 0.5, buckets=(0.001, 0.01), help_text='Latency', stage='a')
+    registry.inc('requests_total', help_text='Requests', route='x', status=200)
+    registry.inc('requests_total', 2, route='x', status=200)
+    registry.gauge_add('in_flight', 1, route='with "quotes"\n')
+
+    text = registry.render()
+    assert text.endswith('\n')
+    lines = text.splitlines()
+    assert lines[:2] == ['# HELP image_analysis_latency_seconds Latency', '# TYPE image_analysis_latency_seconds histogram']
+    # Buckets are cumulative and end with +Inf == count
+    assert lines[2:7] == [
+        'image_analysis_latency_seconds_bucket{stage="a",le="0.001"} 0',
+        'image_analysis_latency_seconds_bucket{stage="a",le="0.01"} 1',
+        'image_analysis_latency_seconds_bucket{stage="a",le="+Inf"} 2',
+        'image_analysis_latency_seconds_sum{stage="a"} 0.503000',
+        'image_analysis_latency_seconds_count{stage="a"} 2',
+    ]
+    assert '# TYPE image_analysis_requests_total counter' in lines
+    assert 'image_analysis_requests_total{route="x",status="200"} 3' in lines
+    # A gauge without help text has no HELP line; label values are escaped
+    assert '# HELP image_analysis_in_flight ' not in text
+    assert 'image_analysis_in_flight{route="with \\"quotes\\"\\n"} 1' in lines
+    assert all(SAMPLE.match(line) for line in lines if not line.startswith('#'))
+
+
+def test_server_timing_header_sums_repeated_stages():
+    header = server_timing_header([('decode', 0.002), ('blur.sobel', 0.0105), ('decode', 0.001)])
+    assert header == 'decode;dur=3.00, blur.sobel;dur=10.50'
+    assert server_timing_header([]) == ''
+
+
+def run_stage(name):
+    with instrumentation.stage(name):
+        pass
+
+
+def run_in_thread(func, *args):
+    thread = threading.Thread(target=func, args=args)
+    thread.start()
+    thread.join()
+
+
+def test_stages_reach_the_request_across_threads():
+    token = instrumentation.begin_request()
+    try:
+        run_stage('main')
+        run_in_thread(instrumentation.propagate(run_stage), 'worker')
+        # Without propagate() the thread has no request to report to
+        run_in_thread(run_stage, 'lost')
+    finally:
+        timings = instrumentation.end_request(token)
+    assert [name for name, _ in timings] == ['main', 'worker']
+    assert instrumentation.request_timings() == []
+
+
+def test_metrics_endpoint(client):
+    client.post('/blur_detection', data=upload(make_image('sharp', 320, 240, 11), visualize='off'))
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+    assert all(SAMPLE.match(line) for line in text.splitlines() if line and not line.startswith('#'))
+    assert sample_value(text, 'image_analysis_http_requests_total', route='blur_detection', status='200') >= 1
+    assert sample_value(text, 'image_analysis_stage_duration_seconds_count', stage='blur.laplacian') >= 1
+    assert sample_value(text, 'image_analysis_image_megapixels_count') >= 1
+
+
+def test_server_timing_header(app_module, client, monkeypatch):
+    data = upload(make_image('sharp', 320, 240, 12), visualize='off')
+    assert 'Server-Timing' not in client.post('/blur_detection', data=data).headers
+
+    monkeypatch.setitem(app_module.app.config, 'SERVER_TIMING_HEADER', True)
+    response = client.post('/blur_detection', data=upload(make_image('sharp', 320, 240, 13), visualize='off'))
+    assert response.status_code == 200
+    entries = dict(entry.split(';dur=') for entry in response.headers['Server-Timing'].split(', '))
+    assert {'decode', 'blur.laplacian'} <= set(entries)
+    assert all(float(value) >= 0 for value in entries.values())
+
+
+def test_in_flight_gauge_returns_to_zero_when_a_view_raises(app_module, client, monkeypatch):
+    def broken():
+        raise RuntimeError('boom')
+
+    monkeypatch.setattr(app_module, 'parse_visualization_options', broken)
+    with pytest.raises(RuntimeError, match='boom'):
+        client.post('/ocr_analysis', data=upload(make_image('id_card', 320, 200, 0)))
+
+    text = client.get('/metrics').get_data(as_text=True)
+    assert sample_value(text, 'image_analysis_http_requests_in_flight', route='ocr_analysis') == 0
+    # Only /metrics itself is in flight while it renders
+    assert sample_value(text, 'image_analysis_http_requests_in_flight', route='metrics') == 1
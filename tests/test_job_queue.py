@@ -0,0 +1,213 @@
+import io
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from job_queue import (DONE, FAILED, RUNNING, JobQueue, MemoryBackend, QueueFull, RedisBackend,
+                       callback_host_allowed, check_callback_url, is_public_address, post_callback)
+
+
+@pytest.fixture
+def receiver():
+    """Local HTTP server recording the callbacks POSTed to it"""
+    received = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            received.append(json.loads(self.rfile.read(int(self.headers['Content-Length']))))
+            self.send_response(200 if self.path != '/redirect' else 302)
+            if self.path == '/redirect':
+                self.send_header('Location', f"http://127.0.0.1:{self.server.server_port}/")
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}", received
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def redis_backend():
+    fakeredis = pytest.importorskip('fakeredis')
+    return RedisBackend(client=fakeredis.FakeRedis(), prefix='test')
+
+
+def wait_for(queue, job_id, key='status', timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get(job_id)
+        if job is not None and job.get(key) not in (None, 'queued', 'running'):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def make_queue(**kwargs):
+    def runner(job_type, image, params):
+        if params.get('fail'):
+            return {'error': 'analysis failed'}
+        return {'bytes': len(image)}
+
+    queue = JobQueue(MemoryBackend(), runner, workers={'blur': 1, 'ocr': 1}, poll_interval=0.05, **kwargs)
+    queue.start()
+    return queue
+
+
+@pytest.mark.parametrize('address, public', [
+    ('127.0.0.1', False), ('10.1.2.3', False), ('192.168.0.1', False), ('172.16.5.4', False),
+    ('169.254.169.254', False), ('0.0.0.0', False), ('100.64.0.1', False), ('::1', False), ('fe80::1', False),
+    ('fd00::1', False), ('::ffff:127.0.0.1', False), ('224.0.0.1', False), ('8.8.8.8', True),
+    ('2001:4860:4860::8888', True),
+])
+def test_public_addresses(address, public):
+    assert is_public_address(address) == public
+
+
+def test_callback_host_patterns():
+    allowed = ['hooks.example.com', '.example.org']
+    assert callback_host_allowed('HOOKS.example.com.', allowed)
+    assert callback_host_allowed('a.b.example.org', allowed)
+    assert not callback_host_allowed('example.org', allowed)
+    assert not callback_host_allowed('hooks.example.com.evil.net', allowed)
+    assert callback_host_allowed('anything.net', ['*'])
+
+
+@pytest.mark.parametrize('url, hosts, message', [
+    ('https://hooks.example.com/x', None, 'disabled'),
+    ('ftp://hooks.example.com/x', ['*'], 'http'),
+    ('https://other.example.com/x', ['hooks.example.com'], 'not allowed'),
+    ('http://127.0.0.1:8080/x', ['*'], 'not public'),
+    ('http://[::1]/x', ['*'], 'not public'),
+    ('http://169.254.169.254/latest/meta-data', ['169.254.169.254'], 'not public'),
+])
+def test_rejected_callback_urls(url, hosts, message):
+    with pytest.raises(ValueError, match=message):
+        check_callback_url(url, hosts)
+
+
+def test_submit_rejects_callbacks_unless_configured():
+    queue = JobQueue(MemoryBackend(), lambda *args: {}, workers={'blur': 1})
+    with pytest.raises(ValueError, match='disabled'):
+        queue.submit('blur', b'img', callback_url='https://hooks.example.com/done')
+    queue = JobQueue(MemoryBackend(), lambda *args: {}, workers={'blur': 1}, callback_hosts=['hooks.example.com'])
+    assert queue.submit('blur', b'img', callback_url='https://hooks.example.com/done')
+
+
+def test_callback_to_a_name_resolving_to_loopback_is_refused(receiver):
+    url, received = receiver
+    result = post_callback(url.replace('127.0.0.1', 'localhost') + '/', {'id': 'x'}, timeout=5)
+    assert 'non-public' in result['error']
+    assert received == []
+
+
+def test_callback_with_private_addresses_allowed(receiver):
+    url, received = receiver
+    assert post_callback(url + '/', {'id': 'x'}, timeout=5, allow_private=True) == {'status_code': 200}
+    assert received == [{'id': 'x'}]
+
+
+def test_callback_redirects_are_not_followed(receiver):
+    url, received = receiver
+    result = post_callback(url + '/redirect', {'id': 'x'}, timeout=5, allow_private=True)
+    assert '302' in result['error']
+    assert len(received) == 1
+
+
+def test_jobs_run_and_call_back(receiver):
+    url, received = receiver
+    queue = make_queue(callback_hosts=['127.0.0.1'], callback_allow_private=True)
+    try:
+        job_id = queue.submit('blur', b'12345', callback_url=url + '/')
+        job = wait_for(queue, job_id, key='webhook')
+        assert job['status'] == DONE and job['result'] == {'bytes': 5}
+        assert job['webhook'] == {'status_code': 200}
+        assert received[0]['id'] == job_id
+
+        failed = wait_for(queue, queue.submit('blur', b'1', params={'fail': True}))
+        assert failed['status'] == FAILED and failed['error'] == 'analysis failed'
+    finally:
+        queue.stop()
+
+
+def test_queue_depth_is_bounded():
+    queue = JobQueue(MemoryBackend(), lambda *args: {}, workers={'blur': 1}, max_depth=2)
+    queue.submit('blur', b'1')
+    queue.submit('blur', b'2', priority='high')
+    with pytest.raises(QueueFull):
+        queue.submit('blur', b'3')
+    assert queue.stats()['rejected'] == 1
+
+
+def test_jobs_route_rejects_callback_url_by_default(client):
+    response = client.post('/jobs', data={'analysis': 'blur', 'callback_url': 'http://169.254.169.254/',
+                                          'file': (io.BytesIO(b'not decoded yet'), 'scan.png')})
+    assert response.status_code == 400
+    assert 'callbacks are disabled' in response.get_json()['error']
+
+
+def redis_job(queue, job_type='blur', **kwargs):
+    job_id = queue.submit(job_type, b'image', **kwargs)
+    return job_id, queue.backend._key('job', job_id), queue.backend._key('image', job_id)
+
+
+def test_redis_enqueue_claims_in_priority_order(redis_backend):
+    queue = JobQueue(redis_backend, lambda *args: {}, workers={'blur': 1, 'ocr': 1}, max_depth=3)
+    low = queue.submit('blur', b'1', priority='low')
+    normal = queue.submit('blur', b'2')
+    high = queue.submit('blur', b'3', priority='high')
+    queue.submit('ocr', b'4')
+    with pytest.raises(QueueFull):
+        queue.submit('blur', b'5')
+    assert redis_backend.depth('blur') == 3 and redis_backend.depth('ocr') == 1
+
+    assert [redis_backend.dequeue('blur', 0.01) for _ in range(3)] == [high, normal, low]
+    assert redis_backend.dequeue('blur', 0.01) is None
+    # Claiming the image takes it off the server
+    assert redis_backend.pop_image(high) == b'3'
+    assert redis_backend.pop_image(high) is None
+
+
+def test_redis_pending_jobs_expire(redis_backend):
+    queue = JobQueue(redis_backend, lambda *args: {}, workers={'blur': 1}, pending_ttl_seconds=60)
+    job_id, job_key, image_key = redis_job(queue)
+    client = redis_backend.client
+    assert 0 < client.ttl(job_key) <= 60 and 0 < client.ttl(image_key) <= 60
+
+    # A running job keeps its TTL, so a crashed worker does not leave it behind for good
+    redis_backend.update(job_id, status=RUNNING)
+    assert redis_backend.get(job_id)['status'] == RUNNING
+    assert 0 < client.ttl(job_key) <= 60
+
+    queue = JobQueue(redis_backend, lambda *args: {}, workers={'blur': 1}, pending_ttl_seconds=1)
+    job_id, job_key, image_key = redis_job(queue)
+    time.sleep(1.1)
+    assert not client.exists(job_key) and not client.exists(image_key)
+    assert queue.get(job_id) is None
+
+
+def test_redis_jobs_finish_with_the_result_ttl(redis_backend):
+    def runner(job_type, image, params):
+        return {'error': 'analysis failed'} if params.get('fail') else {'bytes': len(image)}
+
+    queue = JobQueue(redis_backend, runner, workers={'blur': 1}, poll_interval=0.05, result_ttl_seconds=30,
+                     pending_ttl_seconds=600)
+    queue.start()
+    try:
+        job_id, job_key, image_key = redis_job(queue)
+        job = wait_for(queue, job_id)
+        assert job['status'] == DONE and job['result'] == {'bytes': 5}
+        assert 0 < redis_backend.client.ttl(job_key) <= 30
+        assert not redis_backend.client.exists(image_key)
+
+        failed = wait_for(queue, queue.submit('blur', b'1', params={'fail': True}))
+        assert failed['status'] == FAILED and failed['error'] == 'analysis failed'
+    finally:
+        queue.stop()
@@ -0,0 +1,98 @@
+import sys
+import types
+
+import numpy as np
+import pytest
+from pytesseract.pytesseract import file_to_dict
+
+from ocr_backends import (PYTESSERACT, TESSEROCR, TSV_COLUMNS, PytesseractBackend, TesserocrBackend, make_backend,
+                          parse_config, tsv_to_dict)
+
+# Tesseract TSV rows: page, block, paragraph, line and words (one with a fractional confidence);
+# the last row's text is empty, so its final cell is missing
+TSV_ROWS = [
+    '1\t1\t0\t0\t0\t0\t0\t0\t640\t400\t-1\t',
+    '2\t1\t1\t0\t0\t0\t12\t20\t300\t40\t-1\t',
+    '3\t1\t1\t1\t0\t0\t12\t20\t300\t40\t-1\t',
+    '4\t1\t1\t1\t1\t0\t12\t20\t300\t40\t-1\t',
+    '5\t1\t1\t1\t1\t1\t12\t20\t120\t40\t96.457\tNAME',
+    '5\t1\t1\t1\t1\t2\t140\t20\t172\t40\t88\tپاکستان',
+    '5\t1\t1\t1\t1\t3\t320\t20\t10\t40\t0',
+]
+
+
+def test_tsv_to_dict_matches_pytesseract_dict_output():
+    expected = file_to_dict('\t'.join(TSV_COLUMNS) + '\n' + '\n'.join(TSV_ROWS), '\t', -1)
+    data = tsv_to_dict('\n'.join(TSV_ROWS) + '\n')
+    assert data == expected
+    assert data['conf'][4] == 96 and data['text'][-1] == ''
+
+
+def test_tsv_to_dict_of_nothing_has_every_column():
+    assert tsv_to_dict('') == {column: [] for column in TSV_COLUMNS}
+
+
+def test_parse_config():
+    assert parse_config('--oem 3 --psm 6') == (3, 6, {})
+    assert parse_config("--psm 7 -c tessedit_char_whitelist='AB 12'") == (None, 7, {'tessedit_char_whitelist': 'AB 12'})
+    assert parse_config('') == (None, None, {})
+
+
+@pytest.mark.parametrize('config', ['--dpi 300', '-l eng', '--psm', '-c no_value', 'digits'])
+def test_parse_config_rejects_unsupported_options(config):
+    with pytest.raises(ValueError, match='Unsupported tesseract option'):
+        parse_config(config)
+
+
+def test_auto_falls_back_to_pytesseract_without_tesserocr(monkeypatch):
+    # A None entry makes `import tesserocr` raise ImportError
+    monkeypatch.setitem(sys.modules, 'tesserocr', None)
+    assert isinstance(make_backend('auto'), PytesseractBackend)
+    assert make_backend(PYTESSERACT).name == PYTESSERACT
+    with pytest.raises(RuntimeError, match='tesserocr'):
+        make_backend(TESSEROCR)
+    with pytest.raises(ValueError):
+        make_backend('easyocr')
+
+
+class FakeEngine:
+    """PyTessBaseAPI stand-in returning the TSV sample"""
+
+    def __init__(self, **options):
+        self.options = options
+        self.images = []
+
+    def SetImageBytes(self, data, width, height, channels, stride):
+        self.images.append((len(data), width, height, channels, stride))
+
+    def Recognize(self):
+        pass
+
+    def GetTSVText(self, page):
+        return '\n'.join(TSV_ROWS) + '\n'
+
+    def Clear(self):
+        pass
+
+    def End(self):
+        pass
+
+
+def test_tesserocr_engines_are_reused_per_config(monkeypatch):
+    fake = types.SimpleNamespace(PyTessBaseAPI=FakeEngine, OEM=int, PSM=int)
+    monkeypatch.setitem(sys.modules, 'tesserocr', fake)
+    backend = make_backend('auto', pool_size=2)
+    assert isinstance(backend, TesserocrBackend)
+
+    gray = np.zeros((40, 64), np.uint8)
+    assert backend.image_to_data(gray, 'eng', '--oem 3 --psm 6') == tsv_to_dict('\n'.join(TSV_ROWS))
+    backend.image_to_data(np.zeros((40, 64, 3), np.uint8), 'eng', '--oem 3 --psm 6')
+    backend.image_to_data(gray, 'eng', '--psm 7')
+    stats = backend.stats()
+    assert stats['engines_loaded'] == 2 and stats['engines_idle'] == 2
+
+    engine = backend._idle[('eng', 3, 6, ())][0]
+    assert engine.options == {'lang': 'eng', 'variables': {}, 'oem': 3, 'psm': 6}
+    assert engine.images == [(64 * 40, 64, 40, 1, 64), (64 * 40 * 3, 64, 40, 3, 192)]
+    backend.close()
+    assert backend.stats()['engines_idle'] == 0
@@ -0,0 +1,105 @@
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+from ocr_executor import CANCELLED, COMPLETED, SKIPPED, OCRExecutor
+
+
+def fake_ocr(image):
+    """Stand-in for a tesseract pass: the 'image' is the confidence to report"""
+    return {'confidence': image, 'text': f"conf {image}"}
+
+
+def variants(*confidences):
+    return [(f"v{index}", lambda confidence=confidence: confidence) for index, confidence in enumerate(confidences)]
+
+
+def statuses(attempts):
+    return [attempt['status'] for attempt in attempts]
+
+
+class ManualPool:
+    """Pool double: named variants finish at once, 'started' ones run forever, the rest stay queued"""
+
+    def __init__(self, finish, started=()):
+        self.finish = finish
+        self.started = started
+
+    def submit(self, fn, name, build):
+        future = Future()
+        if name in self.finish:
+            future.set_running_or_notify_cancel()
+            future.set_result(fn(name, build))
+        elif name in self.started:
+            future.set_running_or_notify_cancel()
+        return future
+
+
+def test_without_threshold_every_variant_completes():
+    attempts = OCRExecutor(max_workers=2).run(variants(10, 95, 20, 30), fake_ocr)
+    assert statuses(attempts) == [COMPLETED] * 4
+    assert [attempt['confidence'] for attempt in attempts] == [10, 95, 20, 30]
+    assert all(attempt['latency_ms'] >= 0 for attempt in attempts)
+
+
+def test_sequential_early_exit_skips_the_rest():
+    attempts = OCRExecutor(max_workers=1, early_exit_confidence=80).run(variants(10, 95, 20, 30), fake_ocr)
+    assert statuses(attempts) == [COMPLETED, COMPLETED, SKIPPED, SKIPPED]
+    assert attempts[2]['result'] is None
+
+
+def test_per_call_threshold_overrides_the_default():
+    executor = OCRExecutor(max_workers=1, early_exit_confidence=80)
+    assert statuses(executor.run(variants(95, 20), fake_ocr, early_exit_confidence=None)) == [COMPLETED] * 2
+
+
+def test_running_variant_is_cancelled_and_left_to_finish():
+    release, finished = threading.Event(), threading.Event()
+
+    def slow():
+        release.wait(5)
+        finished.set()
+        return 10
+
+    executor = OCRExecutor(max_workers=2, early_exit_confidence=80)
+    attempts = executor.run([('slow', slow), ('fast', lambda: 95), ('later', lambda: 50)], fake_ocr)
+    assert statuses(attempts) == [CANCELLED, COMPLETED, SKIPPED]
+    # The running pass is not interrupted; it finishes on its thread and is ignored
+    release.set()
+    assert finished.wait(5)
+    executor.shutdown()
+
+
+def test_variant_waiting_for_a_pool_thread_is_skipped():
+    executor = OCRExecutor(max_workers=3, early_exit_confidence=80)
+    executor._pool = ManualPool(finish={'v0'}, started={'v1'})
+    attempts = executor.run(variants(95, 10, 20, 30), fake_ocr)
+    # v1 is running and cannot be stopped; v2 was queued in the shared pool; v3 never submitted
+    assert statuses(attempts) == [COMPLETED, CANCELLED, SKIPPED, SKIPPED]
+
+
+def test_run_bounds_its_variants_in_flight():
+    lock, active, peak = threading.Lock(), [0], [0]
+
+    def tracked_ocr(image):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        threading.Event().wait(0.01)
+        with lock:
+            active[0] -= 1
+        return fake_ocr(image)
+
+    executor = OCRExecutor(max_workers=2)
+    assert statuses(executor.run(variants(1, 2, 3, 4, 5), tracked_ocr)) == [COMPLETED] * 5
+    assert peak[0] <= 2
+    executor.shutdown()
+
+
+def test_variant_errors_propagate():
+    def broken():
+        raise RuntimeError("tesseract failed")
+
+    with pytest.raises(RuntimeError, match="tesseract failed"):
+        OCRExecutor(max_workers=1).run([('broken', broken)], fake_ocr)
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from bench_ocr_preprocess import as_gray, current_variants, legacy_variants, synthetic_card
+from corpus import make_image
+from enhanced_analysis import EnhancedAnalyzer
+
+
+@pytest.fixture(scope='module')
+def analyzer():
+    return EnhancedAnalyzer()
+
+
+@pytest.fixture(params=['bench_card', 'id_card', 'id_card_large'])
+def card(request):
+    if request.param == 'bench_card':
+        return synthetic_card(640, 400)
+    if request.param == 'id_card':
+        return make_image('id_card', 640, 400, 0)
+    return make_image('id_card', 1012, 638, 3)
+
+
+def test_variants_match_the_pil_path(analyzer, card):
+    black, enhanced, denoised, sharpened = (as_gray(variant) for variant in legacy_variants(card))
+    variants = current_variants(analyzer, card)
+    assert all(variant.dtype == np.uint8 and variant.shape == card.shape[:2] for variant in variants)
+
+    np.testing.assert_array_equal(variants[0], black)
+    np.testing.assert_array_equal(variants[1], enhanced)
+    np.testing.assert_array_equal(variants[3], sharpened)
+    # The bilateral filter now runs on one channel instead of three identical ones
+    delta = np.abs(variants[2].astype(np.int16) - denoised.astype(np.int16))
+    assert delta.max() <= 16
+    assert np.mean(delta > 8) < 0.002
+
+
+def test_black_text_is_extracted_once(analyzer, monkeypatch, card):
+    calls = []
+    extract = analyzer._extract_black_text
+    monkeypatch.setattr(analyzer, '_extract_black_text', lambda image: calls.append(1) or extract(image))
+    analyzer.analyze_ocr(card)
+    assert len(calls) == 1
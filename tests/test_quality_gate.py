@@ -0,0 +1,132 @@
+import cv2
+import numpy as np
+import pytest
+
+from corpus import make_image
+from enhanced_analysis import EnhancedAnalyzer
+import instrumentation
+from quality_gate import TOO_BLURRY, TOO_BRIGHT, TOO_DARK, TOO_SMALL, QualityGate
+from visualization import VisualizationOptions
+
+NO_VISUALIZATION = VisualizationOptions(mode='off')
+
+
+def flat(value, width=320, height=200):
+    return np.full((height, width, 3), value, np.uint8)
+
+
+def blurred_card():
+    # Gaussian sigma 3/1000 of the long edge: no text is legible
+    return cv2.GaussianBlur(make_image('id_card', 1012, 638, 0), (0, 0), 3.0)
+
+
+@pytest.mark.parametrize('image, reason', [
+    (make_image('id_card', 24, 200, 0), TOO_SMALL),
+    (flat(5), TOO_DARK),
+    (flat(250), TOO_BRIGHT),
+    (flat(128), TOO_BLURRY),
+    (blurred_card(), TOO_BLURRY),
+])
+def test_rejections(image, reason):
+    verdict = QualityGate().check(image)
+    assert not verdict['passed']
+    assert verdict['reason'] == reason
+    assert verdict['details'].startswith(reason.replace('_', ' '))
+
+
+def test_sharp_card_passes():
+    verdict = QualityGate().check(make_image('id_card', 1012, 638, 0))
+    assert verdict['passed'] and verdict['reason'] is None
+    assert verdict['checks']['width'] == 1012 and verdict['checks']['height'] == 638
+    assert verdict['checks']['sharpness'] >= QualityGate().min_sharpness
+
+
+def test_first_failing_check_is_the_reason():
+    # Tiny and dark: the size check comes first
+    assert QualityGate().check(flat(0, 16, 16))['reason'] == TOO_SMALL
+
+
+def test_thresholds_are_configurable():
+    card = make_image('id_card', 1012, 638, 0)
+    assert QualityGate(min_sharpness=1e6).check(card)['reason'] == TOO_BLURRY
+    assert QualityGate(min_side=2000).check(card)['reason'] == TOO_SMALL
+    with pytest.raises(ValueError):
+        QualityGate(min_brightness=200, max_brightness=100)
+
+
+def test_stats_count_checks_and_rejections():
+    gate = QualityGate()
+    gate.check(flat(5))
+    gate.check(flat(128))
+    gate.check(make_image('id_card', 640, 400, 0))
+    stats = gate.stats()
+    assert stats['checked'] == 3 and stats['passed'] == 1
+    assert stats['rejected'] == {TOO_SMALL: 0, TOO_DARK: 1, TOO_BRIGHT: 0, TOO_BLURRY: 1}
+
+
+def saved_seconds_metric(analysis):
+    sample = f'image_analysis_quality_gate_saved_seconds_total{{analysis="{analysis}"}} '
+    lines = [line for line in instrumentation.REGISTRY.render().splitlines() if line.startswith(sample)]
+    return float(lines[0][len(sample):]) if lines else 0.0
+
+
+def test_saved_time_is_credited_at_each_skip():
+    gate = QualityGate()
+    metric_before = saved_seconds_metric('face')
+    gate.record_skip('face')  # no runs yet: nothing to credit
+    gate.record_run('face', 100)
+    gate.record_skip('face')
+    gate.record_run('face', 300)  # the mean is now 200 ms, earlier skips keep their credit
+    gate.record_skip('face')
+    face = gate.stats()['analyses']['face']
+    assert face['skipped'] == 3 and face['mean_ms'] == 200
+    assert face['saved_ms'] == 300
+    assert gate.stats()['saved_ms'] == 300
+    # The exported metric is the same estimate
+    assert saved_seconds_metric('face') - metric_before == pytest.approx(0.3)
+
+
+def test_rejected_analyses_return_empty_results():
+    analyzer = EnhancedAnalyzer(quality_gate={})
+    image = blurred_card()
+
+    face = analyzer.analyze_human_detection(image, output=NO_VISUALIZATION)
+    assert face['rejected']['reason'] == TOO_BLURRY
+    assert face['face_count'] == 0 and face['faces'] == [] and face['visualization'] is None
+    assert face['details'].startswith("Skipped by the quality gate: image is too blurry")
+
+    ocr = analyzer.analyze_ocr(image, output=NO_VISUALIZATION)
+    assert ocr['rejected']['reason'] == TOO_BLURRY
+    assert ocr['text_found'] is False and ocr['all_attempts'] == [] and ocr['visualization'] is None
+
+    stats = analyzer.quality_gate.stats()
+    assert stats['analyses']['face']['skipped'] == 1
+    assert stats['analyses']['ocr']['skipped'] == 1
+
+
+def test_passed_image_runs_and_is_timed():
+    analyzer = EnhancedAnalyzer(quality_gate={})
+    result = analyzer.analyze_human_detection(make_image('faces', 640, 480, 0), output=NO_VISUALIZATION)
+    assert 'rejected' not in result
+    face = analyzer.quality_gate.stats()['analyses']['face']
+    assert face['skipped'] == 0 and face['runs'] == 1
+
+
+def test_analyze_checks_once_and_never_gates_blur():
+    analyzer = EnhancedAnalyzer(quality_gate={})
+    response = analyzer.analyze(blurred_card(), analyses=('blur', 'face', 'ocr'), output=NO_VISUALIZATION)
+    results = response['results']
+    assert 'rejected' not in results['blur'] and results['blur']['score'] >= 0
+    assert results['face']['rejected']['reason'] == TOO_BLURRY
+    assert results['ocr']['rejected']['reason'] == TOO_BLURRY
+    assert analyzer.quality_gate.stats()['checked'] == 1
+
+
+def test_without_a_gate_nothing_is_rejected():
+    result = EnhancedAnalyzer().analyze_human_detection(flat(128), output=NO_VISUALIZATION)
+    assert 'rejected' not in result
+
+
+def test_gate_is_off_in_the_app_by_default(app_module, client):
+    assert app_module.app.config['QUALITY_GATE_ENABLED'] is False
+    assert client.get('/quality_gate/stats').get_json() == {'enabled': False}
@@ -0,0 +1,144 @@
+import json
+import os
+import shutil
+
+import cv2
+import pytest
+
+from corpus import make_image
+from quality_index import QualityIndex, parse_filter
+
+OUTCOMES = ('unchanged', 'touched', 'reused', 'analyzed', 'errors', 'missing', 'removed')
+
+
+def write_image(path, seed=0, sigma=0):
+    image = make_image('sharp', 160, 120, seed)
+    if sigma:
+        image = cv2.GaussianBlur(image, (0, 0), sigma)
+    cv2.imwrite(str(path), image)
+    return str(path)
+
+
+def scan(index, root, **kwargs):
+    kwargs.setdefault('analyses', ('blur',))
+    counts = index.scan([str(root)], workers=1, **kwargs)
+    return {outcome: counts[outcome] for outcome in OUTCOMES if counts[outcome]}
+
+
+@pytest.fixture
+def archive(tmp_path):
+    root = tmp_path / 'archive'
+    root.mkdir()
+    write_image(root / 'a.png', seed=0)
+    write_image(root / 'b.png', seed=1, sigma=4)
+    return root
+
+
+@pytest.fixture
+def index(tmp_path):
+    with QualityIndex(str(tmp_path / 'index.db')) as index:
+        yield index
+
+
+def test_first_scan_analyses_then_rescan_reads_nothing(index, archive):
+    assert scan(index, archive) == {'analyzed': 2}
+    row = index.get(str(archive / 'a.png'))
+    assert row['status'] == 'ok' and row['analyses'] == 'blur'
+    assert row['blur_score'] == json.loads(row['results'])['blur']['score']
+
+    assert scan(index, archive) == {'unchanged': 2}
+
+
+def test_new_mtime_with_same_content_is_touched(index, archive):
+    scan(index, archive)
+    path = str(archive / 'a.png')
+    indexed_at = index.get(path)['indexed_at']
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    assert scan(index, archive) == {'unchanged': 1, 'touched': 1}
+    row = index.get(path)
+    assert row['mtime_ns'] == stat.st_mtime_ns + 10**9
+    assert row['indexed_at'] == indexed_at
+
+
+def test_copy_reuses_the_indexed_results(index, archive):
+    scan(index, archive)
+    shutil.copy(archive / 'a.png', archive / 'copy.png')
+
+    assert scan(index, archive) == {'unchanged': 2, 'reused': 1}
+    original, copy = index.get(str(archive / 'a.png')), index.get(str(archive / 'copy.png'))
+    assert copy['results'] == original['results']
+    assert copy['content_hash'] == original['content_hash']
+
+
+def test_changed_content_is_analysed_again(index, archive):
+    scan(index, archive)
+    path = archive / 'a.png'
+    before = index.get(str(path))
+    write_image(path, sigma=4)
+
+    assert scan(index, archive) == {'unchanged': 1, 'analyzed': 1}
+    after = index.get(str(path))
+    assert after['content_hash'] != before['content_hash']
+    assert after['blur_score'] != before['blur_score']
+
+
+def test_only_missing_analyses_run(index, archive):
+    scan(index, archive)
+    blur_results = json.loads(index.get(str(archive / 'a.png'))['results'])['blur']
+
+    assert scan(index, archive, analyses=('blur', 'face')) == {'analyzed': 2}
+    row = index.get(str(archive / 'a.png'))
+    assert row['analyses'] == 'blur,face'
+    results = json.loads(row['results'])
+    # blur is kept from the first scan, not recomputed
+    assert results['blur'] == blur_results
+    assert {'blur', 'face'} <= set(json.loads(row['timings']))
+    assert row['face_count'] is not None
+
+    assert scan(index, archive, analyses=('blur', 'face')) == {'unchanged': 2}
+    # A subset of what is indexed needs nothing
+    assert scan(index, archive, analyses=('face',)) == {'unchanged': 2}
+
+
+def test_changed_options_reanalyse(index, archive):
+    scan(index, archive)
+    assert scan(index, archive, blur_resolution='auto') == {'analyzed': 2}
+    assert json.loads(index.get(str(archive / 'a.png'))['options'])['blur_resolution'] == 'auto'
+
+
+def test_failed_files_are_retried_only_on_request(index, archive):
+    (archive / 'broken.png').write_bytes(b'not an image')
+    assert scan(index, archive) == {'analyzed': 3, 'errors': 1}
+    assert index.get(str(archive / 'broken.png'))['error'] == 'Could not load image'
+
+    assert scan(index, archive) == {'unchanged': 3}
+    assert scan(index, archive, retry_errors=True) == {'unchanged': 2, 'analyzed': 1, 'errors': 1}
+
+
+def test_prune_drops_deleted_files(index, archive):
+    scan(index, archive)
+    os.remove(archive / 'b.png')
+
+    assert scan(index, archive) == {'unchanged': 1}
+    assert index.get(str(archive / 'b.png')) is not None
+    assert scan(index, archive, prune=True) == {'unchanged': 1, 'removed': 1}
+    assert index.get(str(archive / 'b.png')) is None
+
+
+def test_query_reads_the_indexed_columns(index, archive):
+    scan(index, archive)
+    sharp, blurred = index.get(str(archive / 'a.png')), index.get(str(archive / 'b.png'))
+    threshold = (sharp['blur_laplacian'] + blurred['blur_laplacian']) / 2
+
+    rows = index.query([parse_filter(f'blur_laplacian<{threshold}')], columns=['path'])
+    assert rows == [{'path': str(archive / 'b.png')}]
+    rows = index.query(order_by='blur_laplacian', descending=True, limit=1, columns=['path'])
+    assert rows == [{'path': str(archive / 'a.png')}]
+    assert index.stats()['by_analysis']['blur'] == 2
+
+    with pytest.raises(ValueError):
+        index.query([('no_such_column', '=', 1)])
+    with pytest.raises(ValueError):
+        parse_filter('blur_laplacian<sharp')
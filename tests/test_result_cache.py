@@ -0,0 +1,126 @@
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from corpus import make_image
+from enhanced_analysis import EnhancedAnalyzer
+from result_cache import ResultCache, image_digest, json_default, make_key
+
+
+@pytest.fixture(scope='module')
+def analyzer():
+    return EnhancedAnalyzer(ocr_workers=1)
+
+
+@pytest.fixture
+def image():
+    return make_image('sharp', 320, 240, 1)
+
+
+def test_key_depends_on_pixels_and_params(image):
+    digest = image_digest(image)
+    assert image_digest(image.copy()) == digest
+    changed = image.copy()
+    changed[0, 0] ^= 1
+    assert image_digest(changed) != digest
+    assert image_digest(np.ascontiguousarray(image[:, ::-1])) != digest
+    assert make_key(digest, 'blur', {'a': 1, 'b': 2}) == make_key(digest, 'blur', {'b': 2, 'a': 1})
+    assert make_key(digest, 'blur', {'a': 1}) != make_key(digest, 'blur', {'a': 2})
+    assert make_key(digest, 'blur') != make_key(digest, 'face')
+
+
+def test_get_or_compute_miss_then_hit():
+    cache = ResultCache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {"score": np.float64(1.5)}
+
+    assert cache.get_or_compute('k', compute) == ({"score": 1.5}, False)
+    assert cache.get_or_compute('k', compute) == ({"score": 1.5}, True)
+    assert len(calls) == 1
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['stores']) == (1, 1, 1)
+
+
+def test_errors_are_not_cached():
+    cache = ResultCache()
+    assert cache.get_or_compute('k', lambda: {"error": "boom"}) == ({"error": "boom"}, False)
+    assert cache.get('k') is None
+    assert cache.stats()['stores'] == 0
+
+
+def test_lru_eviction_and_ttl(monkeypatch):
+    cache = ResultCache(max_entries=2, ttl_seconds=10)
+    for key in 'abc':
+        cache.put(key, {"key": key})
+    assert cache.get('a') is None
+    assert cache.get('c') == {"key": "c"}
+    assert cache.stats()['evictions'] == 1
+
+    now = time.time()
+    monkeypatch.setattr('result_cache.time.time', lambda: now + 11)
+    assert cache.get('c') is None
+    assert cache.stats()['expirations'] == 1
+
+
+def test_disk_tier_is_shared(tmp_path):
+    ResultCache(disk_dir=str(tmp_path)).put('k', {"value": 1})
+    other = ResultCache(disk_dir=str(tmp_path))
+    assert other.get('k') == {"value": 1}
+    assert other.stats()['disk_hits'] == 1
+    # Promoted to memory on the first hit
+    assert other.get('k') == {"value": 1}
+    assert other.stats()['memory_hits'] == 1
+
+
+def test_analyze_reports_hit_and_miss(analyzer, image):
+    cache = ResultCache()
+    first = analyzer.analyze(image, analyses=['blur', 'face'], cache=cache)
+    assert first["cache"] == {'blur': 'miss', 'face': 'miss'}
+
+    second = analyzer.analyze(image.copy(), analyses=['blur', 'face'], cache=cache)
+    assert second["cache"] == {'blur': 'hit', 'face': 'hit'}
+    assert second["results"]["blur"] == first["results"]["blur"]
+
+    # Other parameters are another entry
+    third = analyzer.analyze(image, analyses=['blur'], blur_methods=['laplacian'], cache=cache)
+    assert third["cache"] == {'blur': 'miss'}
+
+
+def test_json_default_converts_numpy_scalars():
+    payload = json.dumps({'score': np.float32(0.5), 'count': np.int64(3), 'path': Path('a.png')}, default=json_default)
+    assert json.loads(payload) == {'score': 0.5, 'count': 3, 'path': 'a.png'}
+
+
+def test_cached_results_drop_the_first_run_timings():
+    cache = ResultCache()
+    result = {'score': 91.5, 'variant_latency_ms': {'black_text': 120.4},
+              'all_attempts': [{'variant': 'black_text', 'status': 'completed', 'latency_ms': 120.4}],
+              'rejected': None}
+    computed, hit = cache.get_or_compute('key', lambda: result)
+    assert not hit and computed is result
+
+    cached, hit = cache.get_or_compute('key', lambda: pytest.fail('recomputed'))
+    assert hit
+    assert cached == {'score': 91.5, 'variant_latency_ms': {},
+                      'all_attempts': [{'variant': 'black_text', 'status': 'completed', 'latency_ms': None}],
+                      'rejected': None}
+    assert result['variant_latency_ms'] == {'black_text': 120.4}
+
+
+def test_analyze_ocr_hit_reports_no_variant_latencies(analyzer, image, monkeypatch):
+    found = {"confidence": 90.0, "text_found": True, "text_count": 1, "text": "NAME", "boxes": [(4, 4, 40, 12, 90, "NAME")]}
+    monkeypatch.setattr(analyzer, '_run_ocr_with_config', lambda *args: dict(found))
+    cache = ResultCache()
+    first = analyzer.analyze(image, analyses=['ocr'], cache=cache)['results']['ocr']
+    assert set(first['variant_latency_ms']) == {'black_text', 'enhanced', 'denoised', 'sharpened'}
+
+    second = analyzer.analyze(image, analyses=['ocr'], cache=cache)['results']['ocr']
+    assert second['variant_latency_ms'] == {}
+    assert all(attempt['latency_ms'] is None for attempt in second['all_attempts'])
+    assert second['detected_text'] == first['detected_text'] == 'NAME'
@@ -0,0 +1,89 @@
+import io
+
+import cv2
+import numpy as np
+import pytest
+
+from corpus import face_scene
+from visualization import OFF, URL, VisualizationOptions
+
+# Response fields holding visualizations; everything else must not depend on the mode
+VISUALIZATION_FIELDS = ('visualization', 'blur_map')
+
+
+@pytest.fixture(scope='module')
+def scene():
+    return face_scene(400, 300, seed=2)[0]
+
+
+def analyze(client, image, mode, **fields):
+    _, buffer = cv2.imencode('.png', image)
+    data = dict(fields, file=(io.BytesIO(buffer.tobytes()), 'scene.png'), analyses='blur,face', visualize=mode)
+    response = client.post('/analyze', data=data)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def analysis_fields(body):
+    return {name: {key: value for key, value in result.items() if key not in VISUALIZATION_FIELDS}
+            for name, result in body['results'].items()}
+
+
+def assert_same(actual, expected):
+    """Equal, with floats compared up to summation order (concurrent stages may reorder OpenCV's sums)"""
+    if isinstance(expected, dict):
+        assert actual.keys() == expected.keys()
+        for key in expected:
+            assert_same(actual[key], expected[key])
+    elif isinstance(expected, list):
+        assert len(actual) == len(expected)
+        for item, expected_item in zip(actual, expected):
+            assert_same(item, expected_item)
+    elif isinstance(expected, float):
+        assert actual == pytest.approx(expected, rel=1e-9)
+    else:
+        assert actual == expected
+
+
+def test_analysis_fields_do_not_depend_on_the_mode(client, scene):
+    inline = analyze(client, scene, 'inline')
+    off = analyze(client, scene, 'off')
+    url = analyze(client, scene, 'url')
+
+    assert inline['original_image'].startswith('data:image/jpeg;base64,')
+    assert off['original_image'] is None
+    assert url['original_image'].startswith('/visualizations/')
+    for body in (off, url):
+        assert_same(analysis_fields(body), analysis_fields(inline))
+    assert off['results']['face']['visualization'] is None and off['results']['blur']['blur_map'] is None
+
+
+def test_url_mode_serves_the_stored_images(client, scene):
+    body = analyze(client, scene, 'url', image_format='png')
+    urls = [body['original_image'], body['results']['blur']['blur_map'], body['results']['face']['visualization']]
+    for url in urls:
+        response = client.get(url)
+        assert response.status_code == 200
+        assert response.mimetype == 'image/png'
+        image = cv2.imdecode(np.frombuffer(response.data, np.uint8), cv2.IMREAD_COLOR)
+        assert image.shape == scene.shape
+
+    # The original is stored losslessly here, so it comes back as uploaded
+    original = cv2.imdecode(np.frombuffer(client.get(urls[0]).data, np.uint8), cv2.IMREAD_COLOR)
+    np.testing.assert_array_equal(original, scene)
+    assert client.get('/visualizations/missing.png').status_code == 404
+
+
+def test_url_mode_downscales_before_storing(client, scene):
+    body = analyze(client, scene, 'url', max_edge='200')
+    image = cv2.imdecode(np.frombuffer(client.get(body['original_image']).data, np.uint8), cv2.IMREAD_COLOR)
+    assert image.shape[:2] == (150, 200)
+
+
+def test_options(tmp_path):
+    assert VisualizationOptions(mode=OFF).encode(np.zeros((4, 4, 3), np.uint8)) is None
+    assert not VisualizationOptions(mode=URL, store_dir=str(tmp_path)).cacheable
+    for kwargs in ({'mode': 'thumbnail'}, {'image_format': 'gif'}, {'mode': URL}, {'max_edge': 0},
+                   {'quality': 101}):
+        with pytest.raises(ValueError):
+            VisualizationOptions(**kwargs)
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Output options for visualization images (original image, face / OCR overlays, blur map).
+
+VisualizationOptions decides per request what happens to each visualization:
+
+    inline  base64 data URI in the JSON response (the default)
+    off     not produced at all; the field is None and the work is skipped
+    url     encoded once, stored under `store_dir` and returned as a URL
+            served by the app's /visualizations/<name> route
+
+Images can be downscaled to a maximum edge before encoding, and the format
+(JPEG / WebP / PNG) and quality are configurable. The defaults (inline JPEG
+at OpenCV's default quality, full size) produce the same payloads as before.
+"""
+import base64
+import os
+import threading
+import time
+import uuid
+
+import cv2
+
+from instrumentation import stage
+
+INLINE = 'inline'
+OFF = 'off'
+URL = 'url'
+MODES = (INLINE, OFF, URL)
+
+FORMATS = {
+    'jpeg': ('.jpg', 'image/jpeg', cv2.IMWRITE_JPEG_QUALITY),
+    'webp': ('.webp', 'image/webp', cv2.IMWRITE_WEBP_QUALITY),
+    'png': ('.png', 'image/png', None),
+}
+
+_prune_lock = threading.Lock()
+_last_prune = {}
+
+
+class VisualizationOptions:
+    """How visualizations are produced for one request"""
+
+    def __init__(self, mode=INLINE, max_edge=None, image_format='jpeg', quality=None,
+                 store_dir=None, url_prefix='/visualizations/', ttl_seconds=3600):
+        image_format = {'jpg': 'jpeg'}.get(image_format, image_format)
+        if mode not in MODES:
+            raise ValueError(f"Unknown visualization mode: {mode}")
+        if image_format not in FORMATS:
+            raise ValueError(f"Unknown visualization format: {image_format}")
+        if mode == URL and not store_dir:
+            raise ValueError("URL mode needs a store directory")
+        if max_edge is not None and max_edge <= 0:
+            raise ValueError("max_edge must be positive")
+        if quality is not None and not 0 <= quality <= 100:
+            raise ValueError("quality must be between 0 and 100")
+
+        self.mode = mode
+        self.max_edge = max_edge
+        self.image_format = image_format
+        self.quality = quality
+        self.store_dir = store_dir
+        self.url_prefix = url_prefix
+        self.ttl_seconds = ttl_seconds
+
+    @property
+    def enabled(self):
+        return self.mode != OFF
+
+    @property
+    def cacheable(self):
+        # Stored files expire on their own, so URL results are not cached
+        return self.mode != URL
+
+    def cache_params(self):
+        """The options that change the output, for result cache keys"""
+        return {'mode': self.mode, 'max_edge': self.max_edge, 'format': self.image_format,
+                'quality': self.quality}
+
+    def encode(self, image):
+        """Encode a BGR image according to the options; None when visualizations are off"""
+        if not self.enabled:
+            return None
+
+        with stage('encode'):
+            image = downscale(image, self.max_edge)
+            extension, mime_type, quality_flag = FORMATS[self.image_format]
+            params = [quality_flag, int(self.quality)] if quality_flag is not None and self.quality is not None else []
+            _, buffer = cv2.imencode(extension, image, params)
+
+            if self.mode == URL:
+                return self._store(buffer, extension)
+            return f"data:{mime_type};base64,{base64.b64encode(buffer).decode('utf-8')}"
+
+    def _store(self, buffer, extension):
+        os.makedirs(self.store_dir, exist_ok=True)
+        prune_expired(self.store_dir, self.ttl_seconds)
+        name = f"{uuid.uuid4().hex}{extension}"
+        with open(os.path.join(self.store_dir, name), 'wb') as handle:
+            handle.write(buffer.tobytes())
+        return f"{self.url_prefix}{name}"
+
+
+DEFAULT_OPTIONS = VisualizationOptions()
+
+
+def downscale(image, max_edge):
+    """Shrink so the longest edge is at most max_edge (never enlarges)"""
+    if not max_edge:
+        return image
+    height, width = image.shape[:2]
+    scale = max_edge / max(height, width)
+    if scale >= 1:
+        return image
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+
+def prune_expired(store_dir, ttl_seconds, interval=60):
+    """Delete stored visualizations older than ttl_seconds (at most once per interval)"""
+    if not ttl_seconds:
+        return
+    now = time.time()
+    with _prune_lock:
+        if now - _last_prune.get(store_dir, 0) < interval:
+            return
+        _last_prune[store_dir] = now
+
+    for entry in os.scandir(store_dir):
+        try:
+            if entry.is_file() and now - entry.stat().st_mtime > ttl_seconds:
+                os.remove(entry.path)
+        except OSError:
+            # Removed concurrently by another worker
+            continue